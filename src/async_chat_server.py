@@ -0,0 +1,1017 @@
+import os
+import time
+import zlib
+import base64
+import socket
+import asyncio
+import secrets
+from typing import Union
+from chat_interface import ChatInterface
+from framing import FrameReader, FrameWriter, ReplayBuffer, encode_header, \
+    read_frame_async
+from chat_rooms import ChatRoomManager
+from game_rooms import GameRoom, GameRoomManager
+from metrics import ConnectionMetrics
+from journal import JournalWriter
+from tic_tac_toe import TicTacToeCli, TicTacToeGame
+from timer_wheel import TimerWheel
+from worker_pool import WorkerPool, WorkerRelay
+
+
+class PeerSession:
+    """
+    Defines data members for one client connection held by the async server.
+    """
+    # CONSTANTS
+    TYPED_START = bytes([FrameReader.TYPED_VERSION])
+    EARLY_LIMIT = 1 << 16                       # Bytes held before pairing
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter,
+                 metrics: Union[ConnectionMetrics, None] = None,
+                 session_id: int = 0) -> None:
+        """
+        Initializes a session for a newly accepted connection.
+        :param reader: stream used to receive data from the client.
+        :param writer: stream used to send data to the client.
+        :param metrics: metrics to count the connection into, or None.
+        :param session_id: id of the session in its server.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.metrics = metrics
+        self.session_id = session_id
+        self.addr = writer.get_extra_info("peername")
+        self.partner = None                     # Paired PeerSession
+        self.game_host = None                   # RemotePeer hosting its game
+        self.early_frames = []                  # Sent before being paired
+        self.early_bytes = 0                    # Payload size of early_frames
+        self.last_seen = time.monotonic()       # Last frame received
+        self.timer = None                       # Next heartbeat check
+        self.token = None                       # Resume token, if resumable
+        self.replay = None                      # ReplayBuffer of frames sent
+        self.received = 0                       # Non-heartbeat frames received
+        self.expiry = None                      # End of a dropped session
+        writer.transport.set_write_buffer_limits(high=FrameWriter.HIGH_WATER)
+
+    def is_closed(self) -> bool:
+        """
+        Check if the underlying connection has been closed.
+        :return: True if closed, else False.
+        """
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def write_payload(self, payload: bytes, flags: bytes = b"") -> None:
+        """
+        Queue an already encoded payload to the client with its header.
+        :param payload: bytes to send.
+        :param flags: header flags the payload was received with, or the
+            whole binary header of a typed frame.
+        """
+        header = flags if flags[:1] == self.TYPED_START \
+            else encode_header(len(payload), flags)
+        self.replay is not None and self.replay.append(header + payload)
+        if self.writer.is_closing():
+            return
+        self.writer.writelines([header, payload])
+        if self.metrics is not None:
+            self.metrics.frames_out += 1
+            self.metrics.bytes_out += len(header) + len(payload)
+
+    def write_frame(self, frame: bytes, replay: bool = True) -> None:
+        """
+        Queue a frame that is already encoded with its header, without
+        copying it. The same frame may be queued on many sessions. Frames
+        are kept for replay even while the session has no connection.
+        :param frame: header and payload to send.
+        :param replay: set False for frames that only mean something on the
+            current connection, such as heartbeats.
+        """
+        replay and self.replay is not None and self.replay.append(frame)
+        if self.writer.is_closing():
+            return
+        self.writer.write(frame)
+        if self.metrics is not None:
+            self.metrics.frames_out += 1
+            self.metrics.bytes_out += len(frame)
+
+    async def send_frame(self, message: str) -> None:
+        """
+        Frame and send the given message to the client.
+        :param message: data to send.
+        """
+        self.write_frame(ChatInterface.encode_frame(message))
+        await self.drain()
+
+    async def drain(self) -> None:
+        """
+        Wait until the client's write buffer is below its high-water mark.
+        Returns at once if the connection is gone.
+        """
+        self.writer.is_closing() or await self.writer.drain()
+
+
+class RemotePeer:
+    """
+    Stands in for a session served by another worker of a WorkerPool, as the
+    partner of a session of this worker or a player of a game hosted here.
+    Frames queued on it are sent to its session through the pool.
+    """
+    # CONSTANTS
+    FRAME = b"F"                                # Frame for the client
+    COMMAND = b"C"                              # Command for the game host
+    SNAPSHOT = b"S"                             # Snapshot of the game wanted
+    PARTNERED = b"P"                            # Paired, the sender first
+    HOSTED, UNHOSTED = b"H", b"E"               # Game hosted by the sender
+    REPAIR, REPLAY = b"R", b"G"                 # Ask the pool again
+    CLOSED = b"X"                               # Session closed for good
+
+    def __init__(self, relay: WorkerRelay, worker: int, session_id: int,
+                 local_id: int) -> None:
+        """
+        :param relay: channel of this worker to the pool.
+        :param worker: index of the worker serving the session.
+        :param session_id: id of the session in that worker.
+        :param local_id: id of the session of this worker it is linked to.
+        """
+        self.relay = relay
+        self.address = worker, session_id
+        self.local_id = local_id
+
+    def send(self, kind: bytes, data: bytes = b"") -> None:
+        """
+        Send a message to the worker of the session.
+        :param kind: kind of the message.
+        :param data: rest of the message.
+        """
+        self.relay.send(*self.address, self.local_id, kind + data)
+
+    def write_payload(self, payload: bytes, flags: bytes = b"") -> None:
+        """
+        Queue an already encoded payload to the client with its header.
+        :param payload: bytes to send.
+        :param flags: header flags the payload was received with, or the
+            whole binary header of a typed frame.
+        """
+        header = flags if flags[:1] == PeerSession.TYPED_START \
+            else encode_header(len(payload), flags)
+        self.send(self.FRAME, header + payload)
+
+    def write_frame(self, frame: bytes, replay: bool = True) -> None:
+        """
+        Queue a frame that is already encoded with its header.
+        :param frame: header and payload to send.
+        :param replay: unused; the session's own worker keeps it for replay.
+        """
+        self.send(self.FRAME, frame)
+
+    async def send_frame(self, message: str) -> None:
+        """
+        Frame and send the given message to the client.
+        :param message: data to send.
+        """
+        self.write_frame(ChatInterface.encode_frame(message))
+        await self.drain()
+
+    async def drain(self) -> None:
+        """
+        Wait until the channel to the pool is below its high-water mark.
+        """
+        await self.relay.drain()
+
+
+class AsyncChatServer:
+    """
+    Serves many simultaneous chat clients on a single event loop. Clients are
+    paired in arrival order and each pair chats through the server. Any
+    client can also be matched for a game hosted by the server, or join a
+    named chat room, after which its chat goes to the room instead of its
+    partner.
+
+    As a worker of a WorkerPool, clients are paired and matched for games
+    by the pool, so a client's partner or opponent may be served by another
+    worker. A game is hosted by the worker of the player who waited longest,
+    and the other player's commands are sent there.
+
+    Heartbeat checks and move deadlines of every session and game are kept
+    on one TimerWheel. A session silent for a heartbeat interval is sent a
+    heartbeat, and one silent past the idle timeout is dropped.
+
+    With a resume window, each client is offered a resumable session. When
+    its connection fails, the session keeps its partner, rooms and game for
+    the window and records what it is sent, so the client can reconnect and
+    get only what it missed, plus a snapshot of its game.
+    """
+    # CONSTANTS
+    BACKLOG = 4096                              # Pending connections allowed
+    PING_FRAME = ChatInterface.encode_frame(ChatInterface.HEARTBEAT_PING)
+    PONG_FRAME = ChatInterface.encode_frame(ChatInterface.HEARTBEAT_PONG)
+    EXPIRED_FRAME = ChatInterface.encode_frame(ChatInterface.SESSION_EXPIRED)
+    OFFER_TIMEOUT = 1.0                         # Seconds to answer an offer
+    TOKEN_BYTES = 16
+
+    def __init__(self, host: str, port: int, metrics: bool = True,
+                 stats_path: str = None,
+                 stats_interval: float = ChatInterface.STATS_INTERVAL,
+                 journal: Union[JournalWriter, None] = None,
+                 room_policy: str = ChatRoomManager.DROP,
+                 heartbeat_interval: float = ChatInterface.HEARTBEAT_INTERVAL,
+                 idle_timeout: float = ChatInterface.IDLE_TIMEOUT,
+                 move_timeout: float = None,
+                 resume_window: float = None) -> None:
+        """
+        Create a new AsyncChatServer.
+        :param host: address to listen on.
+        :param port: port to listen on.
+        :param metrics: set False to skip counting traffic and timing
+            dispatch.
+        :param stats_path: file to dump metrics to as JSON every
+            stats_interval seconds, or None to never dump.
+        :param stats_interval: seconds between metrics dumps.
+        :param journal: journal to record hosted games in, or None.
+        :param room_policy: ChatRoomManager.DROP or DISCONNECT, applied to
+            chat room members too slow to keep up.
+        :param heartbeat_interval: seconds of silence from a client after
+            which it is sent a heartbeat. None or 0 to send none and never
+            drop idle clients.
+        :param idle_timeout: seconds of silence after which a client is
+            dropped. None or 0 to keep idle clients.
+        :param move_timeout: seconds a player of a hosted game has for each
+            move before the game ends as a quit by that player. None or 0 for
+            no limit.
+        :param resume_window: seconds a session whose connection failed is
+            kept for its client to resume. None or 0 to offer no resumable
+            sessions.
+        """
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self.closed_metrics = ConnectionMetrics()       # Of closed sessions
+        self.stats_path = stats_path if metrics else None
+        self.stats_interval = stats_interval
+        self.waiting: Union[PeerSession, None] = None   # Unpaired client
+        self.sessions = set()                           # All open sessions
+        self.session_ids = {}                           # Id: open session
+        self.next_session_id = 1
+        self.relay: Union[WorkerRelay, None] = None     # Channel to a pool
+        self.queued = set()                             # Queued in the pool
+        self.remotes = {}                               # Address: RemotePeer
+        self.rooms = GameRoomManager(journal)
+        self.chat_rooms = ChatRoomManager(room_policy)
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.move_timeout = move_timeout
+        self.timers = TimerWheel()
+        self.reaped = 0                                 # Idle clients dropped
+        self.timed_out = 0                              # Games out of time
+        self.resume_window = resume_window
+        self.resumable = {}                             # Token: session
+        self.resumed = 0                                # Sessions resumed
+        self.expired = 0                                # Sessions not resumed
+
+    async def pair(self, session: PeerSession) -> None:
+        """
+        Pair the session with the waiting client, or make it the waiting
+        client if there is none. As a worker, the pool does this instead.
+        :param session: newly connected session.
+        """
+        if self.relay is not None:
+            self.relay.request(WorkerRelay.PAIR, session.session_id)
+            return
+        if self.waiting is None or self.waiting.is_closed():
+            self.waiting = session
+            await session.send_frame(ChatInterface.ROLE_PENDING)
+            return
+
+        first, self.waiting = self.waiting, None
+        await self.start_chat(first, session)
+
+    async def start_chat(self, first: Union[PeerSession, None],
+                         second: Union[PeerSession, RemotePeer, None]) \
+            -> None:
+        """
+        Pair two clients, or ask again for the one still there if the other
+        is gone.
+        :param first: session that waited for a partner, or None if closed.
+        :param second: session paired with it, RemotePeer if another worker
+            serves it, or None if closed.
+        """
+        if self.waiting is first:
+            self.waiting = None
+        if first is None or first.is_closed():
+            if isinstance(second, RemotePeer):
+                second.send(RemotePeer.REPAIR)
+            elif second is not None:
+                await self.pair(second)
+            return
+        if second is None:
+            await self.pair(first)
+            return
+
+        # First arrival speaks first, as a client would with a plain server
+        first.partner = second
+        await first.send_frame(ChatInterface.ROLE_CHATTING)
+        if isinstance(second, RemotePeer):
+            second.send(RemotePeer.PARTNERED)
+        else:
+            second.partner = first
+            await second.send_frame(ChatInterface.ROLE_WAITING)
+        [second.write_payload(payload, flags)
+         for flags, payload in first.early_frames]
+        first.early_frames, first.early_bytes = [], 0
+
+    async def start_game(self, first: Union[PeerSession, None],
+                         second: Union[PeerSession, RemotePeer, None],
+                         board_params: tuple[int, int]) -> None:
+        """
+        Host a game between two players the pool matched, or queue again the
+        one still there if the other is gone.
+        :param first: session that was queued, or None if closed.
+        :param second: session matched with it, RemotePeer if another worker
+            serves it, or None if closed.
+        :param board_params: (size, win_length) of the board.
+        """
+        if first not in self.queued:
+            # Closed or taken out of the queue before the match
+            if isinstance(second, RemotePeer):
+                second.send(RemotePeer.REPLAY, bytes(board_params))
+            elif second is not None:
+                await self.handle_game_command(
+                    second, ChatInterface.GAME_PLAY,
+                    [str(param) for param in board_params])
+            return
+        if second is None:
+            self.relay.request(WorkerRelay.PLAY, first.session_id,
+                               board_params)
+            return
+
+        self.queued.discard(first)
+        self.queued.discard(second)
+        room = self.rooms.open_room(first, second, board_params)
+        if isinstance(second, RemotePeer):
+            self.remotes[second.address] = second
+            second.send(RemotePeer.HOSTED)
+        await self.begin_game(room)
+
+    def peer_at(self, worker: int, session_id: int, local_id: int) \
+            -> Union[PeerSession, RemotePeer, None]:
+        """
+        Find the session the pool sent the address of.
+        :param worker: index of the worker serving the session.
+        :param session_id: id of the session in that worker.
+        :param local_id: id of the session of this worker it is for.
+        :return: session of this worker, or None if it is closed, or a
+            RemotePeer for a session of another worker.
+        """
+        if worker == self.relay.worker:
+            return self.session_ids.get(session_id)
+        return RemotePeer(self.relay, worker, session_id, local_id)
+
+    async def handle_pool_message(self, kind: bytes, body: bytes) -> None:
+        """
+        Handle the answer of the pool to a request to pair a session or
+        match it for a game, or a message from another worker's session.
+        :param kind: kind of the message.
+        :param body: rest of the message.
+        """
+        if kind == WorkerRelay.SEND:
+            worker, to_id, from_id = WorkerRelay.ROUTE.unpack_from(body)
+            message = body[WorkerRelay.ROUTE.size:]
+            await self.handle_remote(
+                self.session_ids.get(to_id),
+                RemotePeer(self.relay, worker, from_id, to_id),
+                message[:1], message[1:])
+            return
+
+        session_id, = WorkerRelay.SESSION.unpack_from(body)
+        session = self.session_ids.get(session_id)
+        if kind == WorkerRelay.PENDING:
+            if session is None:
+                self.relay.request(WorkerRelay.UNPAIR, session_id)
+                return
+            self.waiting = session
+            await session.send_frame(ChatInterface.ROLE_PENDING)
+        elif kind == WorkerRelay.QUEUED:
+            if session is None:
+                self.relay.request(WorkerRelay.UNQUEUE, session_id)
+                return
+            self.queued.add(session)
+            await session.send_frame(ChatInterface.GAME_QUEUED)
+        elif kind in (WorkerRelay.PAIRED, WorkerRelay.MATCHED):
+            _, worker, peer_id = WorkerRelay.PARTNER.unpack_from(body)
+            peer = self.peer_at(worker, peer_id, session_id)
+            if kind == WorkerRelay.PAIRED:
+                await self.start_chat(session, peer)
+            else:
+                await self.start_game(
+                    session, peer, tuple(body[WorkerRelay.PARTNER.size:]))
+
+    async def handle_remote(self, session: Union[PeerSession, None],
+                            sender: RemotePeer, kind: bytes,
+                            data: bytes) -> None:
+        """
+        Handle a message from a session of another worker.
+        :param session: session of this worker it is for, or None if closed.
+        :param sender: RemotePeer for the session it is from.
+        :param kind: kind of the message.
+        :param data: rest of the message.
+        """
+        player = self.remotes.get(sender.address, sender)
+        if kind == RemotePeer.COMMAND:
+            command, *args = data.decode().split()
+            await self.handle_game_command(player, command, args)
+        elif kind == RemotePeer.SNAPSHOT:
+            self.send_snapshot(player)
+        elif kind == RemotePeer.CLOSED:
+            self.remotes.pop(sender.address, None)
+            room = self.rooms.quit(player)
+            room is not None and self.end_game(room)
+            if session is not None \
+                    and isinstance(session.partner, RemotePeer) \
+                    and session.partner.address == sender.address:
+                session.partner = None
+                self.close_partner(session)
+        elif session is None:
+            # Gone before the sender got word of it
+            kind in (RemotePeer.PARTNERED, RemotePeer.HOSTED) and \
+                sender.send(RemotePeer.CLOSED)
+        elif kind == RemotePeer.FRAME:
+            session.write_frame(data)
+        elif kind == RemotePeer.PARTNERED:
+            session.partner = sender
+            await session.send_frame(ChatInterface.ROLE_WAITING)
+        elif kind == RemotePeer.HOSTED:
+            session.game_host = sender
+        elif kind == RemotePeer.UNHOSTED:
+            session.game_host = None
+        elif kind == RemotePeer.REPAIR:
+            session.partner is None and await self.pair(session)
+        elif kind == RemotePeer.REPLAY:
+            await self.handle_game_command(session, ChatInterface.GAME_PLAY,
+                                           [str(param) for param in data])
+
+    async def broadcast(self, room: GameRoom, message: str) -> None:
+        """
+        Send a message to both players of a room.
+        :param room: room to send to.
+        :param message: data to send.
+        """
+        for player in room.players:
+            await player.send_frame(message)
+
+    def end_game(self, room: GameRoom) -> None:
+        """
+        Tell both players of a room that its game is over.
+        :param room: finished room.
+        """
+        room.turn_timer is not None and self.timers.cancel(room.turn_timer)
+        ended = ChatInterface.encode_frame(f"{ChatInterface.GAME_ENDED} "
+                                           f"{room.game.status}")
+        for player in room.players:
+            if isinstance(player, RemotePeer):
+                # Before the result, so the next /play is not turned down
+                self.remotes.pop(player.address, None)
+                player.send(RemotePeer.UNHOSTED)
+            player.write_frame(ended)
+
+    async def begin_game(self, room: GameRoom) -> None:
+        """
+        Tell both players of a new room their symbols and start the clock.
+        :param room: room just opened.
+        """
+        for player in room.players:
+            await player.send_frame(
+                f"{ChatInterface.GAME_MATCHED} {room.symbol_of(player)} "
+                f"{room.game.size} {room.game.win_length}")
+        self.start_turn(room)
+
+    def send_snapshot(self, player: Union[PeerSession, RemotePeer]) -> None:
+        """
+        Send a player a snapshot of its game, if it is in one hosted here.
+        :param player: session of the player.
+        """
+        room = self.rooms.room_of(player)
+        room is not None and player.write_frame(ChatInterface.encode_frame(
+            f"{ChatInterface.GAME_SNAPSHOT} {room.symbol_of(player)} "
+            f"{base64.b64encode(room.game.snapshot()).decode()}"))
+
+    async def handle_game_command(self,
+                                  session: Union[PeerSession, RemotePeer],
+                                  command: str, args: list[str]) -> None:
+        """
+        Handle a game command sent to the server by a client.
+        :param session: session that sent the command, or RemotePeer of a
+            player of a game hosted here served by another worker.
+        :param command: first word of the message.
+        :param args: remaining words of the message.
+        """
+        room = self.rooms.room_of(session)
+
+        if command == ChatInterface.GAME_PLAY:
+            board_params = TicTacToeCli.parse_board_args(args)
+            if room is not None or session.game_host is not None \
+                    or board_params is None:
+                await session.send_frame(f"{ChatInterface.GAME_REJECTED} "
+                                         f"{TicTacToeGame.V_GAME_OVER}")
+                return
+            if self.relay is not None:
+                self.relay.request(WorkerRelay.PLAY, session.session_id,
+                                   board_params)
+                return
+            room = self.rooms.find_match(session, board_params)
+            if room is None:
+                await session.send_frame(ChatInterface.GAME_QUEUED)
+                return
+            await self.begin_game(room)
+
+        elif command == ChatInterface.GAME_MOVE:
+            try:
+                row, col = map(int, args)
+            except ValueError:
+                row, col = -1, -1
+            validation = TicTacToeGame.V_GAME_OVER if room is None \
+                else self.rooms.make_move(session, row, col)
+            if validation != TicTacToeGame.V_PASSED:
+                await session.send_frame(
+                    f"{ChatInterface.GAME_REJECTED} {validation}")
+                return
+            await self.broadcast(room, f"{ChatInterface.GAME_MOVED} "
+                                       f"{room.symbol_of(session)} {row} {col}")
+            if room.game.status > TicTacToeGame.S_O_TURN:
+                self.end_game(room)
+            else:
+                self.start_turn(room)
+
+        elif command == "/q":
+            self.unqueue(session)
+            room = self.rooms.quit(session)
+            room is not None and self.end_game(room)
+
+    def unqueue(self, session: Union[PeerSession, RemotePeer]) -> None:
+        """
+        Take a session out of the pool's matchmaking queue if it is in it.
+        :param session: session leaving the queue.
+        """
+        if session in self.queued:
+            self.queued.discard(session)
+            self.relay.request(WorkerRelay.UNQUEUE, session.session_id)
+
+    def start_turn(self, room: GameRoom) -> None:
+        """
+        Give the player whose turn it is move_timeout seconds to move.
+        :param room: room whose game is in progress.
+        """
+        if not self.move_timeout:
+            return
+        room.turn_timer is not None and self.timers.cancel(room.turn_timer)
+        room.turn_timer = self.timers.schedule(
+            self.move_timeout, self.expire_turn, room,
+            room.players[room.game.status])
+
+    def expire_turn(self, room: GameRoom, player: PeerSession) -> None:
+        """
+        Timer callback: end a game as a quit by the player who ran out of
+        time to move.
+        :param room: room of the game.
+        :param player: session whose turn it was.
+        """
+        if self.rooms.room_of(player) is not room:
+            return
+        self.rooms.quit(player)
+        self.timed_out += 1
+        self.end_game(room)
+
+    def check_idle(self, session: PeerSession) -> None:
+        """
+        Timer callback: drop a session silent past the idle timeout, send a
+        heartbeat to one silent for a heartbeat interval, then check again
+        when the next of these is due.
+        :param session: session to check.
+        """
+        if session.is_closed():
+            return
+        silent = time.monotonic() - session.last_seen
+        if self.idle_timeout and silent >= self.idle_timeout:
+            self.reaped += 1
+            session.writer.transport.abort()    # Even with data unsent
+            session.token is not None and self.detach(session)
+            return
+        delay = self.heartbeat_interval - silent
+        if delay <= 0:
+            session.write_frame(self.PING_FRAME, False)
+            delay = self.heartbeat_interval
+        if self.idle_timeout:
+            delay = min(delay, self.idle_timeout - silent)
+        session.timer = self.timers.schedule(delay, self.check_idle, session)
+
+    def open_session(self, session: PeerSession) -> None:
+        """
+        Start serving a newly connected session.
+        :param session: session of the new connection.
+        """
+        self.sessions.add(session)
+        self.session_ids[session.session_id] = session
+        if self.heartbeat_interval:
+            session.timer = self.timers.schedule(self.heartbeat_interval,
+                                                 self.check_idle, session)
+
+    def close_session(self, session: PeerSession) -> None:
+        """
+        Stop serving a session for good: take it out of its rooms, end its
+        game as a quit and disconnect its partner.
+        :param session: session to close.
+        """
+        if session not in self.sessions:
+            return
+        self.sessions.discard(session)
+        self.session_ids.pop(session.session_id, None)
+        self.resumable.pop(session.token, None)
+        session.timer is not None and self.timers.cancel(session.timer)
+        session.expiry is not None and self.timers.cancel(session.expiry)
+        session.metrics is not None and \
+            self.closed_metrics.merge(session.metrics)
+        if self.waiting is session:
+            self.waiting = None
+            self.relay is not None and self.relay.request(
+                WorkerRelay.UNPAIR, session.session_id)
+        self.unqueue(session)
+        self.chat_rooms.leave(session)
+        room = self.rooms.quit(session)
+        room is not None and self.end_game(room)
+        session.game_host is not None and \
+            session.game_host.send(RemotePeer.CLOSED)
+        partner = session.partner
+        if isinstance(partner, RemotePeer):
+            partner.send(RemotePeer.CLOSED)
+        elif partner is not None:
+            self.close_partner(partner)
+
+    def close_partner(self, partner: PeerSession) -> None:
+        """
+        Disconnect the partner of a session closed for good.
+        :param partner: session left without a partner.
+        """
+        if partner.expiry is not None:
+            self.close_session(partner)         # No connection to close
+            return
+        partner.token is not None and \
+            partner.write_frame(self.EXPIRED_FRAME, False)
+        partner.writer.close()
+
+    def detach(self, session: PeerSession) -> None:
+        """
+        Keep a session whose connection failed for the resume window, still
+        paired, in its rooms and game, recording every frame it is sent.
+        :param session: resumable session that lost its connection.
+        """
+        session.timer is not None and self.timers.cancel(session.timer)
+        session.expiry = self.timers.schedule(self.resume_window,
+                                              self.expire_session, session)
+
+    def expire_session(self, session: PeerSession) -> None:
+        """
+        Timer callback: close a session its client did not resume in time.
+        :param session: detached session.
+        """
+        session.expiry = None
+        self.expired += 1
+        self.close_session(session)
+
+    async def offer_session(self, session: PeerSession) \
+            -> tuple[PeerSession, Union[asyncio.Task, None]]:
+        """
+        Offer a new client a resumable session and wait briefly for its
+        answer. A client answering with the token of a session still kept
+        takes that session over. A client that does not answer, as it does
+        not know about sessions, is served without one.
+        :param session: session of the new connection.
+        :return: session to serve the connection with, and the read of the
+            first frame if it is not an answer. The read is left running
+            rather than cancelled when the client is slow to send, so a
+            frame arriving across the timeout is not cut in two.
+        """
+        token = secrets.token_urlsafe(self.TOKEN_BYTES)
+        session.write_frame(ChatInterface.encode_frame(
+            f"{ChatInterface.SESSION_OFFER} {token} {self.resume_window:g}"))
+        read = asyncio.ensure_future(
+            read_frame_async(session.reader, session.metrics))
+        if not (await asyncio.wait([read], timeout=self.OFFER_TIMEOUT))[0]:
+            return session, read
+        frame = read.result()
+        if frame is None or frame[0]:
+            return session, read
+        command, *args = frame[1].split() or [b""]
+        if command == ChatInterface.SESSION_OFFER.encode() and not args:
+            session.token = token
+            session.replay = ReplayBuffer()
+            self.resumable[token] = session
+            return session, None
+        if command == ChatInterface.SESSION_RESUME.encode() and len(args) == 2:
+            return await self.resume_session(session, args[0].decode(),
+                                             int(args[1])), None
+        if command == ChatInterface.SESSION_DECLINE.encode():
+            return session, None
+        return session, read
+
+    async def resume_session(self, session: PeerSession, token: str,
+                             received: int) -> PeerSession:
+        """
+        Move a kept session onto the new connection of its client, then send
+        the client the frames it missed and a snapshot of its game.
+        :param session: session of the new connection, closed once its
+            connection is taken over.
+        :param token: resume token the client was given.
+        :param received: frames the client received before it lost its
+            connection.
+        :return: session resumed, or the new session, disconnected, if there
+            is none to resume.
+        """
+        kept = self.resumable.get(token)
+        if kept is None:
+            session.write_frame(self.EXPIRED_FRAME)
+            session.writer.close()
+            return session
+
+        # Take the new connection over, dropping the old one if still open
+        kept.writer.transport.abort()
+        kept.timer is not None and self.timers.cancel(kept.timer)
+        kept.expiry is not None and self.timers.cancel(kept.expiry)
+        kept.expiry = None
+        kept.reader, kept.writer = session.reader, session.writer
+        kept.last_seen = time.monotonic()
+        self.close_session(session)
+        self.open_session(kept)
+        self.resumed += 1
+
+        # Replay what is missing, or all that is left if some was dropped
+        frames = kept.replay.since(received)
+        if frames is None:
+            received = kept.replay.sequence - len(kept.replay)
+            frames = kept.replay.since(received)
+        kept.write_frame(ChatInterface.encode_frame(
+            f"{ChatInterface.SESSION_RESUMED} {kept.received} {received}"),
+            False)
+        [kept.write_frame(frame, False) for frame in frames]
+        self.send_snapshot(kept)
+        kept.game_host is not None and \
+            kept.game_host.send(RemotePeer.SNAPSHOT)
+        kept.partner is None and self.waiting is not kept and \
+            await self.pair(kept)
+        return kept
+
+    async def run_timers(self) -> None:
+        """
+        Advance the timer wheel every tick until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.timers.tick)
+            self.timers.advance()
+
+    async def handle_room_command(self, session: PeerSession, command: str,
+                                  args: list[str]) -> None:
+        """
+        Handle a chat room command sent to the server by a client.
+        :param session: session that sent the command.
+        :param command: first word of the message.
+        :param args: remaining words of the message.
+        """
+        if command == ChatInterface.ROOM_LEAVE:
+            self.chat_rooms.leave(session)
+        elif len(args) == 1:
+            self.chat_rooms.join(session, args[0])
+
+        # Reply with the room the session is now in
+        room = self.chat_rooms.room_of(session)
+        if room is None:
+            await session.send_frame(ChatInterface.ROOM_LEFT)
+            return
+        await session.send_frame(f"{ChatInterface.ROOM_JOINED} {room.name} "
+                                 f"{len(room.members)}")
+
+    @staticmethod
+    def chat_text(flags: bytes, payload: bytes) -> Union[bytes, None]:
+        """
+        Extract the text of a chat message that can go to a chat room.
+        :param flags: header flags of the frame.
+        :param payload: frame received.
+        :return: UTF-8 text, or None if the frame is a command, a file chunk
+            or a typed frame other than chat.
+        """
+        if flags[:1] == PeerSession.TYPED_START:
+            _, opcode, flag_bits, _, _ = \
+                FrameReader.TYPED_HEADER.unpack(flags)
+            if opcode != ChatInterface.OP_CHAT:
+                return None
+            return AsyncChatServer.inflate(payload) \
+                if flag_bits & FrameReader.TYPED_COMPRESSED else payload
+        if flags == FrameReader.COMPRESSED:
+            payload = AsyncChatServer.inflate(payload)
+        elif flags:
+            return None
+        return None if payload is None or payload[:1] == b"/" else payload
+
+    @staticmethod
+    def inflate(payload: bytes) -> Union[bytes, None]:
+        """
+        Decompress a chat message sent to a chat room.
+        :param payload: zlib data received.
+        :return: decompressed message, or None if the data is not valid zlib
+            or inflates past FrameReader.MAX_INFLATED bytes.
+        """
+        try:
+            text = zlib.decompressobj().decompress(
+                payload, FrameReader.MAX_INFLATED + 1)
+        except zlib.error:
+            return None
+        return None if len(text) > FrameReader.MAX_INFLATED else text
+
+    async def handle_frame(self, session: PeerSession, flags: bytes,
+                           payload: bytes) -> None:
+        """
+        Handle game and room commands meant for the server, send chat to the
+        session's chat room, and forward everything else to the session's
+        chat partner.
+        :param session: session that sent the frame.
+        :param flags: header flags of the frame.
+        :param payload: frame received.
+        """
+        if not flags and payload in ChatInterface.HEARTBEATS:
+            payload == ChatInterface.HEARTBEATS[0] and \
+                session.write_frame(self.PONG_FRAME, False)
+            return
+        session.received += 1
+        if not flags and payload[:1] == b"/":
+            command, *args = payload.decode().split()
+            if command in ChatInterface.GAME_RESULTS \
+                    or command in ChatInterface.ROOM_RESULTS \
+                    or command in ChatInterface.SESSION_RESULTS:
+                return                          # Only the server sends these
+            if command in (ChatInterface.ROOM_JOIN, ChatInterface.ROOM_LEAVE):
+                await self.handle_room_command(session, command, args)
+                return
+            if command in (ChatInterface.GAME_PLAY, ChatInterface.GAME_MOVE) \
+                    or command == "/q" and not args and \
+                    (self.rooms.room_of(session) or
+                     session in self.rooms.queue.queued or
+                     session in self.queued or session.game_host):
+                if session.game_host is not None \
+                        and command != ChatInterface.GAME_PLAY:
+                    # Hosted by another worker
+                    session.game_host.send(RemotePeer.COMMAND, payload)
+                    return
+                await self.handle_game_command(session, command, args)
+                return
+
+        # Chat goes to the session's room if it is in one
+        if self.chat_rooms.room_of(session) is not None:
+            text = self.chat_text(flags, payload)
+            if text is not None:
+                self.chat_rooms.publish(session, text)
+                return
+
+        if session.partner is None:
+            session.early_bytes += len(payload)
+            if session.early_bytes > session.EARLY_LIMIT:
+                session.writer.close()          # Unpaired and still sending
+                return
+            session.early_frames.append((flags, payload))
+            return
+        session.partner.write_payload(payload, flags)
+        await session.partner.drain()
+
+    def total_metrics(self) -> ConnectionMetrics:
+        """
+        :return: metrics of every session served so far, merged.
+        """
+        total = ConnectionMetrics()
+        total.started = self.closed_metrics.started
+        total.merge(self.closed_metrics)
+        [total.merge(session.metrics) for session in self.sessions
+         if session.metrics is not None]
+        return total
+
+    async def dump_stats(self) -> None:
+        """
+        Write merged metrics to the stats file every stats_interval seconds.
+        """
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.total_metrics().dump(self.stats_path,
+                                      {"sessions": len(self.sessions),
+                                       "rooms": len(self.rooms),
+                                       "chat_rooms": len(self.chat_rooms),
+                                       "dropped": self.chat_rooms.dropped,
+                                       "disconnected":
+                                           self.chat_rooms.disconnected,
+                                       "timers": len(self.timers),
+                                       "reaped": self.reaped,
+                                       "timed_out": self.timed_out,
+                                       "resumable": len(self.resumable),
+                                       "resumed": self.resumed,
+                                       "expired": self.expired})
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """
+        Drive a single client connection from accept to close.
+        :param reader: stream used to receive data from the client.
+        :param writer: stream used to send data to the client.
+        """
+        new_session = PeerSession(reader, writer, ConnectionMetrics()
+                                  if self.metrics else None,
+                                  self.next_session_id)
+        self.next_session_id += 1
+        session = new_session
+        self.open_session(session)
+        failed = False
+        first_read = None
+        try:
+            if self.resume_window:
+                session, first_read = await self.offer_session(session)
+            session is new_session and not session.is_closed() and \
+                await self.pair(session)
+            metrics = session.metrics
+            while True:
+                # The first frame may have been read by offer_session
+                frame = await (first_read or read_frame_async(reader, metrics))
+                first_read = None
+                if frame is None:
+                    break
+                session.last_seen = time.monotonic()
+                if metrics is None:
+                    await self.handle_frame(session, *frame)
+                else:
+                    started = time.perf_counter_ns()
+                    await self.handle_frame(session, *frame)
+                    metrics.dispatch.record(time.perf_counter_ns() - started)
+        except ConnectionError:
+            failed = True
+        except (ValueError, UnicodeDecodeError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            first_read is not None and first_read.cancel()
+            writer.close()
+            # Leave sessions resumed on another connection or already kept
+            if session.writer is writer and session.expiry is None:
+                if failed and session.token is not None:
+                    self.detach(session)
+                else:
+                    self.close_session(session)
+
+    async def serve(self, channel: socket.socket = None,
+                    worker: int = None) -> None:
+        """
+        Accept and serve clients until cancelled.
+        :param channel: this worker's channel to a WorkerPool, or None if
+            the server runs alone. Workers share the port.
+        :param worker: index of this worker in the pool.
+        """
+        if channel is not None:
+            self.relay = WorkerRelay(channel, worker)
+            await self.relay.connect()          # Before any client pairs
+        server = await asyncio.start_server(self.handle_client, self.host,
+                                            self.port, backlog=self.BACKLOG,
+                                            reuse_port=channel is not None)
+        print(f"Server listening on: {self.host} on port: {self.port}")
+        dumper = self.stats_path and asyncio.create_task(self.dump_stats())
+        ticker = asyncio.create_task(self.run_timers())
+        relay = channel is not None and asyncio.create_task(
+            self.relay.run(self.chat_rooms, self.handle_pool_message))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dumper and dumper.cancel()
+            relay and relay.cancel()
+            ticker.cancel()
+
+
+def main(host, port, metrics=True, stats_path=None,
+         stats_interval=ChatInterface.STATS_INTERVAL, journal_dir=None,
+         room_policy=ChatRoomManager.DROP, workers=1,
+         heartbeat_interval=ChatInterface.HEARTBEAT_INTERVAL,
+         idle_timeout=ChatInterface.IDLE_TIMEOUT, move_timeout=None,
+         resume_window=None):
+    def run_worker(worker: int = None, channel: socket.socket = None):
+        # Workers keep separate stats files and journals
+        suffix = "" if worker is None else f".{worker}"
+        journal = JournalWriter(journal_dir + suffix) if journal_dir else None
+        try:
+            server = AsyncChatServer(
+                host, port, metrics, stats_path and stats_path + suffix,
+                stats_interval, journal, room_policy, heartbeat_interval,
+                idle_timeout, move_timeout, resume_window)
+            asyncio.run(server.serve(channel, worker))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            journal is not None and journal.close()
+
+    if workers > 1 and not WorkerPool.is_supported():
+        print("Workers need fork and SO_REUSEPORT; running one process.")
+        workers = 1
+    if workers > 1:
+        print(f"Starting {workers} workers (pid {os.getpid()}).")
+        WorkerPool(workers, run_worker).run()
+    else:
+        run_worker()
@@ -0,0 +1,137 @@
+import time
+import numpy as np
+from tic_tac_toe import TicTacToeGame
+
+
+class BatchSimulator:
+    """
+    Plays many games of Tic Tac Toe at once. Boards are rows of an (N, cells)
+    int8 array, moves are applied with vectorized masks and wins are found
+    with one matrix product against the winning lines. Status and validation
+    values are the same codes TicTacToeGame uses.
+    """
+    # CONSTANTS
+    EMPTY, X_MARK, O_MARK = 0, 1, -1            # Board cell values
+
+    def __init__(self, n_games: int, size: int = 3, win_length: int = 3,
+                 seed: int = None):
+        """
+        Initializes a batch of empty games.
+        :param n_games: number of games in the batch.
+        :param size: number of rows and columns on each board.
+        :param win_length: marks in a row needed to win.
+        :param seed: seed for random moves, or None for a fresh one.
+        """
+        self.size = size
+        self.win_length = win_length
+        self.cells = size * size
+        self.boards = np.zeros((n_games, self.cells), dtype=np.int8)
+        self.status = np.full(n_games, TicTacToeGame.S_X_TURN, dtype=np.int8)
+        self.rng = np.random.default_rng(seed)
+
+        # Column j of lines marks the cells of winning line j
+        windows = TicTacToeGame.get_win_masks(size, win_length)
+        self.lines = np.array([[mask >> cell & 1 for mask in windows]
+                               for cell in range(self.cells)], dtype=np.int8)
+
+    def active(self) -> np.ndarray:
+        """
+        :return: boolean mask of games still in progress.
+        """
+        return self.status <= TicTacToeGame.S_O_TURN
+
+    def make_moves(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Mark one cell per game for the player to move, where allowed.
+        :param cells: cell index (row * size + col) for each game.
+        :return: validation code for each game's move.
+        """
+        cells = np.asarray(cells)
+        games = np.arange(len(self.boards))
+        validation = np.full(len(games), TicTacToeGame.V_PASSED, dtype=np.int8)
+
+        # Later checks take precedence, as in TicTacToeGame.is_move_valid
+        in_range = (cells >= 0) & (cells < self.cells)
+        occupied = self.boards[games, np.where(in_range, cells, 0)] \
+            != self.EMPTY
+        validation[occupied] = TicTacToeGame.V_SPACE_OCC
+        validation[~in_range] = TicTacToeGame.V_OUT_RANGE
+        validation[~self.active()] = TicTacToeGame.V_GAME_OVER
+
+        moved = np.flatnonzero(validation == TicTacToeGame.V_PASSED)
+        marks = np.where(self.status[moved] == TicTacToeGame.S_X_TURN,
+                         self.X_MARK, self.O_MARK).astype(np.int8)
+        self.boards[moved, cells[moved]] = marks
+        self.update_status(moved, marks)
+        return validation
+
+    def update_status(self, moved: np.ndarray, marks: np.ndarray) -> None:
+        """
+        Update status of games that just moved for a win, draw or next turn.
+        :param moved: indices of games that moved.
+        :param marks: mark placed in each of those games.
+        """
+        boards = self.boards[moved]
+        turn = self.status[moved]
+
+        # Count the mover's marks on every line in one matrix product
+        own = (boards == marks[:, None]).astype(np.int8)
+        won = (own @ self.lines == self.win_length).any(axis=1)
+        full = (boards != self.EMPTY).all(axis=1)
+
+        # X_WON and O_WON sit two codes after X_TURN and O_TURN
+        self.status[moved] = np.where(
+            won, turn + TicTacToeGame.S_X_WON,
+            np.where(full, TicTacToeGame.S_DRAW, 1 - turn))
+
+    def random_moves(self) -> np.ndarray:
+        """
+        Pick a uniformly random empty cell in every game.
+        :return: cell index for each game.
+        """
+        scores = self.rng.random(self.boards.shape, dtype=np.float32)
+        scores[self.boards != self.EMPTY] = -1.0
+        return scores.argmax(axis=1)
+
+    def play_random(self) -> np.ndarray:
+        """
+        Play random moves until every game is over.
+        :return: final status code of each game.
+        """
+        while self.active().any():
+            self.make_moves(self.random_moves())
+        return self.status
+
+    def summary(self) -> dict[str, int]:
+        """
+        :return: number of games in each status, keyed by status name.
+        """
+        counts = np.bincount(self.status,
+                             minlength=len(TicTacToeGame.STATUS_CODES))
+        return {name: int(count) for name, count in
+                zip(TicTacToeGame.STATUS_CODES, counts)}
+
+    def to_game(self, index: int) -> TicTacToeGame:
+        """
+        Copy one game of the batch into a TicTacToeGame.
+        :param index: game to copy.
+        :return: equivalent TicTacToeGame.
+        """
+        game = TicTacToeGame(self.size, self.win_length)
+        board = self.boards[index]
+        game.marks = [sum(1 << int(cell)
+                          for cell in np.flatnonzero(board == mark))
+                      for mark in (self.X_MARK, self.O_MARK)]
+        game.status = int(self.status[index])
+        return game
+
+
+if __name__ == '__main__':
+    n_games = 1_000_000
+    simulator = BatchSimulator(n_games)
+    start = time.perf_counter()
+    simulator.play_random()
+    elapsed = time.perf_counter() - start
+    print(f"{n_games} random games in {elapsed:.2f}s "
+          f"({n_games / elapsed:,.0f} games/s)")
+    print(simulator.summary())
@@ -0,0 +1,106 @@
+import sys
+import shutil
+
+
+class BoardRenderer:
+    """
+    Draws a game board pinned to the top of an ANSI terminal, with chat
+    scrolling in the rows below it. After the first draw only the squares
+    that changed are rewritten, each draw being one buffered write. Falls
+    back to printing the whole board when the stream is not a terminal.
+    """
+
+    # CONSTANTS
+    CSI = "\x1b["                               # Control sequence introducer
+    SAVE_CURSOR, RESTORE_CURSOR = "\x1b7", "\x1b8"
+    TAB_WIDTH = 8                               # Columns per tab stop
+
+    def __init__(self, stream=None):
+        """
+        Create a new BoardRenderer.
+        :param stream: text stream to draw on. Defaults to sys.stdout.
+        """
+        self.stream = stream or sys.stdout
+        self.use_ansi = hasattr(self.stream, "isatty") \
+            and self.stream.isatty()
+        self.drawn = None               # Board as last drawn, if shown
+        self.pinned_rows = 0            # Rows held at the top of the screen
+
+    @staticmethod
+    def format_board(board: list[list[str]]) -> list[str]:
+        """
+        Lay out a board as text lines, column headings first.
+        :param board: rows of "_", "X" or "O" strings.
+        :return: lines of the board, without newlines.
+        """
+        lines = ["\t" + "\t".join(str(col) for col in range(len(board)))]
+        lines += [f"{chr(97 + idx)}\t" + "\t".join(row)
+                  for idx, row in enumerate(board)]
+        return lines
+
+    def render(self, board: list[list[str]]) -> None:
+        """
+        Show the board, rewriting only the changed squares if this board is
+        already on screen.
+        :param board: rows of "_", "X" or "O" strings.
+        """
+        if not self.use_ansi:
+            self.stream.write("\n".join(self.format_board(board)) + "\n")
+            self.stream.flush()
+            return
+
+        # Squares cleared or a new board shape mean a new game
+        changes = None
+        if self.drawn is not None and len(self.drawn) == len(board):
+            changes = [(row, col, cell)
+                       for row, (old, new) in enumerate(zip(self.drawn, board))
+                       for col, (was, cell) in enumerate(zip(old, new))
+                       if was != cell]
+            if any(self.drawn[row][col] != "_" for row, col, _ in changes):
+                changes = None
+
+        if changes is None:
+            text = self.draw_all(board)
+        elif changes:
+            text = self.SAVE_CURSOR + "".join(
+                f"{self.CSI}{row + 2};{(col + 1) * self.TAB_WIDTH + 1}H{cell}"
+                for row, col, cell in changes) + self.RESTORE_CURSOR
+        else:
+            return
+        self.drawn = board
+        self.stream.write(text)
+        self.stream.flush()
+
+    def draw_all(self, board: list[list[str]]) -> str:
+        """
+        Build the output that draws a whole board at the top of the screen
+        and keeps the rows below it scrolling. Existing output is scrolled
+        up into the terminal's history rather than cleared.
+        :param board: rows of "_", "X" or "O" strings.
+        :return: text to write.
+        """
+        lines = self.format_board(board)
+        rows = max(len(lines), self.pinned_rows)
+        screen_rows = shutil.get_terminal_size().lines
+        self.pinned_rows = len(lines)
+        return (self.SAVE_CURSOR + f"{self.CSI}r" + self.RESTORE_CURSOR
+                + "\n" * len(lines) + self.SAVE_CURSOR
+                + "".join(f"{self.CSI}{idx + 1};1H{self.CSI}2K"
+                          + (lines[idx] if idx < len(lines) else "")
+                          for idx in range(rows))
+                + f"{self.CSI}{len(lines) + 1};{screen_rows}r"
+                + self.RESTORE_CURSOR)
+
+    def release(self) -> None:
+        """
+        Let chat scroll over the whole screen again. The board stays shown
+        until it scrolls away, and the next render draws it in full.
+        """
+        if self.drawn is None:
+            return
+        self.drawn = None
+        if self.use_ansi:
+            self.pinned_rows = 0
+            self.stream.write(self.SAVE_CURSOR + f"{self.CSI}r"
+                              + self.RESTORE_CURSOR)
+            self.stream.flush()
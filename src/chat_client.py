@@ -1,19 +1,58 @@
 import socket
+import functools
+import load_generator
 from chat_server import get_args
 from chat_interface import ChatInterface
+from journal import JournalWriter
 
 
-def main(host, port):
+def main(host, port, multi=False, duplex=False, nodelay=False,
+         compress=None, metrics=True, stats_path=None,
+         stats_interval=ChatInterface.STATS_INTERVAL, typed=False,
+         journal_dir=None, heartbeat_interval=ChatInterface.HEARTBEAT_INTERVAL,
+         idle_timeout=ChatInterface.IDLE_TIMEOUT):
     # Set up socket
+    journal = JournalWriter(journal_dir) if journal_dir else None
+    # The multi-client server lets a dropped session resume on a new socket
+    reconnect = functools.partial(socket.create_connection, (host, port),
+                                  ChatInterface.RESUME_TIMEOUT) \
+        if multi else None
     with socket.create_connection((host, port)) as server_socket:
         print(f"Connected to: {host} on port: {port}")
-        chatter = ChatInterface(server_socket)
+        chatter = ChatInterface(server_socket, nodelay=nodelay,
+                                compress_threshold=compress, metrics=metrics,
+                                stats_path=stats_path,
+                                stats_interval=stats_interval, typed=typed,
+                                journal=journal,
+                                heartbeat_interval=heartbeat_interval,
+                                idle_timeout=idle_timeout,
+                                reconnect=reconnect)
+        try:
+            multi and chatter.await_role()
+            if (compress is not None or typed) \
+                    and chatter.state != ChatInterface.TERMINATE:
+                chatter.negotiate()
+            if duplex and chatter.state != ChatInterface.TERMINATE:
+                chatter.chat_duplex()
 
-        # Main loop
-        while chatter.state != ChatInterface.TERMINATE:
-            chatter.chat()
+            # Main loop
+            while chatter.state != ChatInterface.TERMINATE:
+                chatter.chat()
+        finally:
+            chatter.abort_transfers()
+            chatter.conn_socket.close()
+            journal is not None and journal.close()
 
 
 if __name__ == '__main__':
-    arg_host, arg_port = get_args("Start a chat client.")
-    main(arg_host, arg_port)
+    args = get_args("Start a chat client.")
+    if args.load:
+        load_generator.main(args.ip_address, args.port_number, args.load,
+                            args.load_duration, args.load_mix,
+                            args.load_sizes, args.load_think,
+                            args.load_report)
+    else:
+        main(args.ip_address, args.port_number, args.multi, args.duplex,
+             args.nodelay, args.compress, args.metrics, args.stats_file,
+             args.stats_interval, args.typed, args.journal, args.heartbeat,
+             args.idle_timeout)
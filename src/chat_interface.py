@@ -1,5 +1,18 @@
-from tic_tac_toe import TicTacToeCli
+import os
+import sys
+import time
+import base64
+import random
+import select
+import selectors
+import threading
+from tic_tac_toe import TicTacToeCli, TicTacToeGame
+from collections import deque
 from typing import Union
+from framing import FrameReader, FrameWriter, ReplayBuffer, encode_header
+from file_transfer import FileReceiver, FileSender
+from metrics import ConnectionMetrics
+from journal import JournalWriter
 
 
 class ChatInterface:
@@ -9,104 +22,691 @@ class ChatInterface:
 
     # CONSTANTS
     CHATTING, WAITING, TERMINATE = range(3)         # Status codes
-    SOCKET_BUFFER = 1024                            # Buffer argument for recv
+    SOCKET_BUFFER = 1024                            # Initial recv buffer size
     DELIMITER = '\0'                                # Use to sep length and data
+    ROLE_PENDING = "/pending"                       # Multi-client server roles
+    ROLE_CHATTING = "/chatting"
+    ROLE_WAITING = "/waiting"
+    GAME_PLAY = "/play"                             # Server-hosted games
+    GAME_MOVE = "/move"
+    GAME_QUEUED = "/queued"
+    GAME_MATCHED = "/matched"
+    GAME_MOVED = "/moved"
+    GAME_REJECTED = "/rejected"
+    GAME_ENDED = "/ended"
+    GAME_SNAPSHOT = "/snapshot"
+    CAPS = "/caps"                                  # Capability exchange
+    CAP_ZLIB = "zlib"
+    CAP_TYPED = "typed"
+    OP_CHAT, OP_QUIT, OP_GAME_REQUEST, OP_GAME_CONFIRM, OP_GAME_REJECT, \
+        OP_MOVE = range(1, 7)                       # Typed frame opcodes
+    CONTROL_OPCODES = {"/q": OP_QUIT, "/tac": OP_GAME_CONFIRM,
+                       "/toe": OP_GAME_REJECT}
+    FILE_SEND = "/send"                             # File transfers
+    FILE_OFFER = "/file"
+    DOWNLOAD_DIR = "downloads"
+    ROOM_JOIN = "/join"                             # Server chat rooms
+    ROOM_LEAVE = "/leave"
+    ROOM_JOINED = "/joined"
+    ROOM_LEFT = "/left"
+    ROOM_RESULTS = ROOM_JOINED, ROOM_LEFT           # Sent only by server
+    STATS = "/stats"                                # Show connection metrics
+    STATS_INTERVAL = 10                             # Seconds between dumps
+    HEARTBEAT_PING = "/ping"                        # Liveness checks
+    HEARTBEAT_PONG = "/pong"
+    HEARTBEAT_INTERVAL = 15                         # Seconds of silence
+    IDLE_TIMEOUT = 60                               # Seconds before giving up
+    HEARTBEATS = HEARTBEAT_PING.encode(), HEARTBEAT_PONG.encode()
+    SESSION_OFFER = "/session"                      # Resumable sessions
+    SESSION_DECLINE = "/nosession"
+    SESSION_RESUME = "/resume"
+    SESSION_RESUMED = "/resumed"
+    SESSION_EXPIRED = "/expired"
+    SESSION_RESULTS = SESSION_OFFER, SESSION_RESUMED, SESSION_EXPIRED
+    RESUME_TIMEOUT = 10                             # Seconds to wait per try
+    RECONNECT_DELAY = 0.5                           # Seconds before first try
+    RECONNECT_MAX_DELAY = 8
+    GAME_RESULTS = GAME_QUEUED, GAME_MATCHED, GAME_MOVED, GAME_REJECTED, \
+        GAME_ENDED, GAME_SNAPSHOT                   # Sent only by server
 
     # METHODS
-    def __init__(self, conn_socket, is_server=False):
+    def __init__(self, conn_socket, is_server=False, nodelay=False,
+                 compress_threshold=None, metrics=True, stats_path=None,
+                 stats_interval=STATS_INTERVAL, typed=False, headless=False,
+                 journal=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 idle_timeout=IDLE_TIMEOUT, reconnect=None):
         """
         Create a new ChatInterface.
         :param conn_socket: socket to use for CLI.
         :param is_server: set True if interface is server, False if client.
+        :param nodelay: set True to send each flushed message immediately
+            instead of letting TCP batch small writes.
+        :param compress_threshold: payload size in bytes above which messages
+            are compressed, once negotiate agrees it with the peer. None to
+            never compress.
+        :param metrics: set False to skip counting traffic and timing
+            dispatch.
+        :param stats_path: file to dump metrics to as JSON every
+            stats_interval seconds, or None to never dump.
+        :param stats_interval: seconds between metrics dumps.
+        :param typed: set True to send typed binary frames instead of text
+            commands, once negotiate agrees it with the peer.
+        :param headless: set True to print nothing, for bots and load tests.
+        :param journal: JournalWriter to record frames and games in, or None.
+        :param heartbeat_interval: seconds of silence from the peer after
+            which a heartbeat is sent, also sent every this many seconds
+            while the user types. None or 0 to send none.
+        :param idle_timeout: seconds of silence from the peer, heartbeats
+            unanswered, after which the chat ends. None or 0 to wait forever.
+        :param reconnect: function returning a new socket to the same
+            multi-client server, used to resume the session if the
+            connection drops. None to end the chat instead.
         """
         self.conn_socket = conn_socket
+        self.nodelay = nodelay
+        self.metrics = ConnectionMetrics() if metrics else None
+        self.reader = FrameReader(conn_socket, self.SOCKET_BUFFER,
+                                  self.metrics)
+        self.writer = FrameWriter(conn_socket, nodelay=nodelay,
+                                  metrics=self.metrics)
+        self.stats_path = stats_path if metrics else None
+        self.stats_interval = stats_interval
+        self.next_stats_dump = time.monotonic() + stats_interval
+        self.compress_threshold = compress_threshold
         self.state = self.WAITING if is_server else self.CHATTING
         self.do_long_prompt = True
-        self.cli = TicTacToeCli()
+        self.stdin_buffer = b""                    # Partial line in duplex mode
+        self.journal = journal
+        self.cli = TicTacToeCli(headless, journal)
+        self.next_transfer_id = 1
+        self.outgoing_transfers = deque()           # (FileSender, chunks)
+        self.incoming_transfers = {}                # Transfer id: FileReceiver
+        self.typed = typed
+        self.use_typed = False                      # Set once peer agrees
+        self.peer_sequence = 0                      # Last typed frame received
+        self.handlers = {self.OP_CHAT: self.handle_chat,
+                         self.OP_QUIT: self.handle_quit,
+                         self.OP_GAME_REQUEST: self.handle_game_request,
+                         self.OP_GAME_CONFIRM: self.handle_game_confirm,
+                         self.OP_GAME_REJECT: self.handle_game_reject,
+                         self.OP_MOVE: self.handle_move}
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.last_received = time.monotonic()       # Last data from the peer
+        self.last_heartbeat = 0.0                   # Last heartbeat sent
+        self.reconnect = reconnect
+        self.session_token = None                   # Set once server offers
+        self.resume_window = 0
+        self.frames_received = 0                    # Heartbeats aside
 
     @staticmethod
-    def parse_socket_data(socket_content: str) -> list[str]:
+    def encode_frame(msg_to_send: str) -> bytes:
         """
-        Parses a string for length and data.
-        :param socket_content: string received from socket
-        :return: list of strings containing length and data chunk
+        Package the given message with its length header.
+        :param msg_to_send: data to frame.
+        :return: framed message ready to be sent.
         """
-        if socket_content[0] != ChatInterface.DELIMITER:
-            raise ValueError("read_incoming_data: missing valid start token")
-        return socket_content.split(ChatInterface.DELIMITER)[1:]
+        payload = msg_to_send.encode()
+        return encode_header(len(payload)) + payload
 
     def read_incoming_data(self) -> str:
         """
-        Read and parse data from the interface's socket.
-        :return: extracted data from socket.
+        Read and parse data from the interface's socket. File chunks and
+        heartbeats that arrive first are handled and skipped.
+        :return: extracted data from socket, or None if the peer closed or
+            timed out.
         """
-        socket_content = self.conn_socket.recv(self.SOCKET_BUFFER).decode()
-        if not socket_content:
+        while True:
+            data = self.read_frame()
+            if data is None:
+                return
+            if FrameReader.FILE_CHUNK in self.reader.flags:
+                self.receive_file_chunk(data)
+            elif not self.handle_heartbeat(data):
+                return data.decode().strip()
+
+    def read_frame(self) -> Union[bytearray, None]:
+        """
+        Read the next frame from the peer, sending heartbeats while it is
+        silent. If the connection drops or times out, the session is resumed
+        on a new one where the server allows it. Frames other than
+        heartbeats are counted, so a resumed session knows where to carry on.
+        :return: payload of the frame, or None if the peer closed, sent a
+            malformed frame, or timed out and the session could not be
+            resumed.
+        """
+        while True:
+            try:
+                if not self.wait_for_peer():
+                    reason = "Peer timed out."
+                else:
+                    data = self.reader.read_frame()
+                    if data is None:
+                        reason = "Connection closed by peer."
+                    elif self.session_token is not None \
+                            and self.reader.opcode is None \
+                            and data == self.SESSION_EXPIRED.encode():
+                        self.session_token = None   # Closed for good
+                        continue
+                    else:
+                        if self.reader.opcode is not None \
+                                or data not in self.HEARTBEATS:
+                            self.frames_received += 1
+                        return data
+            except ConnectionError:
+                reason = "Connection lost."
+            except ValueError:
+                # The stream cannot be trusted past a malformed frame
+                self.cli.show("Peer sent a malformed frame.")
+                return None
+            if not self.try_resume():
+                self.cli.show(reason)
+                self.end_abandoned_game()
+                return None
+
+    def end_abandoned_game(self):
+        """
+        End a game in progress with the peer as a quit by the peer, once it
+        timed out or its connection is gone for good.
+        """
+        self.cli.game_confirmed and \
+            self.cli.end_game(self.cli.opponent.SYMBOL)
+
+    def accept_session(self, args: list[str]):
+        """
+        Answer the resumable session a multi-client server offers. It is
+        taken only if this interface can reconnect, and from then on every
+        frame sent is kept for replay until the server has it.
+        :param args: resume token and resume window in seconds.
+        """
+        if self.reconnect is None or len(args) != 2:
+            self.writer.enqueue_control(self.SESSION_DECLINE.encode())
             return
+        self.session_token = args[0]
+        self.resume_window = float(args[1])
+        self.frames_received = 0
+        self.writer.replay = ReplayBuffer()
+        self.writer.enqueue_control(self.SESSION_OFFER.encode())
 
-        # Receive data length
-        while len(self.parse_socket_data(socket_content)) < 2:
-            socket_content += self.conn_socket.recv(self.SOCKET_BUFFER).decode()
+    def try_resume(self) -> bool:
+        """
+        Reconnect and resume the session after the connection dropped, if
+        the server gave this interface one. Tries until the server's resume
+        window closes, waiting twice as long after each failure, with
+        jitter so clients that all dropped together do not all come back at
+        once.
+        :return: True if the session was resumed, else False.
+        """
+        if self.reconnect is None or self.session_token is None:
+            return False
+        self.cli.show("Connection lost. Reconnecting...")
+        deadline = time.monotonic() + self.resume_window
+        delay = self.RECONNECT_DELAY
+        while time.monotonic() < deadline:
+            time.sleep(min(random.uniform(0.5, 1.5) * delay,
+                           max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
+            try:
+                return self.resume(self.reconnect())
+            except OSError:
+                continue
+        return False
 
-        length, data = self.parse_socket_data(socket_content)
+    def resume(self, conn_socket) -> bool:
+        """
+        Carry the session on over a new connection to the server. Frames the
+        server did not receive are sent again, and the server sends again
+        those this side did not receive, then a snapshot of any game it
+        hosts for this side.
+        :param conn_socket: new connection to the same server.
+        :return: True if resumed, False if the server no longer has the
+            session.
+        """
+        self.conn_socket.close()
+        self.conn_socket = conn_socket
+        writer = FrameWriter(conn_socket, nodelay=self.nodelay,
+                             metrics=self.metrics)
+        writer.compress_threshold = self.writer.compress_threshold
+        writer.sequence = self.writer.sequence
+        writer.replay = self.writer.replay
+        self.reader = FrameReader(conn_socket, self.SOCKET_BUFFER,
+                                  self.metrics)
+        self.writer = writer
 
-        # Receive rest of data
-        while len(data) < int(length):
-            data += self.conn_socket.recv(self.SOCKET_BUFFER).decode()
+        conn_socket.settimeout(self.RESUME_TIMEOUT)
+        try:
+            self.reader.read_frame()            # Offer of a new session
+            self.writer.enqueue_control(
+                f"{self.SESSION_RESUME} {self.session_token} "
+                f"{self.frames_received}".encode())
+            reply = self.reader.read_frame()
+        finally:
+            conn_socket.settimeout(None)
+        if reply is None:
+            raise ConnectionResetError("Closed while resuming")
+        command, *args = reply.decode().split() or [""]
+        if command != self.SESSION_RESUMED or len(args) != 2:
+            self.session_token = None
+            self.cli.show("Session expired.")
+            return False
 
-        return data.strip()
+        received, sequence = map(int, args)
+        sequence > self.frames_received and self.cli.show(
+            f"{sequence - self.frames_received} messages were lost.")
+        self.frames_received = sequence
+        frames = self.writer.replay.since(received)
+        if frames is None:
+            self.cli.show("Some messages sent were lost.")
+        else:
+            self.writer.resend(frames)
+        self.last_received = time.monotonic()
+        self.cli.show("Reconnected.")
+        return True
 
-    def send_outgoing_data(self, msg_to_send: str):
+    def wait_for_peer(self) -> bool:
+        """
+        Block until the peer sends something, sending heartbeats while it
+        stays silent. The peer is only expected to answer from now on, so
+        silence is counted from the call.
+        :return: True once data is waiting, False if the peer stayed silent
+            past the idle timeout.
+        """
+        if not self.heartbeat_interval or self.reader.has_frame():
+            return True
+        self.last_received = time.monotonic()
+        while not select.select([self.conn_socket], [], [],
+                                self.heartbeat_interval)[0]:
+            if not self.check_heartbeat():
+                return False
+        return True
+
+    def check_heartbeat(self) -> bool:
+        """
+        Send a heartbeat if neither side has sent anything for a heartbeat
+        interval.
+        :return: False if the peer has been silent past the idle timeout,
+            else True.
+        """
+        now = time.monotonic()
+        if self.idle_timeout and now - self.last_received >= self.idle_timeout:
+            return False
+        if now - max(self.last_received, self.last_heartbeat) \
+                >= self.heartbeat_interval:
+            self.send_heartbeat()
+        return True
+
+    def send_heartbeat(self):
+        """
+        Ask the peer to show it is still there. Heartbeats are never shown or
+        journaled, and do not take a turn.
+        """
+        self.writer.enqueue_control(self.HEARTBEATS[0])
+        self.last_heartbeat = time.monotonic()
+
+    def handle_heartbeat(self, data: bytearray) -> bool:
+        """
+        Answer a heartbeat from the peer.
+        :param data: payload of the frame just read.
+        :return: True if the frame was a heartbeat, else False.
+        """
+        if self.reader.opcode is not None:
+            return False
+        if data == self.HEARTBEATS[0]:
+            self.writer.enqueue_control(self.HEARTBEATS[1])
+            return True
+        return data == self.HEARTBEATS[1]
+
+    def send_outgoing_data(self, msg_to_send: str, flush: bool = True):
         """
         Send the given message to the interface's socket.
         :param msg_to_send: data to send to socket.
+        :param flush: set False to queue the message and send it with later
+            ones in one system call.
+        """
+        payload = msg_to_send.encode()
+        self.journal is not None and self.journal.record_frame(
+            JournalWriter.FRAME_OUT, 0, payload)
+        self.writer.enqueue(payload, flush)
+
+    def encode_typed(self, message: str) -> Union[tuple[int, bytes], None]:
+        """
+        Choose the typed frame for a line typed by the user. Call before
+        parse_for_command, which may end the game the line refers to.
+        :param message: line typed by the user.
+        :return: opcode and payload, or None to send the line as text.
+        """
+        command, *args = message.split() or [""]
+        if not self.use_typed or self.cli.server_game or command in \
+                (self.FILE_SEND, self.GAME_PLAY, self.ROOM_JOIN,
+                 self.ROOM_LEAVE):
+            return None             # Meant for the server or sent as text
+
+        if message in self.CONTROL_OPCODES:
+            return self.CONTROL_OPCODES[message], b""
+        if command == "/tic":
+            board_params = self.cli.parse_board_args(args)
+            return self.OP_GAME_REQUEST, bytes(board_params or ())
+        if self.cli.game_confirmed:
+            move = self.cli.validate_input(message)
+            return self.OP_MOVE, b"" if move is None \
+                else self.cli.game.encode_cell(*move)
+        return self.OP_CHAT, message.encode()
+
+    def send_message(self, message: str,
+                     typed: Union[tuple[int, bytes], None] = None,
+                     flush: bool = True):
+        """
+        Send a parsed message, as a typed frame if one was chosen for it.
+        :param message: message returned by parse_for_command.
+        :param typed: opcode and payload from encode_typed, or None.
+        :param flush: set False to queue the message and send it with later
+            ones in one system call.
         """
-        # Format and package data
-        str_msg = self.DELIMITER.join(["", str(len(msg_to_send)), msg_to_send])
-        byte_msg = str_msg.encode()
+        if typed is None:
+            self.send_outgoing_data(message, flush)
+        else:
+            self.journal is not None and self.journal.record_frame(
+                JournalWriter.FRAME_OUT, *typed)
+            self.writer.enqueue_typed(*typed, flush=flush)
+
+    def start_file_transfer(self, path: str) -> Union[str, None]:
+        """
+        Open a file and queue it to be streamed to the peer in chunks.
+        :param path: file to send.
+        :return: offer message to send first, or None if it cannot be read.
+        """
+        try:
+            sender = FileSender(path, self.next_transfer_id)
+        except OSError as err:
+            self.cli.show(f"Cannot send {path}: {err.strerror}")
+            return None
+        self.next_transfer_id += 1
+        self.outgoing_transfers.append((sender, sender.chunks()))
+        self.cli.show(f"Sending {sender.name} ({sender.size} bytes)...")
+        return sender.offer()
 
-        # Send data
-        total_bytes = 0
-        while total_bytes < len(byte_msg):
-            total_bytes += self.conn_socket.send(byte_msg[total_bytes:])
+    def pump_transfers(self):
+        """
+        Send the next chunk of one outgoing transfer, taking turns between
+        transfers so none holds up the others.
+        """
+        sender, chunks = self.outgoing_transfers[0]
+        chunk = next(chunks, None)
+        if chunk is None:
+            self.outgoing_transfers.popleft()
+            self.cli.show(f"Sent {sender.name}.")
+            return
+        self.writer.enqueue_parts([sender.id_prefix, chunk],
+                                  FrameReader.FILE_CHUNK, True)
+        self.outgoing_transfers.rotate(-1)
 
-    def parse_for_command(self, message: str) -> Union[str, None]:
+    def receive_file_offer(self, args: list[str]):
+        """
+        Create the file for a transfer announced by the peer.
+        :param args: transfer id, size in bytes and file name.
+        """
+        try:
+            transfer_id, size = int(args[0]), int(args[1])
+            if transfer_id in self.incoming_transfers:
+                raise ValueError(f"transfer {transfer_id} already running")
+            receiver = FileReceiver(self.DOWNLOAD_DIR, " ".join(args[2:]), size)
+        except (IndexError, ValueError, OSError) as err:
+            self.cli.show(f"Cannot receive file: {err}")
+            return
+        self.incoming_transfers[transfer_id] = receiver
+        self.cli.show(f"Receiving {receiver.path} ({size} bytes)...")
+
+    def receive_file_chunk(self, payload: bytearray):
+        """
+        Write a received file chunk to the transfer it belongs to.
+        :param payload: transfer id followed by the chunk.
+        """
+        transfer_id = int.from_bytes(payload[:FileSender.ID_BYTES], "big")
+        receiver = self.incoming_transfers.get(transfer_id)
+        if receiver is None:
+            return
+        try:
+            done = receiver.write(memoryview(payload)[FileSender.ID_BYTES:])
+        except (ValueError, OSError) as err:
+            del self.incoming_transfers[transfer_id]
+            receiver.abort()
+            self.cli.show(f"Cannot receive {receiver.path}: {err}")
+            return
+        if done:
+            del self.incoming_transfers[transfer_id]
+            self.cli.show(f"Saved {receiver.path} "
+                          f"({receiver.received} bytes).")
+
+    def abort_transfers(self):
+        """
+        Delete the partly received files of transfers the connection ended
+        before.
+        """
+        for receiver in self.incoming_transfers.values():
+            receiver.abort()
+            self.cli.show(f"Discarded unfinished {receiver.path}.")
+        self.incoming_transfers.clear()
+
+    def parse_for_command(self, message: str,
+                          is_sender: bool = None) -> Union[str, None]:
         """
         Checks if message is a command. Executes command accordingly.
         Updates internal state if terminating.
         :param message: string to parse
+        :param is_sender: set True if message was typed locally, False if it
+            was received. Defaults to whether the interface is CHATTING.
         :return: None if message is not parsable, else message to send.
         """
+        if is_sender is None:
+            is_sender = self.state == self.CHATTING
+
+        command, *args = message.split() or [""]
+
+        # Results of games hosted by a multi-client server
+        if not is_sender and command in self.GAME_RESULTS:
+            self.handle_game_result(command, args)
+            return message
+
+        # Chat rooms on a multi-client server
+        if is_sender and command in (self.ROOM_JOIN, self.ROOM_LEAVE):
+            return message
+        if not is_sender and command in self.ROOM_RESULTS:
+            self.cli.show(f"Joined room {args[0]} ({args[1]} members)."
+                          if command == self.ROOM_JOINED and len(args) == 2
+                          else "Not in a room.")
+            return message
+
+        # File transfers
+        if is_sender and command == self.FILE_SEND:
+            return self.start_file_transfer(message[len(command):].strip())
+        if not is_sender and command == self.FILE_OFFER:
+            self.receive_file_offer(args)
+            return message
+
+        # Local commands
+        if is_sender and message == self.STATS:
+            self.show_stats()
+            return None
+
+        # Hints, server games and games against the computer
+        if is_sender and message == "/hint":
+            self.cli.give_hint()
+            return None
+        if is_sender and command == self.GAME_PLAY:
+            return message if self.cli.request_server_game(args) else None
+        if is_sender and self.cli.server_game:
+            return message if message == "/q" \
+                else self.cli.format_server_move(message)
+        if is_sender and command == "/bot":
+            self.cli.start_bot_game(args)
+            return None
+        if is_sender and self.cli.vs_bot:
+            self.cli.play_bot_game(message)
+            return None
+        if self.cli.vs_bot or self.cli.server_game:
+            # Peer messages are shown as chat until the game ends
+            self.cli.show(message)
+            self.state = self.TERMINATE if message == "/q" else self.state
+            return message
+
         # Control messages
         if message == "/q":
             if self.cli.game_confirmed:
-                self.cli.end_game()
+                # In duplex mode either player may quit on any turn
+                self.cli.end_game(self.cli.player.SYMBOL if is_sender
+                                  else self.cli.opponent.SYMBOL)
                 return message
             self.state = self.TERMINATE
             return message
-        if message == "/tic":
-            return message if self.cli.request_game(
-                self.state == self.CHATTING) else None
+        if command == "/tic":
+            return message if self.cli.request_game(is_sender, args) else None
         if message == "/tac":
-            return message if self.cli.confirm_game(
-                self.state == self.CHATTING) else None
+            return message if self.cli.confirm_game(is_sender) else None
         if message == "/toe":
-            return message if self.cli.reject_game(
-                self.state == self.WAITING) else None
+            return message if self.cli.reject_game(not is_sender) else None
 
         # String messages
         if self.cli.game_confirmed:
-            return message if self.cli.make_player_move(message, self.state == self.WAITING) else None
-        self.state == self.WAITING and print(message)
+            return message if self.cli.make_player_move(message, not is_sender) else None
+        not is_sender and self.cli.show(message)
         return message
 
+    def handle_frame(self, data: bytearray) -> bool:
+        """
+        Handle a frame just read from the socket, timing the dispatch if
+        metrics are on.
+        :param data: payload of the frame.
+        :return: False if the frame was a file chunk or a heartbeat, else
+            True.
+        """
+        if FrameReader.FILE_CHUNK in self.reader.flags:
+            self.receive_file_chunk(data)
+            return False
+        if self.handle_heartbeat(data):
+            return False
+        self.journal is not None and self.journal.record_frame(
+            JournalWriter.FRAME_IN, self.reader.opcode or 0, data)
+        started = self.metrics is not None and time.perf_counter_ns()
+        if self.reader.opcode is None:
+            self.parse_for_command(data.decode().strip(), False)
+        else:
+            self.dispatch_typed(self.reader.opcode, self.reader.sequence, data)
+        self.metrics is not None and self.metrics.dispatch.record(
+            time.perf_counter_ns() - started)
+        return True
+
+    def dispatch_typed(self, opcode: int, sequence: int, payload: bytearray):
+        """
+        Route a typed frame straight to the handler for its opcode.
+        :param opcode: message type of the frame.
+        :param sequence: sequence id of the frame.
+        :param payload: payload of the frame.
+        """
+        handler = self.handlers.get(opcode)
+        if handler is None:
+            self.cli.show(f"Ignoring message of unknown type {opcode}.")
+            return
+        self.peer_sequence = sequence
+        handler(payload)
+
+    def handle_chat(self, payload: bytearray):
+        """
+        Show a chat message from the peer, even one that reads like a command.
+        :param payload: UTF-8 text of the message.
+        """
+        self.cli.show(payload.decode())
+
+    def handle_quit(self, payload: bytearray):
+        """
+        End the game in progress, or the chat if there is none.
+        :param payload: unused.
+        """
+        if self.cli.game_confirmed:
+            self.cli.end_game(self.cli.opponent.SYMBOL)
+            return
+        self.state = self.TERMINATE
+
+    def handle_game_request(self, payload: bytearray):
+        """
+        Show the peer's game request.
+        :param payload: board size and win length, one byte each.
+        """
+        self.cli.request_game(False, [str(value) for value in payload])
+
+    def handle_game_confirm(self, payload: bytearray):
+        """
+        Start the game the peer accepted.
+        :param payload: unused.
+        """
+        self.cli.confirm_game(False)
+
+    def handle_game_reject(self, payload: bytearray):
+        """
+        Cancel the game the peer rejected.
+        :param payload: unused.
+        """
+        self.cli.reject_game(True)
+
+    def handle_move(self, payload: bytearray):
+        """
+        Make the peer's move in the game in progress.
+        :param payload: cell of the move, as encoded by encode_cell.
+        """
+        if self.cli.game_confirmed:
+            self.cli.play_square(*self.cli.game.decode_cell(payload), True)
+
+    def show_stats(self):
+        """
+        Print this connection's metrics as JSON.
+        """
+        self.cli.show("Metrics are off." if self.metrics is None
+                      else self.metrics.to_json())
+
+    def dump_stats_if_due(self):
+        """
+        Write metrics to the stats file if the dump interval has passed.
+        """
+        now = time.monotonic()
+        if self.stats_path is None or now < self.next_stats_dump:
+            return
+        self.metrics.dump(self.stats_path)
+        self.next_stats_dump = now + self.stats_interval
+
+    def handle_game_result(self, command: str, args: list[str]):
+        """
+        Update the local view of a server-hosted game from a server message.
+        :param command: first word of the message.
+        :param args: remaining words of the message.
+        """
+        if command == self.GAME_QUEUED:
+            self.cli.show("Waiting for an opponent...")
+        elif command == self.GAME_MATCHED:
+            symbol, size, win_length = args
+            self.cli.start_server_game(symbol, int(size), int(win_length))
+        elif command == self.GAME_MOVED:
+            symbol, row, col = args
+            self.cli.apply_server_move(symbol, int(row), int(col))
+        elif command == self.GAME_REJECTED:
+            self.cli.show_move_error(int(args[0]))
+        elif command == self.GAME_ENDED:
+            self.cli.finish_server_game(int(args[0]))
+        elif command == self.GAME_SNAPSHOT:
+            symbol, snapshot = args
+            self.cli.resume_server_game(symbol, TicTacToeGame.from_snapshot(
+                base64.b64decode(snapshot)))
+
     def receive_and_handle_message(self):
         """
         Blocks until message received from socket, then parses message. Update
         state whether ready to send or need to terminate.
         """
-        message_received = self.read_incoming_data()
-        self.parse_for_command(message_received)
+        while True:
+            data = self.read_frame()
+            if data is None:
+                self.state = self.TERMINATE
+                return
+            if self.handle_frame(data):
+                break
         self.state = self.CHATTING if self.state == self.WAITING else self.state
 
     def send_and_handle_user_input(self):
@@ -114,27 +714,213 @@ class ChatInterface:
         Prompt for user input until acceptable input received. Update state
         whether ready to read or need to terminate.
         """
-        self.do_long_prompt and print(
+        self.do_long_prompt and self.cli.show(
             "Type /q to quit\nEnter message to send...")
         self.do_long_prompt = False
 
         # Loop until parsable input is returned
         while True:
-            new_message = self.parse_for_command(input(">"))
+            line = self.read_user_line()
+            typed = self.encode_typed(line)
+            new_message = self.parse_for_command(line)
             if new_message is not None:
                 break
 
-        self.send_outgoing_data(new_message)
+        self.send_message(new_message, typed)
+        while self.outgoing_transfers:
+            self.pump_transfers()
         self.state = self.WAITING if self.state == self.CHATTING else self.state
 
+    def read_user_line(self, prompt: str = ">") -> str:
+        """
+        Prompt for a line typed by the user, sending a heartbeat every
+        heartbeat interval from another thread until it is entered, so the
+        peer knows this side is still there however long the user takes.
+        Works on every platform, whether or not stdin is a terminal.
+        :param prompt: text shown before the line.
+        :return: line typed, without its newline.
+        """
+        if not self.heartbeat_interval:
+            return input(prompt)
+        typed = threading.Event()
+        heartbeats = threading.Thread(target=self.send_heartbeats,
+                                      args=(typed,), daemon=True)
+        heartbeats.start()
+        try:
+            return input(prompt)
+        finally:
+            typed.set()
+            heartbeats.join()                   # Frees the writer
+
+    def send_heartbeats(self, typed: threading.Event):
+        """
+        Send a heartbeat every heartbeat interval until the user has typed
+        a line. Runs on its own thread while the main thread waits in input,
+        so the writer is never used by both at once.
+        :param typed: set once the line is entered.
+        """
+        while not typed.wait(self.heartbeat_interval):
+            try:
+                self.send_heartbeat()
+            except OSError:
+                return                          # Found out on the next read
+
+    def negotiate(self):
+        """
+        Exchange capabilities with the peer at connect time. Both sides must
+        call this before chatting. Compression is used only if both agree.
+        """
+        caps = [self.CAP_ZLIB] if self.compress_threshold is not None else []
+        self.typed and caps.append(self.CAP_TYPED)
+        self.send_outgoing_data(" ".join([self.CAPS] + caps))
+
+        message = self.read_incoming_data()
+        if message is None:
+            self.state = self.TERMINATE
+            return
+        command, *peer_caps = message.split()
+        if command != self.CAPS:
+            # Peer skipped negotiation, so this is a normal message
+            self.cli.show("Peer did not negotiate capabilities.")
+            self.parse_for_command(message, False)
+            return
+        if self.CAP_ZLIB in caps and self.CAP_ZLIB in peer_caps:
+            self.writer.compress_threshold = self.compress_threshold
+            self.cli.show(f"Compressing messages over "
+                          f"{self.compress_threshold} bytes.")
+        if self.CAP_TYPED in caps and self.CAP_TYPED in peer_caps:
+            self.use_typed = True
+            self.cli.show("Sending typed frames.")
+
+    def await_role(self):
+        """
+        Blocks until a multi-client server assigns this interface a partner,
+        then takes on the state given by the server.
+        """
+        roles = {self.ROLE_CHATTING: self.CHATTING,
+                 self.ROLE_WAITING: self.WAITING}
+        while True:
+            message = self.read_incoming_data()
+            if message is None:
+                self.state = self.TERMINATE
+                return
+            if message in roles:
+                self.state = roles[message]
+                return
+            command, *args = message.split() or [""]
+            if command == self.SESSION_OFFER:
+                self.accept_session(args)
+                continue
+            message == self.ROLE_PENDING and \
+                self.cli.show("Waiting for a partner...")
+
+    def read_stdin_lines(self) -> Union[list[str], None]:
+        """
+        Read whatever is available on stdin without blocking on a full line.
+        :return: complete lines typed so far, or None if stdin closed.
+        """
+        chunk = os.read(sys.stdin.fileno(), self.SOCKET_BUFFER)
+        if not chunk:
+            return None
+        self.stdin_buffer += chunk
+        *lines, self.stdin_buffer = self.stdin_buffer.split(b"\n")
+        return [line.decode().rstrip("\r") for line in lines]
+
+    def handle_user_line(self, line: str, flush: bool = True):
+        """
+        Parse one line typed by the user and send it if it is sendable.
+        :param line: text typed by the user.
+        :param flush: set False to queue the message and send it with later
+            ones in one system call.
+        """
+        typed = self.encode_typed(line)
+        new_message = self.parse_for_command(line, True)
+        new_message is not None and \
+            self.send_message(new_message, typed, flush)
+
+    def handle_socket_ready(self):
+        """
+        Read and parse every frame available on the socket.
+        """
+        self.last_received = time.monotonic()
+        while self.state != self.TERMINATE:
+            data = self.read_frame()
+            if data is None:
+                self.state = self.TERMINATE
+                return
+            self.handle_frame(data)
+            try:
+                if not self.reader.has_frame():
+                    return
+            except ValueError:
+                pass                    # Reported by the next read_frame
+
+    def chat_duplex(self):
+        """
+        Watch stdin and the socket together, sending and showing messages as
+        soon as they exist, until the chat terminates. Inside a game, turns
+        are still enforced by the game itself. Requires a platform where
+        stdin can be selected on (not Windows).
+        """
+        self.cli.show(
+            "Type /q to quit\nEnter messages to send at any time...")
+        self.state = self.CHATTING
+        self.last_received = time.monotonic()
+        connected = self.conn_socket
+        with selectors.DefaultSelector() as selector:
+            selector.register(sys.stdin, selectors.EVENT_READ)
+            selector.register(connected, selectors.EVENT_READ)
+            self.cli.show(">", end="", flush=True)
+            while self.state != self.TERMINATE:
+                # Poll instead of blocking while file chunks are waiting
+                events = selector.select(
+                    0 if self.outgoing_transfers else self.poll_timeout())
+                for key, _ in events:
+                    if key.fileobj is connected:
+                        self.cli.show()
+                        self.handle_socket_ready()
+                        continue
+                    lines = self.read_stdin_lines()
+                    if lines is None:
+                        self.state = self.TERMINATE
+                        break
+                    # Lines read together are sent together
+                    for line in lines:
+                        self.state != self.TERMINATE and \
+                            self.handle_user_line(line, False)
+                    self.writer.flush()
+                self.outgoing_transfers and self.pump_transfers()
+                self.dump_stats_if_due()
+                if self.heartbeat_interval and not self.check_heartbeat() \
+                        and not self.try_resume():
+                    self.cli.show("\nPeer timed out.")
+                    self.end_abandoned_game()
+                    self.state = self.TERMINATE
+                if self.conn_socket is not connected:
+                    # Resumed on a new connection
+                    selector.unregister(connected)
+                    connected = self.conn_socket
+                    selector.register(connected, selectors.EVENT_READ)
+                events and self.cli.show(">", end="", flush=True)
+
+    def poll_timeout(self) -> Union[float, None]:
+        """
+        :return: longest time in seconds chat_duplex may wait for input
+            before stats or heartbeats are due, or None to wait forever.
+        """
+        intervals = [self.stats_path and self.stats_interval,
+                     self.heartbeat_interval]
+        return min(filter(None, intervals), default=None)
+
     def chat(self):
         """
         Waits for incoming message or sends new message depending on state.
         """
+        self.dump_stats_if_due()
         if self.state == self.CHATTING:
             self.send_and_handle_user_input()
         elif self.state == self.WAITING:
             self.receive_and_handle_message()
         else:
-            print("Chat Interface is unavailable.")
+            self.cli.show("Chat Interface is unavailable.")
             return None
@@ -0,0 +1,140 @@
+from typing import Union
+from framing import FrameWriter, encode_header
+
+
+class ChatRoom:
+    """
+    Defines data members for one named chat room on the server.
+    """
+    __slots__ = "name", "members"
+
+    def __init__(self, name: str) -> None:
+        """
+        Initializes an empty room.
+        :param name: name clients join the room by.
+        """
+        self.name = name
+        self.members = set()                    # Subscribed sessions
+
+
+class ChatRoomManager:
+    """
+    Holds the named chat rooms of a server and fans messages out to their
+    members. Each message is framed once and the same bytes object is queued
+    on every member's connection, without waiting for any of them to send.
+    A member whose queue is over the limit is a slow consumer and is handled
+    by the policy: its copy of the message is dropped, or it is disconnected.
+    With a relay set, messages also reach members of the same room in other
+    worker processes.
+    """
+    # CONSTANTS
+    DROP, DISCONNECT = "drop", "disconnect"     # Slow consumer policies
+    POLICIES = DROP, DISCONNECT
+    MAX_NAME = 32                               # Characters in a room name
+
+    def __init__(self, policy: str = DROP,
+                 queue_limit: int = FrameWriter.HIGH_WATER) -> None:
+        """
+        Initializes a manager with no rooms.
+        :param policy: DROP or DISCONNECT, applied to slow consumers.
+        :param queue_limit: bytes queued on a member's connection above which
+            it is a slow consumer.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.policy = policy
+        self.queue_limit = queue_limit
+        self.rooms = {}                 # Name -> ChatRoom
+        self.member_rooms = {}          # Session -> ChatRoom
+        self.dropped = 0                # Messages dropped for slow members
+        self.disconnected = 0           # Members disconnected for being slow
+        self.relay = None               # WorkerRelay to other workers, if any
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def room_of(self, session) -> Union[ChatRoom, None]:
+        """
+        :param session: session to look up.
+        :return: room the session is in, or None.
+        """
+        return self.member_rooms.get(session)
+
+    def join(self, session, name: str) -> Union[ChatRoom, None]:
+        """
+        Move a session into a room, creating the room if needed.
+        :param session: session joining.
+        :param name: name of the room.
+        :return: room joined, or None if the name is not valid.
+        """
+        if not name or len(name) > self.MAX_NAME or not name.isprintable():
+            return None
+        self.leave(session)
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = ChatRoom(name)
+        room.members.add(session)
+        self.member_rooms[session] = room
+        return room
+
+    def leave(self, session) -> Union[ChatRoom, None]:
+        """
+        Take a session out of its room, closing the room once empty.
+        :param session: session leaving.
+        :return: room left, or None if the session was in none.
+        """
+        room = self.member_rooms.pop(session, None)
+        if room is None:
+            return None
+        room.members.discard(session)
+        room.members or self.rooms.pop(room.name)
+        return room
+
+    def publish(self, sender, text: bytes) -> int:
+        """
+        Send a chat message to every other member of the sender's room.
+        :param sender: session that sent the message.
+        :param text: UTF-8 text of the message.
+        :return: number of members the message was queued for.
+        """
+        room = self.member_rooms[sender]
+        host, port = sender.addr[:2]
+        payload = f"[{room.name}] {host}:{port}: ".encode() + text
+        frame = encode_header(len(payload)) + payload   # Shared by members
+        self.relay is not None and self.relay.publish(room.name, frame)
+        return self.deliver(room.name, frame, sender)
+
+    def deliver(self, name: str, frame: bytes, sender=None) -> int:
+        """
+        Queue an encoded message on every member of a room in this process.
+        :param name: name of the room.
+        :param frame: message framed with its header.
+        :param sender: member to skip, or None.
+        :return: number of members the message was queued for.
+        """
+        room = self.rooms.get(name)
+        if room is None:
+            return 0
+        queued = 0
+        for member in tuple(room.members):     # Policy may remove members
+            if member is sender:
+                continue
+            if member.writer.transport.get_write_buffer_size() \
+                    > self.queue_limit:
+                self.handle_slow_consumer(member)
+                continue
+            member.write_frame(frame)
+            queued += 1
+        return queued
+
+    def handle_slow_consumer(self, member) -> None:
+        """
+        Apply the policy to a member whose queue is over the limit.
+        :param member: slow session.
+        """
+        if self.policy == self.DROP:
+            self.dropped += 1
+            return
+        self.disconnected += 1
+        self.leave(member)
+        member.writer.close()
@@ -1,6 +1,10 @@
 import socket
 import argparse
+import async_chat_server
+from chat_rooms import ChatRoomManager
 from chat_interface import ChatInterface
+from journal import JournalWriter
+from load_generator import LoadGenerator
 
 
 def get_args(desc=""):
@@ -10,25 +14,128 @@ def get_args(desc=""):
                         help="host address")
     parser.add_argument("-p", "--port-number", type=int, default=8080,
                         help="port number")
-    args = parser.parse_args()
-    return args.ip_address, args.port_number
+    parser.add_argument("-m", "--multi", action="store_true",
+                        help="use the multi-client server")
+    parser.add_argument("-d", "--duplex", action="store_true",
+                        help="send and receive at any time instead of taking "
+                             "turns")
+    parser.add_argument("-z", "--compress", type=int, nargs="?", const=1024,
+                        metavar="THRESHOLD",
+                        help="compress messages over THRESHOLD bytes if the "
+                             "peer also uses --compress")
+    parser.add_argument("-t", "--typed", action="store_true",
+                        help="send commands and moves as typed binary frames "
+                             "if the peer also uses --typed")
+    parser.add_argument("-n", "--nodelay", action="store_true",
+                        help="disable Nagle's algorithm so each message is "
+                             "sent immediately")
+    parser.add_argument("--no-metrics", dest="metrics", action="store_false",
+                        help="do not count traffic or time message handling")
+    parser.add_argument("--stats-file", type=str, metavar="PATH",
+                        help="dump connection metrics to PATH as JSON")
+    parser.add_argument("--stats-interval", type=float,
+                        default=ChatInterface.STATS_INTERVAL,
+                        metavar="SECONDS",
+                        help="seconds between metrics dumps")
+    parser.add_argument("-j", "--journal", type=str, metavar="DIR",
+                        help="record frames and games in a journal in DIR")
+    parser.add_argument("--slow-consumers", choices=ChatRoomManager.POLICIES,
+                        default=ChatRoomManager.DROP,
+                        help="with --multi, drop messages to chat room "
+                             "members that cannot keep up, or disconnect "
+                             "them")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="with --multi, number of worker processes "
+                             "sharing the port")
+    parser.add_argument("--heartbeat", type=float,
+                        default=ChatInterface.HEARTBEAT_INTERVAL,
+                        metavar="SECONDS",
+                        help="send a heartbeat after SECONDS of silence from "
+                             "the peer, and every SECONDS while typing. 0 "
+                             "for none")
+    parser.add_argument("--idle-timeout", type=float,
+                        default=ChatInterface.IDLE_TIMEOUT, metavar="SECONDS",
+                        help="give up on a peer silent for SECONDS, "
+                             "heartbeats unanswered. 0 to wait forever")
+    parser.add_argument("--move-timeout", type=float, default=0,
+                        metavar="SECONDS",
+                        help="with --multi, end a hosted game as a quit by a "
+                             "player who takes longer than SECONDS to move. "
+                             "0 for no limit")
+    parser.add_argument("--resume-window", type=float, default=0,
+                        metavar="SECONDS",
+                        help="with --multi, keep the session of a client "
+                             "whose connection drops for SECONDS, so it can "
+                             "reconnect and carry on. Each new client then "
+                             "waits up to a second for its answer to the "
+                             "offer. 0 to offer no sessions")
+    parser.add_argument("-l", "--load", type=int, metavar="USERS",
+                        help="client only: run USERS headless virtual users "
+                             "against a --multi server and report "
+                             "throughput, errors and latency")
+    parser.add_argument("--load-duration", type=float,
+                        default=LoadGenerator.DURATION, metavar="SECONDS",
+                        help="with --load, seconds to run for")
+    parser.add_argument("--load-mix", type=LoadGenerator.parse_mix,
+                        default=LoadGenerator.MIX,
+                        help="with --load, relative weights of chat "
+                             "messages, /tic handshakes that are quit at "
+                             "once, and full games")
+    parser.add_argument("--load-sizes", type=LoadGenerator.parse_sizes,
+                        default=LoadGenerator.SIZES, metavar="BYTES,...",
+                        help="with --load, chat message sizes to pick from")
+    parser.add_argument("--load-think", type=float, default=0,
+                        metavar="SECONDS",
+                        help="with --load, mean pause before each message")
+    parser.add_argument("--load-report", type=str, metavar="PATH",
+                        help="with --load, also write the report to PATH as "
+                             "JSON")
+    return parser.parse_args()
 
 
-def main(host, port):
+def main(host, port, duplex=False, nodelay=False, compress=None,
+         metrics=True, stats_path=None,
+         stats_interval=ChatInterface.STATS_INTERVAL, typed=False,
+         journal_dir=None, heartbeat_interval=ChatInterface.HEARTBEAT_INTERVAL,
+         idle_timeout=ChatInterface.IDLE_TIMEOUT):
     # Set up socket
     with socket.create_server((host, port)) as server_socket:
         print(f"Server listening on: {host} on port: {port}")
         client_socket, addr = server_socket.accept()
 
     # Manage connection
+    journal = JournalWriter(journal_dir) if journal_dir else None
     with client_socket:
         print(f"Connected by {addr}")
-        print("Waiting for message...")
-        chatter = ChatInterface(client_socket, True)
-        while chatter.state != ChatInterface.TERMINATE:
-            chatter.chat()
+        chatter = ChatInterface(client_socket, True, nodelay, compress,
+                                metrics, stats_path, stats_interval, typed,
+                                journal=journal,
+                                heartbeat_interval=heartbeat_interval,
+                                idle_timeout=idle_timeout)
+        try:
+            (compress is not None or typed) and chatter.negotiate()
+            if duplex:
+                chatter.chat_duplex()
+                return
+            print("Waiting for message...")
+            while chatter.state != ChatInterface.TERMINATE:
+                chatter.chat()
+        finally:
+            chatter.abort_transfers()
+            journal is not None and journal.close()
 
 
 if __name__ == '__main__':
-    arg_host, arg_port = get_args("Start a chat server.")
-    main(arg_host, arg_port)
+    args = get_args("Start a chat server.")
+    if args.multi:
+        async_chat_server.main(args.ip_address, args.port_number,
+                               args.metrics, args.stats_file,
+                               args.stats_interval, args.journal,
+                               args.slow_consumers, args.workers,
+                               args.heartbeat, args.idle_timeout,
+                               args.move_timeout, args.resume_window)
+    else:
+        main(args.ip_address, args.port_number, args.duplex, args.nodelay,
+             args.compress, args.metrics, args.stats_file,
+             args.stats_interval, args.typed, args.journal, args.heartbeat,
+             args.idle_timeout)
@@ -0,0 +1,118 @@
+import os
+from typing import Iterator
+
+
+class FileSender:
+    """
+    Reads a file in fixed-size chunks for streaming to a peer, so memory use
+    stays the same whatever the file size.
+    """
+    # CONSTANTS
+    CHUNK_SIZE = 64 * 1024                      # Bytes read per chunk
+    ID_BYTES = 4                                # Transfer id prefix per chunk
+
+    def __init__(self, path: str, transfer_id: int):
+        """
+        Open a file to send.
+        :param path: file to send.
+        :param transfer_id: id that tags every chunk of this transfer.
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = os.path.getsize(path)
+        self.file = open(path, "rb")
+        self.transfer_id = transfer_id
+        self.id_prefix = transfer_id.to_bytes(self.ID_BYTES, "big")
+
+    def offer(self) -> str:
+        """
+        :return: message announcing the transfer to the peer.
+        """
+        return f"/file {self.transfer_id} {self.size} {self.name}"
+
+    def chunks(self) -> Iterator[memoryview]:
+        """
+        Yield the file chunk by chunk, then an empty chunk marking the end.
+        Chunks share one buffer, so each must be sent before the next is
+        requested.
+        :return: generator of chunks.
+        """
+        buffer = bytearray(self.CHUNK_SIZE)
+        view = memoryview(buffer)
+        try:
+            while True:
+                count = self.file.readinto(buffer)
+                yield view[:count]
+                if not count:
+                    return
+        finally:
+            self.file.close()
+
+
+class FileReceiver:
+    """
+    Writes the chunks of an incoming transfer straight to disk.
+    """
+    def __init__(self, directory: str, name: str, size: int):
+        """
+        Create the file for an incoming transfer, without overwriting any
+        existing file.
+        :param directory: folder to save into.
+        :param name: file name offered by the peer.
+        :param size: expected size in bytes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        base, ext = os.path.splitext(os.path.basename(name) or "download")
+        self.path = os.path.join(directory, base + ext)
+        copy = 1
+        while True:
+            # Creating exclusively leaves no gap for another file to appear
+            try:
+                self.file = open(self.path, "xb")
+                break
+            except FileExistsError:
+                self.path = os.path.join(directory, f"{base} ({copy}){ext}")
+                copy += 1
+        self.size = size
+        self.received = 0
+
+    def write(self, chunk) -> bool:
+        """
+        Write one chunk, closing the file at the empty end-of-file chunk.
+        :param chunk: bytes-like chunk of the file.
+        :return: True if the transfer is complete, else False.
+        :raises ValueError: if the chunks add up to more or, at the end, to
+            fewer bytes than offered.
+        """
+        if not chunk:
+            self.file.close()
+            if self.received != self.size:
+                raise ValueError(f"got {self.received} of {self.size} bytes")
+            return True
+        if self.received + len(chunk) > self.size:
+            raise ValueError(f"more than the {self.size} bytes offered")
+        self.file.write(chunk)
+        self.received += len(chunk)
+        return False
+
+    def write_all(self, chunks: Iterator) -> int:
+        """
+        Write every chunk of an iterator until the end-of-file chunk.
+        :param chunks: iterator of bytes-like chunks.
+        :return: number of bytes written.
+        :raises ValueError: if the chunks do not add up to the size offered.
+        """
+        for chunk in chunks:
+            if self.write(chunk):
+                break
+        return self.received
+
+    def abort(self) -> None:
+        """
+        Close and delete the partly written file of a failed transfer.
+        """
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,529 @@
+import time
+import zlib
+import socket
+import struct
+import asyncio
+from collections import deque
+from itertools import islice
+from typing import Union
+
+
+class FrameReader:
+    """
+    Reads length-prefixed frames from a socket. Works on raw bytes and keeps
+    any surplus bytes received so the next frame can be read from them.
+    Reads both text headers, which start with DELIMITER, and binary typed
+    headers, which start with TYPED_VERSION and carry an opcode and sequence
+    id.
+    """
+
+    # CONSTANTS
+    DELIMITER = b'\0'                               # Use to sep length and data
+    COMPRESSED = b"z"                               # Header flag: zlib payload
+    FILE_CHUNK = b"f"                               # Header flag: file chunk
+    TYPED_VERSION = 2                               # First byte of typed frames
+    TYPED_HEADER = struct.Struct("!BBBII")          # Version, opcode, flag
+                                                    # bits, sequence, length
+    TYPED_COMPRESSED = 0x01                         # Flag bit: zlib payload
+    MAX_INFLATED = 1 << 24                          # Largest payload once
+                                                    # decompressed, 16 MiB
+    MAX_FRAME = 1 << 24                             # Largest payload a header
+                                                    # may announce, 16 MiB
+    MAX_HEADER = 16                                 # Most bytes between text
+                                                    # header delimiters
+
+    def __init__(self, conn_socket, buffer_size: int = 1024, metrics=None):
+        """
+        Create a new FrameReader.
+        :param conn_socket: socket to read frames from.
+        :param buffer_size: initial size of the receive buffer in bytes.
+        :param metrics: ConnectionMetrics to count into, or None for none.
+        """
+        self.conn_socket = conn_socket
+        self.metrics = metrics
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0                  # First unconsumed byte in buffer
+        self.end = 0                    # One past the last received byte
+        self.flags = b""                # Header flags of the last frame
+        self.opcode = None              # Opcode of the last typed frame
+        self.sequence = None            # Sequence id of the last typed frame
+
+    def pending(self) -> int:
+        """
+        :return: number of received bytes not yet returned in a frame.
+        """
+        return self.end - self.start
+
+    def has_frame(self) -> bool:
+        """
+        Check if a complete frame is already buffered, so it can be read
+        without touching the socket.
+        :return: True if a full frame is buffered, else False.
+        """
+        if self.pending() and self.buffer[self.start] == self.TYPED_VERSION:
+            return self.pending() >= self.TYPED_HEADER.size and \
+                self.pending() - self.TYPED_HEADER.size >= \
+                self.check_length(self.TYPED_HEADER.unpack_from(
+                    self.buffer, self.start)[4])
+        header_end = self.find_header_end()
+        return header_end is not None and \
+            self.end - header_end - 1 >= self.parse_header(header_end)[0]
+
+    def find_header_end(self) -> Union[int, None]:
+        """
+        Locate the delimiter closing the length header of the next frame.
+        :return: index of the closing delimiter, or None if not received yet.
+        """
+        if self.pending() < 1:
+            return None
+        if self.buffer[self.start] != self.DELIMITER[0]:
+            raise ValueError("read_incoming_data: missing valid start token")
+        header_end = self.buffer.find(
+            self.DELIMITER, self.start + 1,
+            min(self.end, self.start + self.MAX_HEADER + 2))
+        if header_end < 0 and self.pending() >= self.MAX_HEADER + 2:
+            raise ValueError("read_incoming_data: header too long")
+        return None if header_end < 0 else header_end
+
+    def parse_header(self, header_end: int) -> tuple[int, bytes]:
+        """
+        :param header_end: index of the delimiter closing the length header.
+        :return: payload length in bytes and flags given by the header.
+        """
+        return parse_header(self.buffer[self.start + 1:header_end])
+
+    @classmethod
+    def check_length(cls, length: int) -> int:
+        """
+        :param length: payload length announced by a frame header.
+        :return: the same length, once it is known to be allowed.
+        :raises ValueError: if the length is over MAX_FRAME.
+        """
+        if length > cls.MAX_FRAME:
+            raise ValueError("check_length: frame too large")
+        return length
+
+    def fill(self) -> int:
+        """
+        Receive more bytes into the free end of the buffer, compacting or
+        growing the buffer first if it is full.
+        :return: number of bytes received, 0 if the peer closed.
+        """
+        if self.end == len(self.buffer):
+            if self.start > 0:
+                # Move unconsumed bytes to the front
+                pending = self.pending()
+                self.buffer[:pending] = self.view[self.start:self.end]
+                self.start, self.end = 0, pending
+            else:
+                self.view.release()
+                self.buffer.extend(bytes(len(self.buffer)))
+                self.view = memoryview(self.buffer)
+        received = self.conn_socket.recv_into(self.view[self.end:])
+        self.end += received
+        if self.metrics is not None:
+            self.metrics.recv_calls += 1
+            self.metrics.bytes_in += received
+        return received
+
+    def read_header(self) -> Union[int, None]:
+        """
+        Block until the header of the next frame is received, then consume
+        it. Sets flags, and opcode and sequence for typed frames.
+        :return: payload length in bytes, or None if the peer closed.
+        """
+        while not self.pending():
+            if not self.fill():
+                return None
+
+        if self.buffer[self.start] == self.TYPED_VERSION:
+            while self.pending() < self.TYPED_HEADER.size:
+                if not self.fill():
+                    return None
+            _, self.opcode, flag_bits, self.sequence, length = \
+                self.TYPED_HEADER.unpack_from(self.buffer, self.start)
+            self.check_length(length)
+            self.flags = self.COMPRESSED \
+                if flag_bits & self.TYPED_COMPRESSED else b""
+            self.start += self.TYPED_HEADER.size
+            return length
+
+        header_end = self.find_header_end()
+        while header_end is None:
+            if not self.fill():
+                return None
+            header_end = self.find_header_end()
+        length, self.flags = self.parse_header(header_end)
+        self.opcode = self.sequence = None
+        self.start = header_end + 1
+        return length
+
+    def read_frame(self) -> Union[bytearray, None]:
+        """
+        Block until a whole frame is received.
+        :return: payload of the frame, or None if the peer closed.
+        """
+        length = self.read_header()
+        if length is None:
+            return None
+        metrics = self.metrics
+        started = metrics is not None and time.perf_counter_ns()
+        if self.COMPRESSED in self.flags:
+            payload = self.read_compressed(length)
+            metrics is not None and payload is not None and \
+                self.count_frame(started)
+            return payload
+
+        # Take what is already buffered, then receive the rest in place
+        payload = bytearray(length)
+        payload_view = memoryview(payload)
+        received = min(length, self.pending())
+        payload_view[:received] = self.view[self.start:self.start + received]
+        self.start += received
+        while received < length:
+            count = self.conn_socket.recv_into(payload_view[received:])
+            if not count:
+                return None
+            received += count
+            metrics is not None and self.count_partial_read(count)
+
+        if self.start == self.end:
+            self.start = self.end = 0
+        metrics is not None and self.count_frame(started)
+        return payload
+
+    def read_compressed(self, length: int) -> Union[bytearray, None]:
+        """
+        Receive a zlib payload, decompressing each chunk as it arrives.
+        :param length: compressed payload length in bytes.
+        :return: decompressed payload, or None if the peer closed.
+        :raises ValueError: if the payload is not valid zlib data or
+            decompresses to more than MAX_INFLATED bytes.
+        """
+        decompressor = zlib.decompressobj()
+        payload = bytearray()
+
+        def inflate(data) -> None:
+            # Stop one byte past the limit, so going over it is detected
+            try:
+                payload.extend(decompressor.decompress(
+                    data, self.MAX_INFLATED - len(payload) + 1))
+            except zlib.error as error:
+                raise ValueError(f"read_compressed: {error}") from error
+            if len(payload) > self.MAX_INFLATED:
+                raise ValueError("read_compressed: payload too large")
+
+        # Take what is already buffered
+        received = min(length, self.pending())
+        inflate(self.view[self.start:self.start + received])
+        self.start += received
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        # The buffer is now empty, so reuse it for the rest of the frame
+        while received < length:
+            count = self.conn_socket.recv_into(
+                self.view, min(length - received, len(self.buffer)))
+            if not count:
+                return None
+            self.metrics is not None and self.count_partial_read(count)
+            inflate(self.view[:count])
+            received += count
+        payload += decompressor.flush()
+        return payload
+
+    def count_partial_read(self, count: int) -> None:
+        """
+        Count a recv made because a frame's payload was not all buffered.
+        :param count: bytes received.
+        """
+        self.metrics.recv_calls += 1
+        self.metrics.partial_reads += 1
+        self.metrics.bytes_in += count
+
+    def count_frame(self, started: int) -> None:
+        """
+        Count a completed frame and how long its payload took to arrive.
+        :param started: perf_counter_ns when the header was parsed.
+        """
+        self.metrics.frames_in += 1
+        self.metrics.framing.record(time.perf_counter_ns() - started)
+
+
+class FrameWriter:
+    """
+    Queues outgoing frames for a socket and sends them together. Each frame
+    is queued as separate header and payload buffers, and queued buffers go
+    out in one scatter-gather sendmsg call without being joined or sliced.
+    """
+
+    # CONSTANTS
+    HIGH_WATER = 1 << 20                        # Queued bytes before flushing
+    MAX_BUFFERS = 1024                          # Buffers per sendmsg (IOV_MAX)
+
+    def __init__(self, conn_socket, high_water: int = HIGH_WATER,
+                 nodelay: bool = False, metrics=None):
+        """
+        Create a new FrameWriter.
+        :param conn_socket: socket to send frames to.
+        :param high_water: queued bytes at which enqueue blocks to flush.
+        :param nodelay: set True to disable Nagle's algorithm on the socket,
+            so flushed frames leave immediately.
+        :param metrics: ConnectionMetrics to count into, or None for none.
+        """
+        self.conn_socket = conn_socket
+        self.metrics = metrics
+        self.high_water = high_water
+        self.compress_threshold = None          # Set once peer agrees
+        self.sequence = 0                       # Id of the last typed frame
+        self.replay = None                      # ReplayBuffer, if resumable
+        self.buffers = deque()                  # memoryviews waiting to send
+        self.queued_bytes = 0
+        nodelay and conn_socket.setsockopt(socket.IPPROTO_TCP,
+                                           socket.TCP_NODELAY, 1)
+
+    def enqueue(self, payload: bytes, flush: bool = False) -> None:
+        """
+        Queue one frame, compressed if compression is on and the payload is
+        over the threshold. Blocks to flush if the high-water mark is passed.
+        :param payload: bytes to frame and send.
+        :param flush: set True to send everything queued now.
+        """
+        payload, is_compressed = self.compress(payload)
+        self.enqueue_parts([payload],
+                           FrameReader.COMPRESSED if is_compressed else b"",
+                           flush)
+
+    def enqueue_typed(self, opcode: int, payload: bytes = b"",
+                      flush: bool = False) -> int:
+        """
+        Queue one typed frame with the next sequence id, compressed the same
+        way as enqueue.
+        :param opcode: message type of the frame.
+        :param payload: bytes to frame and send.
+        :param flush: set True to send everything queued now.
+        :return: sequence id given to the frame.
+        """
+        payload, is_compressed = self.compress(payload)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        header = FrameReader.TYPED_HEADER.pack(
+            FrameReader.TYPED_VERSION, opcode,
+            FrameReader.TYPED_COMPRESSED if is_compressed else 0,
+            self.sequence, len(payload))
+        self.enqueue_raw(header, [payload], flush)
+        return self.sequence
+
+    def compress(self, payload: bytes) -> tuple[bytes, bool]:
+        """
+        Compress a payload if compression is on, the payload is over the
+        threshold and compressing makes it smaller.
+        :param payload: bytes to send.
+        :return: payload to send and True if it was compressed.
+        """
+        if self.compress_threshold is not None \
+                and len(payload) > self.compress_threshold:
+            compressed = zlib.compress(payload)
+            if len(compressed) < len(payload):
+                return compressed, True
+        return payload, False
+
+    def enqueue_parts(self, parts: list, flags: bytes = b"",
+                      flush: bool = False) -> None:
+        """
+        Queue one frame whose payload is split across several buffers. The
+        buffers are sent as they are, without being joined.
+        :param parts: bytes-like pieces of the payload, in order.
+        :param flags: header flag letters describing the payload.
+        :param flush: set True to send everything queued now.
+        """
+        self.enqueue_raw(encode_header(sum(len(part) for part in parts),
+                                       flags), parts, flush)
+
+    def enqueue_control(self, payload: bytes) -> None:
+        """
+        Send a frame that only means something on this connection, such as a
+        heartbeat, now. It is kept out of the replay buffer, so it is never
+        sent again on a resumed session.
+        :param payload: bytes to frame and send.
+        """
+        self.enqueue_raw(encode_header(len(payload)), [payload], True, False)
+
+    def enqueue_raw(self, header: bytes, parts: list, flush: bool = False,
+                    replay: bool = True) -> None:
+        """
+        Queue one frame whose header is already encoded.
+        :param header: encoded header of the frame.
+        :param parts: bytes-like pieces of the payload, in order.
+        :param flush: set True to send everything queued now.
+        :param replay: set False to keep the frame out of the replay buffer.
+        """
+        replay and self.replay is not None and \
+            self.replay.append(b"".join([header, *parts]))
+        self.buffers.append(memoryview(header))
+        self.buffers.extend(memoryview(part) for part in parts if len(part))
+        self.queued_bytes += len(header) + sum(len(part) for part in parts)
+        if self.metrics is not None:
+            self.metrics.frames_out += 1
+        if flush or self.queued_bytes >= self.high_water:
+            self.flush()
+
+    def resend(self, frames: list[bytes]) -> None:
+        """
+        Send frames from the replay buffer again, after a session resumed on
+        this writer's connection.
+        :param frames: encoded frames, oldest first.
+        """
+        self.buffers.extend(memoryview(frame) for frame in frames)
+        self.queued_bytes += sum(len(frame) for frame in frames)
+        if self.metrics is not None:
+            self.metrics.frames_out += len(frames)
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Send every queued buffer, several frames per system call. If the
+        connection fails and there is a replay buffer, the queued frames are
+        dropped instead of raising, as they are sent again once the session
+        resumes.
+        """
+        while self.buffers:
+            try:
+                if hasattr(self.conn_socket, "sendmsg"):
+                    sent = self.conn_socket.sendmsg(
+                        islice(self.buffers, self.MAX_BUFFERS))
+                else:
+                    sent = self.conn_socket.send(self.buffers[0])
+            except OSError:
+                if self.replay is None:
+                    raise
+                self.buffers.clear()
+                self.queued_bytes = 0
+                return
+            self.queued_bytes -= sent
+            if self.metrics is not None:
+                self.metrics.send_calls += 1
+                self.metrics.bytes_out += sent
+
+            # Drop sent buffers and trim a partly sent one without copying
+            while sent:
+                head = self.buffers[0]
+                if sent < len(head):
+                    self.buffers[0] = head[sent:]
+                    break
+                sent -= len(head)
+                self.buffers.popleft()
+
+
+class ReplayBuffer:
+    """
+    Keeps the latest frames sent on a resumable session, numbered by their
+    place in the stream, so the frames a dropped connection lost can be sent
+    again on the next one. The oldest frames are dropped once there are more
+    than max_frames of them or they add up to more than max_bytes.
+    """
+
+    # CONSTANTS
+    MAX_FRAMES = 256
+    MAX_BYTES = 1 << 18                         # 256 KiB
+
+    def __init__(self, max_frames: int = MAX_FRAMES,
+                 max_bytes: int = MAX_BYTES):
+        """
+        Create an empty ReplayBuffer.
+        :param max_frames: most frames kept.
+        :param max_bytes: most bytes kept.
+        """
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.frames = deque()
+        self.sequence = 0                       # Number of the last frame
+        self.size = 0                           # Bytes kept
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def append(self, frame: bytes) -> int:
+        """
+        Keep a frame just sent.
+        :param frame: encoded frame, header included.
+        :return: sequence number of the frame, counting from 1.
+        """
+        self.frames.append(frame)
+        self.size += len(frame)
+        self.sequence += 1
+        while len(self.frames) > self.max_frames or self.size > self.max_bytes:
+            self.size -= len(self.frames.popleft())
+        return self.sequence
+
+    def since(self, sequence: int) -> Union[list[bytes], None]:
+        """
+        :param sequence: number of the last frame the peer received.
+        :return: frames sent after it, oldest first, or None if some of them
+            were already dropped.
+        """
+        missed = self.sequence - sequence
+        if not 0 <= missed <= len(self.frames):
+            return None
+        return list(islice(self.frames, len(self.frames) - missed, None))
+
+
+def encode_header(length: int, flags: bytes = b"") -> bytes:
+    """
+    Build the length header that precedes a payload.
+    :param length: payload length in bytes.
+    :param flags: header flag letters describing the payload.
+    :return: header bytes.
+    """
+    return b"%b%d%b%b" % (FrameReader.DELIMITER, length, flags,
+                          FrameReader.DELIMITER)
+
+
+def parse_header(header: bytes) -> tuple[int, bytes]:
+    """
+    Split the inside of a length header into its length and flag letters.
+    :param header: bytes between the header delimiters.
+    :return: payload length in bytes and flags.
+    :raises ValueError: if the length is missing or over MAX_FRAME.
+    """
+    flags = header.lstrip(b"0123456789")
+    return FrameReader.check_length(int(header[:len(header) - len(flags)])), \
+        bytes(flags)
+
+
+async def read_frame_async(reader, metrics=None) \
+        -> Union[tuple[bytes, bytes], None]:
+    """
+    Read one frame from an asyncio stream, leaving the payload as it was sent.
+    :param reader: asyncio.StreamReader to read from.
+    :param metrics: ConnectionMetrics to count into, or None for none.
+    :return: header flags and payload of the frame, or None if the peer
+        closed. For a typed frame the flags are its whole binary header, so
+        it can be forwarded unchanged.
+    :raises ValueError: if the header is malformed or announces more than
+        FrameReader.MAX_FRAME bytes.
+    """
+    try:
+        start = await reader.readexactly(1)
+        if start[0] == FrameReader.TYPED_VERSION:
+            header = await reader.readexactly(
+                FrameReader.TYPED_HEADER.size - 1)
+            flags = start + header
+            length = FrameReader.check_length(
+                FrameReader.TYPED_HEADER.unpack(flags)[4])
+        elif start != FrameReader.DELIMITER:
+            raise ValueError("read_frame_async: missing valid start token")
+        else:
+            header = await reader.readuntil(FrameReader.DELIMITER)
+            if len(header) > FrameReader.MAX_HEADER + 1:
+                raise ValueError("read_frame_async: header too long")
+            length, flags = parse_header(header[:-1])
+        started = metrics is not None and time.perf_counter_ns()
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    if metrics is not None:
+        metrics.frames_in += 1
+        metrics.bytes_in += 1 + len(header) + length
+        metrics.framing.record(time.perf_counter_ns() - started)
+    return flags, payload
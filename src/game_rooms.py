@@ -0,0 +1,182 @@
+from collections import deque
+from typing import Union
+from tic_tac_toe import TicTacToeGame
+
+
+class GameRoom:
+    """
+    Defines data members for one server-side game between two players.
+    """
+    __slots__ = "room_id", "game", "players", "game_id", "turn_timer"
+
+    def __init__(self, room_id: int, player_x, player_o, size: int = 3,
+                 win_length: int = 3) -> None:
+        """
+        Initializes a room with a new game.
+        :param room_id: key of the room in its GameRoomManager.
+        :param player_x: session playing X.
+        :param player_o: session playing O.
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        """
+        self.room_id = room_id
+        self.game = TicTacToeGame(size, win_length)
+        self.players = player_x, player_o
+        self.game_id = None                     # Id of the game in a journal
+        self.turn_timer = None                  # Move deadline, if any
+
+    def symbol_of(self, player) -> str:
+        """
+        :param player: session in the room.
+        :return: X or O of the session.
+        """
+        return TicTacToeGame.SYMBOLS[self.players.index(player)]
+
+
+class MatchmakingQueue:
+    """
+    Pairs waiting players in arrival order, separately for each board shape.
+    """
+    def __init__(self) -> None:
+        """
+        Initializes an empty queue.
+        """
+        self.waiting = {}               # (size, win_length) -> deque of players
+        self.queued = {}                # Player -> (size, win_length)
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    def enqueue(self, player, board_params: tuple[int, int]) \
+            -> Union[tuple, None]:
+        """
+        Add a player, pairing them with the longest waiting player who wants
+        the same board.
+        :param player: session to queue.
+        :param board_params: (size, win_length) wanted.
+        :return: (first player, new player) if matched, else None.
+        """
+        self.remove(player)
+        waiting = self.waiting.setdefault(board_params, deque())
+        if waiting:
+            opponent = waiting.popleft()
+            del self.queued[opponent]
+            waiting or self.waiting.pop(board_params)
+            return opponent, player
+        waiting.append(player)
+        self.queued[player] = board_params
+        return None
+
+    def remove(self, player) -> bool:
+        """
+        Take a player out of the queue if they are in it.
+        :param player: session to remove.
+        :return: True if the player was queued, else False.
+        """
+        board_params = self.queued.pop(player, None)
+        if board_params is None:
+            return False
+        waiting = self.waiting[board_params]
+        waiting.remove(player)
+        waiting or self.waiting.pop(board_params)
+        return True
+
+
+class GameRoomManager:
+    """
+    Holds every game running on the server, keyed by room id, and validates
+    each move once on behalf of both players.
+    """
+    def __init__(self, journal=None) -> None:
+        """
+        Initializes a manager with no rooms.
+        :param journal: JournalWriter to record games in, or None.
+        """
+        self.journal = journal
+        self.rooms = {}                 # room_id -> GameRoom
+        self.player_rooms = {}          # Player -> GameRoom
+        self.queue = MatchmakingQueue()
+        self.next_room_id = 1
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def room_of(self, player) -> Union[GameRoom, None]:
+        """
+        :param player: session to look up.
+        :return: room the player is in, or None.
+        """
+        return self.player_rooms.get(player)
+
+    def find_match(self, player, board_params: tuple[int, int]) \
+            -> Union[GameRoom, None]:
+        """
+        Queue a player for a game, opening a room once matched. The player who
+        waited longest plays X.
+        :param player: session looking for a game.
+        :param board_params: (size, win_length) wanted.
+        :return: new room if matched, else None.
+        """
+        match = self.queue.enqueue(player, board_params)
+        if match is None:
+            return None
+        return self.open_room(*match, board_params)
+
+    def open_room(self, player_x, player_o, board_params: tuple[int, int]) \
+            -> GameRoom:
+        """
+        Open a room for two players matched for a game.
+        :param player_x: session playing X.
+        :param player_o: session playing O.
+        :param board_params: (size, win_length) of the board.
+        :return: new room.
+        """
+        room = GameRoom(self.next_room_id, player_x, player_o, *board_params)
+        self.next_room_id += 1
+        self.rooms[room.room_id] = room
+        for room_player in room.players:
+            self.player_rooms[room_player] = room
+        if self.journal is not None:
+            room.game_id = self.journal.record_game_start(*board_params)
+        return room
+
+    def make_move(self, player, row: int, col: int) -> int:
+        """
+        Validate and make a move for a player, closing the room if it ends
+        the game.
+        :param player: session making the move.
+        :param row: first-level index of board to be marked.
+        :param col: second-level index of board to be marked.
+        :return: TicTacToeGame validation code of the move.
+        """
+        room = self.player_rooms[player]
+        symbol = room.symbol_of(player)
+        room.game.make_move(symbol, row, col) and self.journal is not None \
+            and self.journal.record_move(room.game_id, symbol, row, col)
+        room.game.status > TicTacToeGame.S_O_TURN and self.close_room(room)
+        return room.game.validation
+
+    def quit(self, player) -> Union[GameRoom, None]:
+        """
+        End the player's game as a quit by that player, or take them out of
+        the matchmaking queue.
+        :param player: session leaving.
+        :return: room that was closed, or None.
+        """
+        self.queue.remove(player)
+        room = self.player_rooms.get(player)
+        if room is None:
+            return None
+        room.game.quit(room.symbol_of(player))
+        self.close_room(room)
+        return room
+
+    def close_room(self, room: GameRoom) -> None:
+        """
+        Forget a finished room.
+        :param room: room to close.
+        """
+        self.rooms.pop(room.room_id, None) and self.journal is not None \
+            and self.journal.record_game_end(room.game_id, room.game.status)
+        for player in room.players:
+            self.player_rooms.pop(player, None)
@@ -0,0 +1,253 @@
+import os
+import mmap
+import time
+import struct
+import threading
+from typing import Iterator
+from tic_tac_toe import TicTacToeGame
+
+
+class JournalWriter:
+    """
+    Appends timestamped binary records of frames and game moves to a
+    directory of journal segments. Records are packed into an in-memory
+    batch by the caller and written by a background thread, so recording
+    never waits on the disk. A new segment is started once the current one
+    passes the segment size.
+
+    Each segment starts with MAGIC, followed by records of a RECORD header
+    (time, kind, payload length) and the payload.
+    """
+    # CONSTANTS
+    MAGIC = b"TTJ1"                             # Segment header and version
+    RECORD = struct.Struct("!dBI")              # Time, kind, payload length
+    FRAME_IN, FRAME_OUT, GAME_START, MOVE, GAME_END = range(1, 6)  # Kinds
+    FRAME = struct.Struct("!B")                 # Opcode, 0 for text frames
+    START = struct.Struct("!IBB")               # Game id, size, win length
+    PLAY = struct.Struct("!IBBB")               # Game id, symbol, row, col
+    END = struct.Struct("!IB")                  # Game id, status
+    SEGMENT_SIZE = 64 << 20                     # Bytes before rotating
+    BATCH_SIZE = 64 << 10                       # Bytes that wake the writer
+    FLUSH_INTERVAL = 0.5                        # Seconds between writes
+    SUFFIX = ".journal"
+
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        """
+        Start a journal in the given directory, after any segments already
+        there.
+        :param directory: directory holding the segments.
+        :param segment_size: bytes written to a segment before rotating.
+        :param flush_interval: longest time in seconds a record waits in
+            memory before it is written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        paths = segment_paths(directory)
+        self.segment_index = 0 if not paths else \
+            int(os.path.basename(paths[-1])[:-len(self.SUFFIX)]) + 1
+        self.segment = None                     # Open segment file
+        self.segment_bytes = 0
+        self.pending = bytearray()              # Records not yet written
+        self.lock = threading.Lock()            # Guards pending
+        self.write_lock = threading.Lock()      # Guards the segment
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.next_game_id = 1
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def append(self, kind: int, payload: bytes) -> None:
+        """
+        Add one record to the batch waiting to be written.
+        :param kind: kind of record.
+        :param payload: bytes of the record.
+        """
+        header = self.RECORD.pack(time.time(), kind, len(payload))
+        with self.lock:
+            self.pending += header
+            self.pending += payload
+            is_full = len(self.pending) >= self.BATCH_SIZE
+        is_full and self.wakeup.set()
+
+    def record_frame(self, kind: int, opcode: int, payload: bytes) -> None:
+        """
+        :param kind: FRAME_IN or FRAME_OUT.
+        :param opcode: opcode of a typed frame, 0 for a text frame.
+        :param payload: payload of the frame.
+        """
+        self.append(kind, self.FRAME.pack(opcode) + payload)
+
+    def record_game_start(self, size: int, win_length: int) -> int:
+        """
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        :return: id to record the game's moves under.
+        """
+        game_id, self.next_game_id = self.next_game_id, self.next_game_id + 1
+        self.append(self.GAME_START, self.START.pack(game_id, size,
+                                                     win_length))
+        return game_id
+
+    def record_move(self, game_id: int, symbol: str, row: int,
+                    col: int) -> None:
+        """
+        :param game_id: id given by record_game_start.
+        :param symbol: X or O of the player who moved.
+        :param row: first-level index of the marked square.
+        :param col: second-level index of the marked square.
+        """
+        self.append(self.MOVE, self.PLAY.pack(
+            game_id, TicTacToeGame.SYMBOLS.index(symbol), row, col))
+
+    def record_game_end(self, game_id: int, status: int) -> None:
+        """
+        :param game_id: id given by record_game_start.
+        :param status: final TicTacToeGame status code.
+        """
+        self.append(self.GAME_END, self.END.pack(game_id, status))
+
+    def run(self) -> None:
+        """
+        Write batches until the journal is closed. Runs on the writer thread.
+        """
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.write_pending()
+            if self.closed:
+                return
+
+    def write_pending(self) -> None:
+        """
+        Write the waiting batch to the current segment, rotating first if it
+        is full. Records are never split across segments. Normally runs on
+        the writer thread, but may be called to write immediately.
+        """
+        with self.write_lock:
+            with self.lock:
+                batch, self.pending = self.pending, bytearray()
+            if not batch:
+                return
+            if self.segment is None \
+                    or self.segment_bytes >= self.segment_size:
+                self.rotate()
+            self.segment.write(batch)
+            self.segment.flush()
+            self.segment_bytes += len(batch)
+
+    def rotate(self) -> None:
+        """
+        Close the current segment and start the next one.
+        """
+        self.segment is not None and self.segment.close()
+        path = os.path.join(self.directory,
+                            f"{self.segment_index:08d}{self.SUFFIX}")
+        self.segment_index += 1
+        self.segment = open(path, "xb")
+        self.segment.write(self.MAGIC)
+        self.segment_bytes = len(self.MAGIC)
+
+    def close(self) -> None:
+        """
+        Write every waiting record and stop the writer thread.
+        """
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        self.write_pending()                    # Appended during the last write
+        self.segment is not None and self.segment.close()
+
+
+class JournalReader:
+    """
+    Reads the records of a journal directory through memory maps, oldest
+    segment first. A record cut short by a crash ends its segment.
+    """
+    def __init__(self, directory: str):
+        """
+        :param directory: directory holding the segments.
+        """
+        self.directory = directory
+
+    def records(self) -> Iterator[tuple[float, int, bytes]]:
+        """
+        :return: iterator of (time, kind, payload) for every record.
+        """
+        for path in segment_paths(self.directory):
+            with open(path, "rb") as segment:
+                if os.fstat(segment.fileno()).st_size <= \
+                        len(JournalWriter.MAGIC):
+                    continue
+                with mmap.mmap(segment.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mapping:
+                    if mapping[:len(JournalWriter.MAGIC)] != \
+                            JournalWriter.MAGIC:
+                        raise ValueError(f"Not a journal segment: {path}")
+                    yield from self.segment_records(mapping)
+
+    @staticmethod
+    def segment_records(mapping: mmap.mmap) \
+            -> Iterator[tuple[float, int, bytes]]:
+        """
+        :param mapping: mapped segment, already checked for MAGIC.
+        :return: iterator of (time, kind, payload) for the segment.
+        """
+        offset = len(JournalWriter.MAGIC)
+        header_size = JournalWriter.RECORD.size
+        while offset + header_size <= len(mapping):
+            timestamp, kind, length = JournalWriter.RECORD.unpack_from(
+                mapping, offset)
+            offset += header_size
+            if offset + length > len(mapping):
+                return
+            yield timestamp, kind, mapping[offset:offset + length]
+            offset += length
+
+    def messages(self) -> Iterator[tuple[float, int, int, bytes]]:
+        """
+        :return: iterator of (time, FRAME_IN or FRAME_OUT, opcode, payload)
+            for every frame recorded.
+        """
+        frame_size = JournalWriter.FRAME.size
+        for timestamp, kind, payload in self.records():
+            if kind in (JournalWriter.FRAME_IN, JournalWriter.FRAME_OUT):
+                yield timestamp, kind, payload[0], payload[frame_size:]
+
+    def games(self) -> list[TicTacToeGame]:
+        """
+        Rebuild every game recorded, finished or not. Game ids restart with
+        each JournalWriter, so an id refers to the latest game started
+        under it.
+        :return: games in the order they started.
+        """
+        games = []
+        active = {}                     # Game id -> TicTacToeGame
+        for _, kind, payload in self.records():
+            if kind == JournalWriter.GAME_START:
+                game_id, size, win_length = JournalWriter.START.unpack(payload)
+                active[game_id] = TicTacToeGame(size, win_length)
+                games.append(active[game_id])
+            elif kind == JournalWriter.MOVE:
+                game_id, symbol, row, col = JournalWriter.PLAY.unpack(payload)
+                game_id in active and active[game_id].make_move(
+                    TicTacToeGame.SYMBOLS[symbol], row, col)
+            elif kind == JournalWriter.GAME_END:
+                game_id, status = JournalWriter.END.unpack(payload)
+                if game_id in active:
+                    active.pop(game_id).status = status
+        return games
+
+
+def segment_paths(directory: str) -> list[str]:
+    """
+    :param directory: directory holding the segments.
+    :return: paths of the journal segments in the directory, oldest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in
+            sorted(os.listdir(directory))
+            if name.endswith(JournalWriter.SUFFIX)]
@@ -0,0 +1,422 @@
+import json
+import time
+import random
+import asyncio
+from typing import Union
+from chat_interface import ChatInterface
+from framing import read_frame_async
+from metrics import LatencyHistogram
+try:
+    import resource
+except ImportError:
+    resource = None                             # Not available on Windows
+
+
+class LoadReport:
+    """
+    Totals of one load run: messages and bytes each way, errors by kind, and
+    for each kind of action the server round trip: the time from sending it
+    until the server answered a ping sent right behind it. The partner's
+    think time is left out, as the server answers pings itself.
+    """
+    # CONSTANTS
+    CONNECT, CLOSED, TIMEOUT, REFUSED = ERRORS = (
+        "connect",                              # Could not connect
+        "closed",                               # Connection closed early
+        "timeout",                              # Partner did not reply
+        "refused")                              # Own message not sendable
+
+    def __init__(self):
+        """
+        Initializes an empty report, timed from now.
+        """
+        self.started = time.monotonic()
+        self.finished = None
+        self.users = 0                  # Users that connected
+        self.sent = 0
+        self.received = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.games = 0                  # Games played to the end
+        self.errors = dict.fromkeys(self.ERRORS, 0)
+        self.latency = {}               # Action -> LatencyHistogram
+
+    def record(self, action: str, duration_ns: int) -> None:
+        """
+        Add one round trip time.
+        :param action: kind of action sent.
+        :param duration_ns: nanoseconds from sending to the server's pong.
+        """
+        histogram = self.latency.get(action)
+        if histogram is None:
+            histogram = self.latency[action] = LatencyHistogram()
+        histogram.record(duration_ns)
+
+    def to_dict(self) -> dict:
+        """
+        :return: summary of the run for JSON output.
+        """
+        seconds = (self.finished or time.monotonic()) - self.started
+        errors = sum(self.errors.values())
+        return {"users": self.users,
+                "seconds": seconds,
+                "sent": self.sent,
+                "received": self.received,
+                "messages_per_s": self.received / seconds,
+                "mb_per_s": (self.bytes_out + self.bytes_in) / seconds / 1e6,
+                "games": self.games,
+                "errors": self.errors,
+                "error_rate": errors / (self.sent + errors or 1),
+                "latency": {action: histogram.to_dict() for action, histogram
+                            in sorted(self.latency.items())}}
+
+    def summary(self) -> str:
+        """
+        :return: the report as lines of text for a terminal.
+        """
+        snapshot = self.to_dict()
+        lines = [f"{snapshot['users']} users for {snapshot['seconds']:.1f} s: "
+                 f"{snapshot['sent']} sent, {snapshot['received']} received, "
+                 f"{snapshot['games']} games",
+                 f"Throughput: {snapshot['messages_per_s']:.0f} messages/s, "
+                 f"{snapshot['mb_per_s']:.2f} MB/s",
+                 f"Errors: {snapshot['error_rate']:.2%} (" + ", ".join(
+                     f"{kind} {count}" for kind, count in self.errors.items())
+                 + ")",
+                 "Server round trip (bucket upper bounds):"]
+        lines += [f"  {action:<9} n={stats['count']} "
+                  f"mean={stats['mean_ns'] / 1e6:.2f} ms "
+                  f"p50<{stats['p50_ns'] / 1e6:.2f} ms "
+                  f"p99<{stats['p99_ns'] / 1e6:.2f} ms "
+                  f"p99.9<{stats['p999_ns'] / 1e6:.2f} ms"
+                  for action, stats in snapshot["latency"].items()]
+        return "\n".join(lines)
+
+
+class VirtualUser:
+    """
+    One scripted client of a multi-client server. A headless ChatInterface
+    keeps its chat and game state exactly as for a person typing, while the
+    frames go through asyncio streams so one loop can drive thousands of
+    users. Paired users take turns as in ChatInterface.chat: on its turn a
+    user answers a game request, moves in the game in progress, or starts
+    the next action of the mix.
+    """
+    # CONSTANTS
+    CHAT, HANDSHAKE, GAME = ACTIONS = "chat", "handshake", "game"
+    CONFIRM, MOVE, QUIT = "confirm", "move", "quit"     # Turns inside games
+
+    def __init__(self, generator, rng: random.Random) -> None:
+        """
+        :param generator: LoadGenerator running the user.
+        :param rng: random source for the user's choices.
+        """
+        self.generator = generator
+        self.report = generator.report
+        self.rng = rng
+        self.chatter = ChatInterface(None, headless=True, metrics=False)
+        self.quit_when_confirmed = False        # Set for handshakes
+        self.pending = None                     # Action and time sent
+        self.reader = self.writer = None        # Streams once connected
+
+    def next_message(self) -> tuple[str, str]:
+        """
+        Choose what to send on this user's turn.
+        :return: kind of action and message to send.
+        """
+        cli = self.chatter.cli
+        if cli.game_confirmed:
+            if self.quit_when_confirmed:
+                self.quit_when_confirmed = False
+                return self.QUIT, "/q"
+            row, col = self.rng.choice(
+                [(row, col) for row, cells in enumerate(cli.game.board)
+                 for col, cell in enumerate(cells) if cell == "_"])
+            return self.MOVE, f"{chr(97 + row)} {col}"
+        if cli.game_requested:
+            return self.CONFIRM, "/tac"
+
+        generator = self.generator
+        action = self.rng.choices(generator.actions, generator.weights)[0]
+        if action == self.CHAT:
+            return action, "x" * self.rng.choice(generator.sizes)
+        self.quit_when_confirmed = action == self.HANDSHAKE
+        return action, "/tic"
+
+    async def run(self, host: str, port: int, deadline: float) -> None:
+        """
+        Connect, take turns with the partner the server pairs this user with
+        until the deadline, then disconnect.
+        :param host: address of the server.
+        :param port: port of the server.
+        :param deadline: time.monotonic() at which to stop.
+        """
+        try:
+            self.reader, self.writer = \
+                await asyncio.open_connection(host, port)
+        except OSError:
+            self.report.errors[LoadReport.CONNECT] += 1
+            return
+        self.report.users += 1
+        try:
+            if not await self.await_role(deadline):
+                return
+            keep_going = True
+            while keep_going:
+                keep_going = await self.send_turn(deadline) \
+                    if self.chatter.state == ChatInterface.CHATTING \
+                    else await self.receive_turn(deadline)
+        except (ConnectionError, ValueError, UnicodeDecodeError):
+            self.count_error(LoadReport.CLOSED, deadline)
+        finally:
+            self.writer.close()
+
+    async def send_turn(self, deadline: float) -> bool:
+        """
+        Send this user's next message after its think time.
+        :param deadline: time.monotonic() at which to stop.
+        :return: True to keep going, False to stop.
+        """
+        think_time = self.generator.think_time
+        think_time and await asyncio.sleep(self.rng.uniform(0, 2 * think_time))
+        if time.monotonic() >= deadline:
+            return False
+        action, message = self.next_message()
+        if self.chatter.parse_for_command(message, True) is None:
+            self.report.errors[LoadReport.REFUSED] += 1
+            return False
+        if action == self.MOVE and not self.chatter.cli.game_confirmed:
+            self.report.games += 1                      # Move ended the game
+        frame = ChatInterface.encode_frame(message)
+        self.pending = action, time.perf_counter_ns()
+        self.writer.writelines([frame, self.generator.ping_frame])
+        self.report.sent += 1
+        self.report.bytes_out += len(frame)
+        self.chatter.state = ChatInterface.WAITING
+        await self.writer.drain()
+        return True
+
+    async def receive_turn(self, deadline: float) -> bool:
+        """
+        Wait for the partner's reply and handle it as a ChatInterface would.
+        :param deadline: time.monotonic() at which to stop.
+        :return: True to keep going, False to stop.
+        """
+        frame = await self.read_frame(deadline)
+        if frame is None:
+            return False
+        payload = frame[1]
+        self.report.received += 1
+        self.report.bytes_in += len(payload)
+        self.chatter.parse_for_command(payload.decode(), False)
+        if self.chatter.state == ChatInterface.TERMINATE:
+            return False
+        self.chatter.state = ChatInterface.CHATTING
+        return True
+
+    async def read_frame(self, deadline: float) \
+            -> Union[tuple[bytes, bytes], None]:
+        """
+        Wait for the next frame from the server other than a heartbeat,
+        counting an error if the connection closes or stays silent before
+        the deadline.
+        :param deadline: time.monotonic() at which to stop.
+        :return: header flags and payload, or None to stop.
+        """
+        timeout = min(self.generator.timeout, deadline - time.monotonic())
+        try:
+            frame = await asyncio.wait_for(self.read_message(),
+                                           max(timeout, 0))
+        except asyncio.TimeoutError:
+            self.count_error(LoadReport.TIMEOUT, deadline)
+            return None
+        frame is None and self.count_error(LoadReport.CLOSED, deadline)
+        return frame
+
+    async def read_message(self) -> Union[tuple[bytes, bytes], None]:
+        """
+        Read frames until one is not a heartbeat, answering heartbeats from
+        the server as a ChatInterface would. A pong ends the round trip of
+        the last action sent.
+        :return: header flags and payload, or None if the server closed.
+        """
+        while True:
+            frame = await read_frame_async(self.reader)
+            if frame is None or frame[0] or \
+                    frame[1] not in self.generator.heartbeats:
+                return frame
+            if frame[1] == self.generator.heartbeats[0]:
+                self.writer.write(self.generator.pong_frame)
+            elif self.pending is not None:
+                action, sent = self.pending
+                self.report.record(action, time.perf_counter_ns() - sent)
+                self.pending = None
+
+    async def await_role(self, deadline: float) -> bool:
+        """
+        Wait until the server pairs this user with a partner, as
+        ChatInterface.await_role does. Waiting past the deadline is not an
+        error, as the user count may be odd.
+        :param deadline: time.monotonic() at which to stop.
+        :return: True once paired, False to stop.
+        """
+        roles = {ChatInterface.ROLE_CHATTING: ChatInterface.CHATTING,
+                 ChatInterface.ROLE_WAITING: ChatInterface.WAITING}
+        while True:
+            try:
+                frame = await asyncio.wait_for(
+                    self.read_message(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                return False
+            if frame is None:
+                self.count_error(LoadReport.CLOSED, deadline)
+                return False
+            role = roles.get(frame[1].decode())
+            if role is not None:
+                self.chatter.state = role
+                return True
+            frame[1].startswith(ChatInterface.SESSION_OFFER.encode()) and \
+                self.writer.write(self.generator.decline_frame)
+
+    def count_error(self, kind: str, deadline: float) -> None:
+        """
+        Count an error, unless it only happened because the run is ending.
+        :param kind: one of LoadReport.ERRORS.
+        :param deadline: time.monotonic() at which the run stops.
+        """
+        if time.monotonic() < deadline:
+            self.report.errors[kind] += 1
+
+
+class LoadGenerator:
+    """
+    Runs many VirtualUsers on one event loop against a multi-client server,
+    so its capacity can be measured without real users. Users connect at a
+    steady rate, chat and play with their partners by the scripted mix of
+    actions until the run ends, and are summed into one LoadReport.
+    """
+    # CONSTANTS
+    DURATION = 30                               # Seconds of load
+    MIX = "chat=8,handshake=1,game=1"           # Weights of the actions
+    SIZES = "16,256,1024"                       # Chat message sizes in bytes
+    TIMEOUT = 10                                # Seconds to wait for a reply
+    CONNECT_RATE = 1000                         # New users per second
+    FD_MARGIN = 64                              # Descriptors kept for others
+
+    def __init__(self, host: str, port: int, users: int,
+                 duration: float = DURATION, mix: dict = None,
+                 sizes: list[int] = None, think_time: float = 0,
+                 timeout: float = TIMEOUT, seed: int = None) -> None:
+        """
+        :param host: address of the server.
+        :param port: port of the server.
+        :param users: number of virtual users.
+        :param duration: seconds to run for, including connecting.
+        :param mix: action -> relative weight, from parse_mix. Defaults to
+            MIX.
+        :param sizes: chat message sizes in bytes, picked at random. Defaults
+            to SIZES.
+        :param think_time: mean seconds a user waits before each message.
+        :param timeout: seconds to wait for a partner's reply before counting
+            a timeout.
+        :param seed: seed for repeatable scripts, or None.
+        """
+        mix = mix or self.parse_mix(self.MIX)
+        self.host = host
+        self.port = port
+        self.users = users
+        self.duration = duration
+        self.actions, self.weights = list(mix), list(mix.values())
+        self.sizes = sizes or self.parse_sizes(self.SIZES)
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.report = LoadReport()
+        self.heartbeats = (ChatInterface.HEARTBEAT_PING.encode(),
+                           ChatInterface.HEARTBEAT_PONG.encode())
+        self.ping_frame = ChatInterface.encode_frame(
+            ChatInterface.HEARTBEAT_PING)
+        self.pong_frame = ChatInterface.encode_frame(
+            ChatInterface.HEARTBEAT_PONG)
+        self.decline_frame = ChatInterface.encode_frame(
+            ChatInterface.SESSION_DECLINE)      # Users never resume
+
+    @staticmethod
+    def parse_mix(text: str) -> dict:
+        """
+        :param text: comma-separated action=weight pairs, e.g. MIX.
+        :return: action -> weight.
+        """
+        mix = {}
+        for item in text.split(","):
+            action, _, weight = item.partition("=")
+            if action not in VirtualUser.ACTIONS:
+                raise ValueError(f"Unknown action: {action}")
+            mix[action] = float(weight or 1)
+        if not any(weight > 0 for weight in mix.values()):
+            raise ValueError("No action has a positive weight")
+        return mix
+
+    @staticmethod
+    def parse_sizes(text: str) -> list[int]:
+        """
+        :param text: comma-separated message sizes in bytes, e.g. SIZES.
+        :return: sizes, each at least 1.
+        """
+        sizes = [int(size) for size in text.split(",")]
+        if any(size < 1 for size in sizes):
+            raise ValueError("Message sizes must be at least 1 byte")
+        return sizes
+
+    @classmethod
+    def raise_file_limit(cls, users: int) -> None:
+        """
+        Raise the soft limit on open files towards the hard limit when the
+        users need more descriptors than it allows.
+        :param users: number of virtual users, one descriptor each.
+        """
+        if resource is None:
+            return
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        needed = users + cls.FD_MARGIN
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            limit = needed if hard == resource.RLIM_INFINITY \
+                else min(needed, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+            limit < needed and print(f"Open file limit {limit} is below "
+                                     f"{needed}; some users cannot connect.")
+
+    async def run(self) -> LoadReport:
+        """
+        Run every user until the duration is over.
+        :return: report of the run.
+        """
+        self.report = LoadReport()
+        deadline = self.report.started + self.duration
+        tasks = []
+        for idx in range(self.users):
+            user = VirtualUser(self, random.Random(self.rng.random()))
+            tasks.append(asyncio.create_task(
+                user.run(self.host, self.port, deadline)))
+            idx % 100 == 99 and await asyncio.sleep(100 / self.CONNECT_RATE)
+        await asyncio.gather(*tasks)
+        self.report.finished = time.monotonic()
+        return self.report
+
+
+def main(host, port, users, duration=LoadGenerator.DURATION, mix=None,
+         sizes=None, think_time=0, report_path=None):
+    LoadGenerator.raise_file_limit(users)
+    generator = LoadGenerator(host, port, users, duration, mix, sizes,
+                              think_time)
+    print(f"Running {users} virtual users against {host} on port {port} "
+          f"for {duration} s...")
+    try:
+        report = asyncio.run(generator.run())
+    except KeyboardInterrupt:
+        report = generator.report
+        report.finished = time.monotonic()
+    print(report.summary())
+    if report_path:
+        with open(report_path, "w") as report_file:
+            json.dump(report.to_dict(), report_file, indent=2)
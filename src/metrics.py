@@ -0,0 +1,132 @@
+import os
+import json
+import time
+
+
+class LatencyHistogram:
+    """
+    Counts durations in power-of-two nanosecond buckets, so recording costs
+    one bit_length and one increment.
+    """
+    # CONSTANTS
+    BUCKETS = 64                        # Bucket i holds [2^(i-1), 2^i) ns
+
+    __slots__ = "buckets", "count", "total_ns"
+
+    def __init__(self):
+        """
+        Initializes an empty histogram.
+        """
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total_ns = 0
+
+    def record(self, duration_ns: int) -> None:
+        """
+        Add one duration.
+        :param duration_ns: duration in nanoseconds.
+        """
+        self.buckets[min(duration_ns.bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+
+    def merge(self, other) -> None:
+        """
+        Add every duration of another histogram to this one.
+        :param other: LatencyHistogram to add.
+        """
+        self.buckets = [mine + theirs for mine, theirs in
+                        zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total_ns += other.total_ns
+
+    def percentile(self, fraction: float) -> int:
+        """
+        :param fraction: percentile as a fraction, e.g. 0.99.
+        :return: upper bound in nanoseconds of the bucket holding it.
+        """
+        target = fraction * self.count
+        seen = 0
+        for idx, bucket in enumerate(self.buckets):
+            seen += bucket
+            if bucket and seen >= target:
+                return 1 << idx
+        return 0
+
+    def to_dict(self) -> dict:
+        """
+        :return: summary of the histogram for JSON output.
+        """
+        return {"count": self.count,
+                "mean_ns": self.total_ns // self.count if self.count else 0,
+                "p50_ns": self.percentile(0.50),
+                "p99_ns": self.percentile(0.99),
+                "p999_ns": self.percentile(0.999),
+                "buckets": {1 << idx: bucket for idx, bucket in
+                            enumerate(self.buckets) if bucket}}
+
+
+class ConnectionMetrics:
+    """
+    Counters and latency histograms for one connection, or for many merged
+    together. Hot paths update attributes directly and skip all of it when
+    they hold None instead of a ConnectionMetrics.
+    """
+    COUNTERS = ("bytes_in", "bytes_out", "frames_in", "frames_out",
+                "recv_calls", "partial_reads", "send_calls")
+
+    __slots__ = COUNTERS + ("framing", "dispatch", "started")
+
+    def __init__(self):
+        """
+        Initializes zeroed metrics.
+        """
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.framing = LatencyHistogram()       # Header to complete payload
+        self.dispatch = LatencyHistogram()      # Handling one frame
+        self.started = time.time()
+
+    def merge(self, other) -> None:
+        """
+        Add another connection's metrics to these.
+        :param other: ConnectionMetrics to add.
+        """
+        for counter in self.COUNTERS:
+            setattr(self, counter, getattr(self, counter)
+                    + getattr(other, counter))
+        self.framing.merge(other.framing)
+        self.dispatch.merge(other.dispatch)
+
+    def to_dict(self) -> dict:
+        """
+        :return: snapshot of the metrics for JSON output.
+        """
+        snapshot = {counter: getattr(self, counter)
+                    for counter in self.COUNTERS}
+        snapshot["uptime_s"] = time.time() - self.started
+        snapshot["recv_calls_per_frame"] = \
+            self.recv_calls / self.frames_in if self.frames_in else 0
+        snapshot["framing"] = self.framing.to_dict()
+        snapshot["dispatch"] = self.dispatch.to_dict()
+        return snapshot
+
+    def to_json(self) -> str:
+        """
+        :return: snapshot of the metrics as indented JSON.
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def dump(self, path: str, extra: dict = None) -> None:
+        """
+        Write a snapshot to a file, replacing it in one step so readers never
+        see a partly written file.
+        :param path: file to write.
+        :param extra: more fields to include at the top level.
+        """
+        snapshot = self.to_dict()
+        snapshot.update(extra or {})
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as stats_file:
+            json.dump(snapshot, stats_file, indent=2)
+        os.replace(temp_path, path)
@@ -0,0 +1,167 @@
+import os
+import mmap
+from array import array
+from typing import Union
+from tic_tac_toe import TicTacToeGame
+
+
+class OutcomeTable:
+    """
+    Game-theoretic value and best moves of every reachable 3x3 position,
+    stored in a compact file that is memory-mapped for O(1) lookups.
+
+    Positions are indexed by their base-3 digits, one per cell (0 empty,
+    1 X, 2 O). Each entry is an unsigned 16-bit integer: bits 0-8 mark the
+    best cells, bits 9-10 hold the outcome for the player to move and bit 15
+    is set if the position can be reached in play.
+    """
+    # CONSTANTS
+    OUTCOME_CODES = [
+        "LOSS",
+        "DRAW",
+        "WIN"
+    ]
+
+    LOSS, DRAW, WIN = range(3)
+
+    MAGIC = b"TTT1"                             # File header and version
+    CELLS = 9
+    ENTRIES = 3 ** CELLS
+    MOVES_MASK = (1 << CELLS) - 1
+    OUTCOME_SHIFT = 9
+    REACHABLE = 1 << 15
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "outcome_table.bin")
+
+    # Base-3 index contribution of each X bitboard; O is worth double
+    X_INDEX = tuple(sum(3 ** cell for cell in range(9) if marks >> cell & 1)
+                    for marks in range(1 << 9))
+
+    shared_table = None
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        """
+        Map the table file into memory, building it first if it is missing.
+        :param path: location of the table file.
+        """
+        if not self.is_valid_file(path):
+            self.build(path)
+        with open(path, "rb") as table_file:
+            self.mapping = mmap.mmap(table_file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        self.entries = memoryview(self.mapping)[len(self.MAGIC):].cast("H")
+
+    @classmethod
+    def shared(cls):
+        """
+        Fetch the table shared by the process, mapping it on first use.
+        :return: OutcomeTable for the default path.
+        """
+        if cls.shared_table is None:
+            cls.shared_table = cls()
+        return cls.shared_table
+
+    @classmethod
+    def is_valid_file(cls, path: str) -> bool:
+        """
+        Check if a table file exists with the expected header and size.
+        :param path: location of the table file.
+        :return: True if usable, else False.
+        """
+        try:
+            with open(path, "rb") as table_file:
+                header = table_file.read(len(cls.MAGIC))
+            return header == cls.MAGIC and os.path.getsize(path) == \
+                len(cls.MAGIC) + cls.ENTRIES * array("H").itemsize
+        except OSError:
+            return False
+
+    @classmethod
+    def build(cls, path: str = DEFAULT_PATH) -> int:
+        """
+        Enumerate every reachable position by solving the game from the empty
+        board, then write the table to disk.
+        :param path: location of the table file.
+        :return: number of reachable positions.
+        """
+        entries = array("H", bytes(cls.ENTRIES * array("H").itemsize))
+        windows = TicTacToeGame.get_win_masks(3, 3)
+        full_board = cls.MOVES_MASK
+
+        def solve(own: int, other: int, index: int, own_digit: int) -> int:
+            """
+            Fill in the entry of a position and every position after it.
+            :return: outcome for the player to move.
+            """
+            if entries[index]:
+                return entries[index] >> cls.OUTCOME_SHIFT & 3
+
+            best, best_moves = cls.LOSS, 0
+            if any(other & win == win for win in windows):
+                pass                            # Last move won the game
+            elif own | other == full_board:
+                best = cls.DRAW
+            else:
+                best = -1
+                for cell in range(cls.CELLS):
+                    if (own | other) >> cell & 1:
+                        continue
+                    child_index = index + own_digit * 3 ** cell
+                    outcome = 2 - solve(other, own | 1 << cell, child_index,
+                                        3 - own_digit)
+                    if outcome > best:
+                        best, best_moves = outcome, 0
+                    if outcome == best:
+                        best_moves |= 1 << cell
+
+            entries[index] = cls.REACHABLE | best << cls.OUTCOME_SHIFT \
+                | best_moves
+            return best
+
+        solve(0, 0, 0, 1)
+
+        # Write beside the target then swap in, so readers never see a part
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as table_file:
+            table_file.write(cls.MAGIC)
+            entries.tofile(table_file)
+        os.replace(temp_path, path)
+        return sum(1 for entry in entries if entry & cls.REACHABLE)
+
+    def lookup(self, x_marks: int, o_marks: int) -> Union[tuple[int, int], None]:
+        """
+        Find the outcome and best moves of a position.
+        :param x_marks: bitboard of X.
+        :param o_marks: bitboard of O.
+        :return: (outcome for player to move, bitmask of best cells), or
+            None if the position cannot be reached in play.
+        """
+        entry = self.entries[self.X_INDEX[x_marks] + 2 * self.X_INDEX[o_marks]]
+        if not entry & self.REACHABLE:
+            return None
+        return entry >> self.OUTCOME_SHIFT & 3, entry & self.MOVES_MASK
+
+    def best_moves(self, game: TicTacToeGame) -> list[tuple[int, int]]:
+        """
+        List the best squares for the player to move in a 3x3 game.
+        :param game: game to look up.
+        :return: list of (row, col), empty if the game is over.
+        """
+        result = self.lookup(*game.marks)
+        if result is None or game.status > TicTacToeGame.S_O_TURN:
+            return []
+        return [divmod(cell, 3) for cell in range(self.CELLS)
+                if result[1] >> cell & 1]
+
+    def outcome(self, game: TicTacToeGame) -> Union[int, None]:
+        """
+        :param game: 3x3 game to look up.
+        :return: outcome for the player to move, or None if unreachable.
+        """
+        result = self.lookup(*game.marks)
+        return None if result is None else result[0]
+
+
+if __name__ == '__main__':
+    count = OutcomeTable.build()
+    print(f"Wrote {count} positions to {OutcomeTable.DEFAULT_PATH}")
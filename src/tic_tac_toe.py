@@ -1,4 +1,5 @@
 from typing import Union
+from board_renderer import BoardRenderer
 
 
 class Player:
@@ -51,15 +52,135 @@ class TicTacToeGame:
 
     S_X_TURN, S_O_TURN, S_X_WON, S_O_WON, S_DRAW, S_X_QUIT, S_O_QUIT = range(7)
 
-    def __init__(self):
+    SYMBOLS = "X", "O"
+    MIN_SIZE, MAX_SIZE = 3, 26                  # Rows are labelled a to z
+    DIRECTIONS = (0, 1), (1, 0), (1, 1), (1, -1)    # HOZ _, VER |, DIAG \ /
+
+    # Win masks through each cell, and all win masks, by (size, win_length)
+    cell_masks_cache = {}
+    win_masks_cache = {}
+
+    __slots__ = "size", "win_length", "full_board", "cell_masks", \
+        "win_masks", "marks", "players", "status", "validation"
+
+    def __init__(self, size: int = 3, win_length: int = 3):
         """
         Initializes a game of Tic Tac Toe with two players.
-        """
-        self.board = [["_" for _ in range(3)] for _ in range(3)]
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        """
+        if not self.MIN_SIZE <= size <= self.MAX_SIZE \
+                or not self.MIN_SIZE <= win_length <= size:
+            raise ValueError(f"Invalid board: {size}x{size}, "
+                             f"{win_length} in a row")
+        self.size = size
+        self.win_length = win_length
+        self.full_board = (1 << size * size) - 1    # Every square marked
+        self.cell_masks = self.get_cell_masks(size, win_length)
+        self.win_masks = self.get_win_masks(size, win_length)
+        self.marks = [0, 0]                     # Bitboard per player, X first
         self.players = Player("X", self), Player("O", self)
         self.status = self.S_X_TURN             # Store current game status
         self.validation = self.V_PASSED         # Store last validation result
 
+    @classmethod
+    def get_cell_masks(cls, size: int, win_length: int) -> tuple:
+        """
+        Build, or fetch from cache, the winning lines through every cell.
+        Bit (row * size + col) is set for each square in a line.
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        :return: tuple indexed by cell of tuples of line masks.
+        """
+        key = size, win_length
+        if key in cls.cell_masks_cache:
+            return cls.cell_masks_cache[key]
+
+        cell_masks = [[] for _ in range(size * size)]
+        win_masks = []
+        for row in range(size):
+            for col in range(size):
+                for d_row, d_col in cls.DIRECTIONS:
+                    # Only build lines starting at (row, col) that fit
+                    end_row = row + d_row * (win_length - 1)
+                    end_col = col + d_col * (win_length - 1)
+                    if not (0 <= end_row < size and 0 <= end_col < size):
+                        continue
+                    cells = [(row + d_row * step) * size + col + d_col * step
+                             for step in range(win_length)]
+                    mask = sum(1 << cell for cell in cells)
+                    win_masks.append(mask)
+                    [cell_masks[cell].append(mask) for cell in cells]
+
+        cls.cell_masks_cache[key] = tuple(map(tuple, cell_masks))
+        cls.win_masks_cache[key] = tuple(win_masks)
+        return cls.cell_masks_cache[key]
+
+    @classmethod
+    def get_win_masks(cls, size: int, win_length: int) -> tuple:
+        """
+        Fetch every winning line of a board shape, each listed once.
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        :return: tuple of line masks.
+        """
+        cls.get_cell_masks(size, win_length)
+        return cls.win_masks_cache[size, win_length]
+
+    @property
+    def board(self) -> list[list[str]]:
+        """
+        Builds a printable view of the board. Not used by the game logic.
+        :return: rows of "_", "X" or "O" strings.
+        """
+        x_marks, o_marks = self.marks
+        return [["X" if x_marks >> row * self.size + col & 1
+                 else "O" if o_marks >> row * self.size + col & 1 else "_"
+                 for col in range(self.size)] for row in range(self.size)]
+
+    def encode_cell(self, row: int, col: int) -> bytes:
+        """
+        Pack a square into one byte, or two on boards over 16x16.
+        :param row: row of the square.
+        :param col: column of the square.
+        :return: big-endian cell index.
+        """
+        return (row * self.size + col).to_bytes(
+            1 if self.size * self.size <= 256 else 2, "big")
+
+    def decode_cell(self, data: bytes) -> tuple[int, int]:
+        """
+        Unpack a square packed by encode_cell.
+        :param data: big-endian cell index.
+        :return: (row, col) of the square.
+        """
+        return divmod(int.from_bytes(data, "big"), self.size)
+
+    def snapshot(self) -> bytes:
+        """
+        Pack the whole state of the game into a few bytes: board size, win
+        length and status, then each player's marks as a big-endian bitboard.
+        :return: bytes to rebuild the game from with from_snapshot.
+        """
+        length = -(-self.size * self.size // 8)
+        return bytes([self.size, self.win_length, self.status]) + \
+            self.marks[0].to_bytes(length, "big") + \
+            self.marks[1].to_bytes(length, "big")
+
+    @classmethod
+    def from_snapshot(cls, data: bytes):
+        """
+        Rebuild a game packed by snapshot.
+        :param data: bytes returned by snapshot.
+        :return: TicTacToeGame in the same state.
+        """
+        game = cls(data[0], data[1])
+        game.status = data[2]
+        length = (len(data) - 3) // 2
+        game.marks = [int.from_bytes(data[3:3 + length], "big"),
+                      int.from_bytes(data[3 + length:], "big")]
+        return game
+
     def toggle_players(self) -> None:
         """
         Update status to switch to other player.
@@ -74,54 +195,53 @@ class TicTacToeGame:
         :param col: second-level index of board to be marked.
         :return: True if allowed, otherwise False.
         """
-        try:
-            # Index corresponds to validation codes
-            validations = [
-                True,
-                symbol == self.players[self.status].SYMBOL,         # WRONG TURN
-                self.board[row][col] == "_",                        # OCCUPIED
-                self.status < self.S_X_WON                          # GAME OVER
-            ]
-            if not all(validations):
-                self.validation = validations.index(False)
-                return False
+        if self.status > self.S_O_TURN:
+            self.validation = self.V_GAME_OVER
+        elif not (0 <= row < self.size and 0 <= col < self.size):
+            self.validation = self.V_OUT_RANGE
+        elif symbol != self.SYMBOLS[self.status]:
+            self.validation = self.V_WRONG_TURN
+        elif (self.marks[0] | self.marks[1]) >> row * self.size + col & 1:
+            self.validation = self.V_SPACE_OCC
+        else:
             self.validation = self.V_PASSED
-            return True
-
-        except IndexError:
-            self.validation = self.V_OUT_RANGE if self.status < self.S_X_WON \
-                else self.V_GAME_OVER
-            return False
+        return self.validation == self.V_PASSED
 
-    def is_win(self) -> bool:
+    def is_win(self, symbol: str = None, row: int = None,
+               col: int = None) -> bool:
         """
-        Check if there is a winning position on the board.
+        Check if there is a winning position on the board. When the last move
+        is given only the lines through it are checked.
+        :param symbol: only check this player's marks if given.
+        :param row: first-level index of the last move, if known.
+        :param col: second-level index of the last move, if known.
         :return: True if winning position, else False.
         """
-        return any([all([square == row[0] != "_" for square in row])    # HOZ _
-                    for row in self.board]) \
-            or any([all([row[col] == self.board[0][col] != "_"          # VER |
-                         for row in self.board]) for col in range(3)]) \
-            or all([self.board[idx][idx] == self.board[0][0] != "_"     # DIAG \
-                    for idx in range(3)]) \
-            or all([self.board[row][col] == self.board[1][1] != "_"     # DIAG /
-                    for row in range(3) for col in range(2, -1, -1)
-                    if row + col == 2])
+        players = range(2) if symbol is None else [self.SYMBOLS.index(symbol)]
+        if row is None or col is None:
+            masks = self.win_masks
+        else:
+            masks = self.cell_masks[row * self.size + col]
+        return any(self.marks[idx] & win == win
+                   for idx in players for win in masks)
 
     def is_draw(self) -> bool:
         """
         Check if game is in a draw state.
         :return: True if draw, else False.
         """
-        return all([square != "_" for row in self.board for square in row])
+        return self.marks[0] | self.marks[1] == self.full_board
 
-    def update_is_game_over(self, symbol: str) -> bool:
+    def update_is_game_over(self, symbol: str, row: int = None,
+                            col: int = None) -> bool:
         """
         Update internal game state if win or draw.
         :param symbol: symbol of current player.
+        :param row: first-level index of the last move, if known.
+        :param col: second-level index of the last move, if known.
         :return: value of is_game_over
         """
-        if self.is_win():
+        if self.is_win(symbol, row, col):
             self.status = {"X": self.S_X_WON, "O": self.S_O_WON}[symbol]
         elif self.is_draw():
             self.status = self.S_DRAW
@@ -137,14 +257,20 @@ class TicTacToeGame:
         """
         if not self.is_move_valid(symbol, row, col):
             return False
-        self.board[row][col] = symbol
-        not self.update_is_game_over(symbol) and self.toggle_players()
+        self.marks[self.status] |= 1 << row * self.size + col
+        not self.update_is_game_over(symbol, row, col) and \
+            self.toggle_players()
         return True
 
-    def quit(self):
+    def quit(self, symbol: str = None):
         """
         Update internal state if game quits on a player's turn.
+        :param symbol: X or O of the quitting player. Defaults to the player
+            whose turn it is.
         """
+        if symbol is not None and self.status <= self.S_O_TURN:
+            self.status = self.S_X_QUIT if symbol == "X" else self.S_O_QUIT
+            return
         self.status = self.S_X_QUIT if self.status == self.S_X_TURN \
             else self.S_O_QUIT if self.status == self.S_O_TURN \
             else self.status
@@ -156,12 +282,23 @@ class TicTacToeCli:
     input and printing results.
     """
 
-    def __init__(self):
+    def __init__(self, headless: bool = False, journal=None):
+        """
+        Initializes the CLI with an empty 3x3 game.
+        :param headless: set True to skip all rendering and printing, for
+            bots, load tests and scripted games.
+        :param journal: JournalWriter to record games in, or None.
+        """
+        self.renderer = None if headless else BoardRenderer()
+        self.journal = journal
+        self.game_id = None                 # Id of the game in the journal
         self.game = TicTacToeGame()
         self.player, self.opponent = self.game.players
         self.game_requested = False         # Used to coordinate multiplayer
         self.game_confirmed = False         # Used to coordinate multiplayer
         self.is_requesting_party = False
+        self.vs_bot = False                 # Set while playing the computer
+        self.server_game = False            # Set while server hosts the game
 
     @staticmethod
     def validate_input(user_move: str) -> Union[tuple[int, int], None]:
@@ -173,8 +310,26 @@ class TicTacToeCli:
         try:
             row, col = user_move.split(" ")
             return ord(row) - 97, int(col)
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def parse_board_args(args: list[str]) -> Union[tuple[int, int], None]:
+        """
+        Convert the arguments of a game request into board parameters.
+        :param args: strings following /tic, of expected form [size [length]].
+        :return: (size, win_length) if valid, else None.
+        """
+        try:
+            size = int(args[0]) if args else 3
+            win_length = int(args[1]) if len(args) > 1 else min(size, 5)
         except ValueError:
             return None
+        if len(args) > 2 \
+                or not TicTacToeGame.MIN_SIZE <= size <= TicTacToeGame.MAX_SIZE\
+                or not TicTacToeGame.MIN_SIZE <= win_length <= size:
+            return None
+        return size, win_length
 
     def make_player_move(self, move: str, do_move_as_opp: bool = False) -> bool:
         """
@@ -183,45 +338,71 @@ class TicTacToeCli:
         :param do_move_as_opp: if True, makes move for opponent player.
         :return: True if move was successful, else False.
         """
-        player = self.player if not do_move_as_opp else self.opponent
-
         # Check if move string in valid format
         converted_move = self.validate_input(move)
         if converted_move is None:
             self.print_board()
-            print("Moves must be in the form 'row col'. Try again.")
+            self.show("Moves must be in the form 'row col'. Try again.")
             return False
+        return self.play_square(*converted_move, do_move_as_opp)
 
-        # Check if converted move is legal
-        if not player.pick_square(*converted_move):
-            self.print_board()
-            print(f"Move error: "
-                  f"{self.game.VALIDATION_CODES[self.game.validation]}. "
-                  f"Try another move.")
+    def play_square(self, row: int, col: int,
+                    do_move_as_opp: bool = False) -> bool:
+        """
+        Makes the given move if legal. Checks game status for end game.
+        :param row: row of the square.
+        :param col: column of the square.
+        :param do_move_as_opp: if True, makes move for opponent player.
+        :return: True if move was successful, else False.
+        """
+        player = self.player if not do_move_as_opp else self.opponent
+
+        # Check if move is legal
+        if not player.pick_square(row, col):
+            self.show_move_error(self.game.validation)
             return False
+        self.record_move(player.SYMBOL, row, col)
 
         self.print_board()
-        do_move_as_opp and print(f"Player {self.player.SYMBOL}'s turn.")
+        do_move_as_opp and self.show(f"Player {self.player.SYMBOL}'s turn.")
         self.game.status > TicTacToeGame.S_O_TURN and self.end_game()
         return True
 
-    def request_game(self, is_requestor: bool) -> bool:
+    def show_move_error(self, validation: int):
+        """
+        Reprint the board with the reason a move was refused.
+        :param validation: TicTacToeGame validation code of the move.
+        """
+        self.print_board()
+        self.show(f"Move error: "
+                  f"{TicTacToeGame.VALIDATION_CODES[validation]}. "
+                  f"Try another move.")
+
+    def request_game(self, is_requestor: bool, board_args: list[str] = ()) \
+            -> bool:
         """
         Use when sending a game request to update requestor's state or show
         prompt to requestee.
         :param is_requestor: set True when this is called by the initial player.
                 Set False when this is called by the requestee to show prompt.
+        :param board_args: optional board size and win length, as strings.
         :return: True if OK to proceed, else False.
         """
         # Validation
         if self.game_confirmed:
-            print("A game is already in progress.")
+            self.show("A game is already in progress.")
             return False
         if self.game_requested:
-            print("A game is already awaiting confirmation.")
+            self.show("A game is already awaiting confirmation.")
+            return False
+        board_params = self.parse_board_args(board_args)
+        if board_params is None:
+            self.show(f"Usage: /tic [size {TicTacToeGame.MIN_SIZE}-"
+                      f"{TicTacToeGame.MAX_SIZE}] [win length]")
             return False
 
         # Update state
+        self.game = TicTacToeGame(*board_params)
         self.game_requested = True
         if is_requestor:
             # Person who initiates game is player X
@@ -229,7 +410,9 @@ class TicTacToeCli:
             self.is_requesting_party = True
         else:
             # Person who receives game request needs to approve
-            print("Play Tic-Tac-Toe? Type /tac to play, /toe to cancel.")
+            size, win_length = board_params
+            self.show(f"Play Tic-Tac-Toe ({size}x{size}, {win_length} in a "
+                      f"row)? Type /tac to play, /toe to cancel.")
         return True
 
     def confirm_game(self, is_acceptor: bool) -> bool:
@@ -242,17 +425,18 @@ class TicTacToeCli:
         """
         # Validation
         if self.game_confirmed:
-            print("A game is already in progress.")
+            self.show("A game is already in progress.")
             return False
         if not self.game_requested:
-            print("No game to confirm.")
+            self.show("No game to confirm.")
             return False
         if is_acceptor and self.is_requesting_party:
-            print("You cannot accept your own invitation!")
+            self.show("You cannot accept your own invitation!")
             return False
 
         # Update state
         self.game_confirmed = True
+        self.record_start()
         self.is_requesting_party = False
         if is_acceptor:
             # Person who accepts game request is player O
@@ -260,7 +444,7 @@ class TicTacToeCli:
         else:
             # Person who receives confirmation needs to make first move
             self.print_board()
-            print("Game accepted. Type your first move, Player X.")
+            self.show("Game accepted. Type your first move, Player X.")
         return True
 
     def reject_game(self, is_waiting: bool) -> bool:
@@ -273,46 +457,244 @@ class TicTacToeCli:
         """
         # Validation
         if self.game_confirmed:
-            print("A game is already in progress. Type /q to quit.")
+            self.show("A game is already in progress. Type /q to quit.")
             return False
         if not self.game_requested:
-            print("No game to reject.")
+            self.show("No game to reject.")
             return False
         if not is_waiting and self.is_requesting_party:
-            print("You cannot reject your own invitation!")
+            self.show("You cannot reject your own invitation!")
             return False
 
         # Update state
         if self.game_requested and self.is_requesting_party:
-            print("Your request was rejected.")
+            self.show("Your request was rejected.")
         self.is_requesting_party = False
         self.end_game()
         return True
 
-    def end_game(self):
+    def start_bot_game(self, board_args: list[str] = ()) -> bool:
+        """
+        Start a local game against the computer. The user is player X.
+        :param board_args: optional board size and win length, as strings.
+        :return: True if the game started, else False.
+        """
+        # Imported here as the bot module builds on this one
+        from tic_tac_toe_bot import BotPlayer
+
+        # Validation
+        if self.game_confirmed or self.game_requested or self.vs_bot \
+                or self.server_game:
+            self.show("A game is already in progress.")
+            return False
+        board_params = self.parse_board_args(board_args)
+        if board_params is None:
+            self.show(f"Usage: /bot [size {TicTacToeGame.MIN_SIZE}-"
+                      f"{TicTacToeGame.MAX_SIZE}] [win length]")
+            return False
+
+        # Update state
+        self.game = TicTacToeGame(*board_params)
+        self.player = self.game.players[0]
+        self.opponent = BotPlayer("O", self.game)
+        self.vs_bot = True
+        self.record_start()
+        self.print_board()
+        self.show("Playing the computer. Type your first move, Player X.")
+        return True
+
+    def play_bot_game(self, move: str) -> bool:
+        """
+        Make the user's move in a game against the computer, then answer it
+        with the computer's move. Type /q to quit the game.
+        :param move: expected format "row col", or /q.
+        :return: True if the user's move was successful, else False.
+        """
+        if move == "/q":
+            self.end_game(self.player.SYMBOL)
+            return True
+        if not self.make_player_move(move):
+            return False
+        if not self.vs_bot:
+            # User's move ended the game
+            return True
+
+        square = self.opponent.choose_square()
+        square is not None and self.opponent.pick_square(*square) and \
+            self.record_move(self.opponent.SYMBOL, *square)
+        self.print_board()
+        if self.game.status > TicTacToeGame.S_O_TURN:
+            self.end_game()
+        else:
+            self.show(f"Player {self.player.SYMBOL}'s turn.")
+        return True
+
+    def request_server_game(self, board_args: list[str] = ()) -> bool:
+        """
+        Use before asking a multi-client server to match the user for a game.
+        :param board_args: optional board size and win length, as strings.
+        :return: True if OK to send the request, else False.
+        """
+        if self.game_confirmed or self.game_requested or self.vs_bot \
+                or self.server_game:
+            self.show("A game is already in progress.")
+            return False
+        if self.parse_board_args(board_args) is None:
+            self.show(f"Usage: /play [size {TicTacToeGame.MIN_SIZE}-"
+                      f"{TicTacToeGame.MAX_SIZE}] [win length]")
+            return False
+        return True
+
+    def start_server_game(self, symbol: str, size: int, win_length: int):
+        """
+        Start showing a game hosted by the server.
+        :param symbol: X or O assigned to the user.
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        """
+        self.game = TicTacToeGame(size, win_length)
+        self.player, self.opponent = self.game.players
+        if symbol == "O":
+            self.opponent, self.player = self.game.players
+        self.server_game = True
+        self.record_start()
+        self.print_board()
+        self.show(f"Matched! You are Player {symbol}. Player X moves first.")
+
+    def format_server_move(self, move: str) -> Union[str, None]:
+        """
+        Convert the user's move into a move command for the server, which
+        validates it.
+        :param move: expected format "row col".
+        :return: move command if the format is valid, else None.
+        """
+        converted_move = self.validate_input(move)
+        if converted_move is None:
+            self.show("Moves must be in the form 'row col'. Try again.")
+            return None
+        return "/move {} {}".format(*converted_move)
+
+    def apply_server_move(self, symbol: str, row: int, col: int):
+        """
+        Show a move the server has already validated. A move the local
+        board cannot take is reported and not journaled.
+        :param symbol: X or O of the player who moved.
+        :param row: first-level index of the marked square.
+        :param col: second-level index of the marked square.
+        """
+        if not self.game.make_move(symbol, row, col):
+            self.show("Ignored a server move that does not fit the board.")
+            return
+        self.record_move(symbol, row, col)
+        self.print_board()
+        self.game.status <= TicTacToeGame.S_O_TURN and \
+            self.show(f"Player {TicTacToeGame.SYMBOLS[self.game.status]}'s "
+                      f"turn.")
+
+    def resume_server_game(self, symbol: str, game: TicTacToeGame):
+        """
+        Pick a game hosted by the server back up from the snapshot it sent
+        after the connection was resumed.
+        :param symbol: X or O of the user.
+        :param game: game rebuilt from the snapshot.
+        """
+        self.server_game or self.record_start()
+        self.game = game
+        self.player, self.opponent = game.players
+        if symbol == "O":
+            self.opponent, self.player = game.players
+        self.server_game = True
+        self.print_board()
+        game.status <= TicTacToeGame.S_O_TURN and \
+            self.show(f"Player {TicTacToeGame.SYMBOLS[game.status]}'s turn.")
+
+    def finish_server_game(self, status: int):
+        """
+        End a game hosted by the server with the status it reported.
+        :param status: final TicTacToeGame status code.
+        """
+        self.game.status = status
+        self.end_game()
+
+    def give_hint(self) -> bool:
+        """
+        Print the best moves for the user in a 3x3 game, looked up from the
+        precomputed OutcomeTable.
+        :return: True if a hint was given, else False.
+        """
+        # Imported here as the table module builds on this one
+        from outcome_table import OutcomeTable
+
+        # Validation
+        if not (self.game_confirmed or self.vs_bot or self.server_game):
+            self.show("No game in progress.")
+            return False
+        if (self.game.size, self.game.win_length) != (3, 3):
+            self.show("Hints are only available on 3x3 boards.")
+            return False
+        if self.game.SYMBOLS[self.game.status] != self.player.SYMBOL:
+            self.show("Wait for your turn.")
+            return False
+
+        table = OutcomeTable.shared()
+        moves = [f"{chr(97 + row)} {col}" for row, col in
+                 table.best_moves(self.game)]
+        outcome = OutcomeTable.OUTCOME_CODES[table.outcome(self.game)]
+        self.show(f"Hint: play {' or '.join(moves)} "
+                  f"({outcome} with best play)")
+        return True
+
+    def record_start(self):
+        """
+        Record the start of the current game if journaling.
+        """
+        if self.journal is not None:
+            self.game_id = self.journal.record_game_start(
+                self.game.size, self.game.win_length)
+
+    def record_move(self, symbol: str, row: int, col: int):
+        """
+        Record a move of the current game if journaling.
+        :param symbol: X or O of the player who moved.
+        :param row: first-level index of the marked square.
+        :param col: second-level index of the marked square.
+        """
+        self.journal is not None and self.journal.record_move(
+            self.game_id, symbol, row, col)
+
+    def end_game(self, quitter: str = None):
         """
         Reset stored game to a new one and clear flags.
+        :param quitter: X or O of the player who quit a game in progress.
+            Defaults to the player whose turn it is.
         """
         # Current game wrap-up
-        self.game.quit()
+        self.game.quit(quitter)
         status_message = TicTacToeGame.STATUS_CODES[self.game.status]
-        self.game_confirmed and print(f"Game over: {status_message}")
+        if self.game_confirmed or self.vs_bot or self.server_game:
+            self.show(f"Game over: {status_message}")
+            self.journal is not None and self.journal.record_game_end(
+                self.game_id, self.game.status)
 
         # Reset state
+        self.renderer is not None and self.renderer.release()
         self.game = TicTacToeGame()
+        self.player, self.opponent = self.game.players
         self.game_confirmed = False
         self.game_requested = False
         self.is_requesting_party = False
+        self.vs_bot = False
+        self.server_game = False
 
-    def print_board(self):
+    def show(self, *args, **kwargs):
         """
-        Prints the current game board to the console.
+        Print to the console unless headless. Takes the arguments of print.
         """
-        row_headings = ['a', 'b', 'c']
-        print("\n" * 100)
-        # Print column heading
-        print("\t" + "\t".join([str(x) for x in range(3)]))
+        self.renderer is not None and print(*args, **kwargs)
 
-        # Print row headings and cells
-        [print(f"{row_headings[idx]}\t" + "\t".join(row))
-         for idx, row in enumerate(self.game.board)]
+    def print_board(self):
+        """
+        Shows the current game board, redrawing only the squares that changed
+        since it was last shown.
+        """
+        self.renderer is not None and self.renderer.render(self.game.board)
@@ -0,0 +1,293 @@
+import time
+from typing import Union
+from tic_tac_toe import Player, TicTacToeGame
+from outcome_table import OutcomeTable
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its time budget runs out.
+    """
+    pass
+
+
+class AlphaBetaSearch:
+    """
+    Finds moves for a TicTacToeGame board with negamax and alpha-beta pruning.
+    Positions are stored in a transposition table under their canonical form
+    across the 8 board symmetries, so equivalent positions are searched once.
+    The table is shared by every game on the same board shape and is cleared
+    whenever it fills up.
+    """
+    # CONSTANTS
+    WIN = 1 << 30                       # Beats any heuristic score
+    EXACT, LOWER, UPPER = range(3)      # Transposition table bound types
+    EXACT_SEARCH_SIZE = 4               # Consider every empty cell up to 4x4
+    MAX_TABLE = 1 << 18                 # Positions kept per board shape
+
+    # One search, and so one shared table, per (size, win_length)
+    searches = {}
+
+    def __init__(self, size: int, win_length: int):
+        """
+        Precompute the lookup tables for one board shape.
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        """
+        self.size = size
+        self.full_board = (1 << size * size) - 1
+        self.cell_masks = TicTacToeGame.get_cell_masks(size, win_length)
+        self.windows = TicTacToeGame.get_win_masks(size, win_length)
+        self.symmetries = self.build_symmetries(size)
+        self.table = {}                 # Canonical key -> (depth, score, bound)
+
+        # Search cells nearest the centre first
+        centre = (size - 1) / 2
+        self.cell_order = sorted(
+            range(size * size),
+            key=lambda cell: abs(cell // size - centre)
+            + abs(cell % size - centre))
+
+        # Masks used to shift marks sideways without wrapping rows
+        self.not_first_col = sum(1 << row * size for row in range(size)) \
+            ^ self.full_board
+        self.not_last_col = sum(1 << row * size + size - 1
+                                for row in range(size)) ^ self.full_board
+        self.deadline = None
+
+    @classmethod
+    def for_board(cls, size: int, win_length: int):
+        """
+        Fetch the shared search for a board shape, creating it on first use.
+        :param size: number of rows and columns on the board.
+        :param win_length: marks in a row needed to win.
+        :return: AlphaBetaSearch for the board shape.
+        """
+        key = size, win_length
+        if key not in cls.searches:
+            cls.searches[key] = cls(size, win_length)
+        return cls.searches[key]
+
+    @staticmethod
+    def build_symmetries(size: int) -> list[tuple[int, ...]]:
+        """
+        List where each cell moves to under the 8 rotations and reflections.
+        :param size: number of rows and columns on the board.
+        :return: list of cell permutations, identity first.
+        """
+        last = size - 1
+        transforms = [
+            lambda r, c: (r, c), lambda r, c: (c, last - r),
+            lambda r, c: (last - r, last - c), lambda r, c: (last - c, r),
+            lambda r, c: (r, last - c), lambda r, c: (last - r, c),
+            lambda r, c: (c, r), lambda r, c: (last - c, last - r)
+        ]
+        return [tuple(row * size + col for row, col in
+                      (transform(cell // size, cell % size)
+                       for cell in range(size * size)))
+                for transform in transforms]
+
+    @staticmethod
+    def count_marks(marks: int) -> int:
+        """
+        :param marks: bitboard.
+        :return: number of set bits.
+        """
+        return bin(marks).count("1")
+
+    @staticmethod
+    def permute(marks: int, permutation: tuple[int, ...]) -> int:
+        """
+        Move each mark of a bitboard to its cell under a symmetry.
+        :param marks: bitboard to transform.
+        :param permutation: new cell for each cell.
+        :return: transformed bitboard.
+        """
+        result = 0
+        while marks:
+            low_bit = marks & -marks
+            result |= 1 << permutation[low_bit.bit_length() - 1]
+            marks ^= low_bit
+        return result
+
+    def canonical(self, own: int, other: int) -> tuple[int, int]:
+        """
+        Pick one representative of a position among its 8 symmetries.
+        :param own: marks of the player to move.
+        :param other: marks of the other player.
+        :return: smallest transformed (own, other) pair.
+        """
+        return min((self.permute(own, perm), self.permute(other, perm))
+                   for perm in self.symmetries)
+
+    def is_line(self, marks: int, cell: int) -> bool:
+        """
+        Check if the marks complete a line through the given cell.
+        :param marks: bitboard including the cell.
+        :param cell: cell of the last move.
+        :return: True if winning, else False.
+        """
+        return any(marks & win == win for win in self.cell_masks[cell])
+
+    def evaluate(self, own: int, other: int) -> int:
+        """
+        Score an unfinished position by its open lines.
+        :param own: marks of the player to move.
+        :param other: marks of the other player.
+        :return: score from the point of view of the player to move.
+        """
+        score = 0
+        for window in self.windows:
+            if not window & other:
+                score += 4 ** self.count_marks(own & window) - 1
+            elif not window & own:
+                score -= 4 ** self.count_marks(other & window) - 1
+        return score
+
+    def candidate_moves(self, own: int, other: int) -> list[int]:
+        """
+        List the cells worth searching, nearest the centre first. On large
+        boards only cells next to an existing mark are considered.
+        :param own: marks of the player to move.
+        :param other: marks of the other player.
+        :return: list of cells.
+        """
+        occupied = own | other
+        empty = self.full_board ^ occupied
+        if self.size > self.EXACT_SEARCH_SIZE and occupied:
+            near = occupied | (occupied & self.not_last_col) << 1 \
+                | (occupied & self.not_first_col) >> 1
+            near |= near << self.size | near >> self.size
+            empty &= near
+        return [cell for cell in self.cell_order if empty >> cell & 1]
+
+    def negamax(self, own: int, other: int, depth: int, alpha: int,
+                beta: int) -> int:
+        """
+        Score a position with alpha-beta search to the given depth.
+        :param own: marks of the player to move.
+        :param other: marks of the other player.
+        :param depth: plies left to search.
+        :param alpha: lower bound of interesting scores.
+        :param beta: upper bound of interesting scores.
+        :return: score from the point of view of the player to move.
+        """
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if own | other == self.full_board:
+            return 0
+        if depth == 0:
+            return self.evaluate(own, other)
+
+        # Reuse earlier results for this position or any symmetric one
+        key = self.canonical(own, other)
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            _, score, bound = entry
+            if bound == self.EXACT:
+                return score
+            if bound == self.LOWER:
+                alpha = max(alpha, score)
+            elif bound == self.UPPER:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score
+
+        original_alpha = alpha
+        best = -self.WIN * 2
+        for cell in self.candidate_moves(own, other):
+            moved = own | 1 << cell
+            if self.is_line(moved, cell):
+                # Prefer quicker wins, which leave more empty cells
+                score = self.WIN + self.count_marks(
+                    self.full_board ^ (moved | other))
+            else:
+                score = -self.negamax(other, moved, depth - 1, -beta, -alpha)
+            best = max(best, score)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        bound = self.UPPER if best <= original_alpha \
+            else self.LOWER if best >= beta else self.EXACT
+        len(self.table) >= self.MAX_TABLE and self.table.clear()
+        self.table[key] = depth, best, bound
+        return best
+
+    def best_move(self, own: int, other: int,
+                  time_budget: float = None) -> Union[int, None]:
+        """
+        Find the best cell for the player to move. Deepens the search one ply
+        at a time until the board is solved or the time budget runs out.
+        :param own: marks of the player to move.
+        :param other: marks of the other player.
+        :param time_budget: seconds allowed, or None to search to the end.
+        :return: best cell found, or None if the board is full.
+        """
+        moves = self.candidate_moves(own, other)
+        if not moves:
+            return None
+        best_cell = moves[0]
+        max_depth = self.count_marks(self.full_board ^ (own | other))
+        self.deadline = None if time_budget is None \
+            else time.perf_counter() + time_budget
+        try:
+            for depth in range(1, max_depth + 1):
+                scores = {}
+                for cell in moves:
+                    moved = own | 1 << cell
+                    if self.is_line(moved, cell):
+                        return cell
+                    scores[cell] = -self.negamax(other, moved, depth - 1,
+                                                 -self.WIN * 2, self.WIN * 2)
+                # Search the best move first on the next iteration
+                moves.sort(key=scores.get, reverse=True)
+                best_cell = moves[0]
+                if abs(scores[best_cell]) >= self.WIN:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        return best_cell
+
+
+class BotPlayer(Player):
+    """
+    Defines a Tic Tac Toe player whose moves are looked up in the
+    OutcomeTable on 3x3 boards and chosen by AlphaBetaSearch otherwise.
+    """
+    def __init__(self, player_symbol: str, game, time_budget: float = 1.0):
+        """
+        Initializes a computer player.
+        :param player_symbol: X or O
+        :param game: associated TicTacToeGame object
+        :param time_budget: seconds allowed per move on large boards.
+        """
+        super().__init__(player_symbol, game)
+        self.search = AlphaBetaSearch.for_board(game.size, game.win_length)
+        self.time_budget = time_budget
+
+    def choose_square(self) -> Union[tuple[int, int], None]:
+        """
+        Pick the square to mark next.
+        :return: (row, col) of the chosen square, or None if board is full.
+        """
+        # Every 3x3 position is already solved on disk
+        if (self.GAME.size, self.GAME.win_length) == (3, 3):
+            moves = OutcomeTable.shared().best_moves(self.GAME)
+            return moves[0] if moves else None
+
+        own_idx = TicTacToeGame.SYMBOLS.index(self.SYMBOL)
+        own, other = self.GAME.marks[own_idx], self.GAME.marks[1 - own_idx]
+
+        cell = self.search.best_move(own, other, self.time_budget)
+        return None if cell is None else divmod(cell, self.GAME.size)
+
+    def take_turn(self) -> bool:
+        """
+        Choose and mark a square.
+        :return: True if successful, else False.
+        """
+        square = self.choose_square()
+        return square is not None and self.pick_square(*square)
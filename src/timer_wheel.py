@@ -0,0 +1,140 @@
+import time
+from typing import Callable
+
+
+class Timer:
+    """
+    Defines data members for one callback scheduled on a TimerWheel.
+    """
+    __slots__ = "expires", "callback", "args", "slot"
+
+    def __init__(self, expires: int, callback: Callable, args: tuple) -> None:
+        """
+        :param expires: tick at which the timer fires.
+        :param callback: called with args when the timer fires.
+        :param args: arguments for the callback.
+        """
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.slot = None                        # Set of timers holding it
+
+    def is_active(self) -> bool:
+        """
+        :return: True until the timer fires or is cancelled.
+        """
+        return self.slot is not None
+
+
+class TimerWheel:
+    """
+    Holds any number of timers in a hierarchy of wheels of SLOTS slots each,
+    so scheduling, cancelling and advancing one tick all cost O(1) however
+    many timers are waiting. The first wheel has one slot per tick, and each
+    slot of the next wheel spans a whole turn of the one before. Timers wait
+    in the coarsest wheel their delay needs and cascade down a wheel each
+    time the finer wheel comes round to them. Delays past the last wheel
+    wait there and cascade again until due.
+    """
+    # CONSTANTS
+    TICK = 0.1                                  # Seconds per tick
+    SLOT_BITS = 6
+    SLOTS = 1 << SLOT_BITS                      # Slots per wheel
+    MASK = SLOTS - 1
+    LEVELS = 4                                  # 64^4 ticks, about 19 days
+    SPAN = 1 << SLOT_BITS * LEVELS              # Ticks the wheels cover
+
+    def __init__(self, tick: float = TICK, now: float = None) -> None:
+        """
+        Initializes empty wheels.
+        :param tick: seconds per tick, the finest resolution of a timer.
+        :param now: time.monotonic() to count ticks from. Defaults to now.
+        """
+        self.tick = tick
+        self.started = time.monotonic() if now is None else now
+        self.ticks = 0                          # Ticks advanced so far
+        self.wheels = [[set() for _ in range(self.SLOTS)]
+                       for _ in range(self.LEVELS)]
+        self.count = 0                          # Active timers
+
+    def __len__(self) -> int:
+        return self.count
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """
+        Call a function once a delay has passed. Timers fire on the first
+        tick at or after their delay, never early.
+        :param delay: seconds to wait.
+        :param callback: function to call.
+        :param args: arguments for the callback.
+        :return: timer, to cancel it with.
+        """
+        ticks = max(1, -int(-delay // self.tick))   # Rounded up
+        timer = Timer(self.ticks + ticks, callback, args)
+        self.insert(timer)
+        self.count += 1
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        """
+        Stop a timer from firing. Does nothing if it already fired or was
+        cancelled.
+        :param timer: timer returned by schedule.
+        """
+        if timer.slot is None:
+            return
+        timer.slot.discard(timer)
+        timer.slot = None
+        self.count -= 1
+
+    def insert(self, timer: Timer) -> None:
+        """
+        Put a timer in the slot of the coarsest wheel it needs.
+        :param timer: timer not yet in a slot.
+        """
+        remaining = timer.expires - self.ticks
+        expires = timer.expires if remaining < self.SPAN \
+            else self.ticks + self.SPAN - 1     # Waits in the last wheel
+        level = 0
+        while remaining >= 1 << self.SLOT_BITS * (level + 1) \
+                and level < self.LEVELS - 1:
+            level += 1
+        timer.slot = self.wheels[level][
+            expires >> self.SLOT_BITS * level & self.MASK]
+        timer.slot.add(timer)
+
+    def advance(self, now: float = None) -> int:
+        """
+        Move the wheels on to the given time, firing every timer that falls
+        due on the way.
+        :param now: time.monotonic() to advance to. Defaults to now.
+        :return: number of timers fired.
+        """
+        now = time.monotonic() if now is None else now
+        target = int((now - self.started) / self.tick)
+        fired = 0
+        while self.ticks < target:
+            self.ticks += 1
+            self.cascade()
+            slot = self.wheels[0][self.ticks & self.MASK]
+            while slot:
+                timer = slot.pop()
+                timer.slot = None
+                self.count -= 1
+                timer.callback(*timer.args)
+                fired += 1
+        return fired
+
+    def cascade(self) -> None:
+        """
+        Move the timers of the next slot of each coarser wheel down, for every
+        wheel the finer ones have just come round to.
+        """
+        for level in range(1, self.LEVELS):
+            if self.ticks & (1 << self.SLOT_BITS * level) - 1:
+                return
+            slot = self.wheels[level][
+                self.ticks >> self.SLOT_BITS * level & self.MASK]
+            timers = list(slot)
+            slot.clear()
+            [self.insert(timer) for timer in timers]
@@ -0,0 +1,289 @@
+import os
+import signal
+import socket
+import struct
+import asyncio
+from typing import Awaitable, Callable
+from framing import encode_header, read_frame_async
+from game_rooms import MatchmakingQueue
+
+
+class WorkerRelay:
+    """
+    Worker end of the channel between a worker process and the pool. Sends
+    chat room messages published in this worker to the pool, and delivers
+    messages published in other workers to the members in this one. Clients
+    wanting a chat partner or a game are paired by the pool, so clients of
+    different workers meet, and sessions of different workers then reach
+    each other through it.
+
+    Each message on the channel is one frame whose payload starts with its
+    kind. A room message is the room name, a NUL byte and the room message
+    frame exactly as its members receive it. A message between sessions is
+    routed by the worker and id of the session it is for and the id of the
+    session it is from; the pool swaps the worker for the one it came from.
+    Requests to the pool and its answers start with the id of their session.
+    """
+    # CONSTANTS
+    ROOM = b"R"                                 # Chat room message
+    SEND = b"S"                                 # Message between sessions
+    PAIR, UNPAIR = b"P", b"U"                   # Chat partner wanted or not
+    PLAY, UNQUEUE = b"G", b"Q"                  # Game wanted or not
+    PENDING, PAIRED = b"p", b"c"                # Answers to PAIR
+    QUEUED, MATCHED = b"q", b"m"                # Answers to PLAY
+    SESSION = struct.Struct("!I")               # Session id
+    ROUTE = struct.Struct("!HII")               # Worker, to id, from id
+    PARTNER = struct.Struct("!IHI")             # Id, partner worker and id
+
+    def __init__(self, conn_socket: socket.socket, worker: int = None) \
+            -> None:
+        """
+        :param conn_socket: this worker's end of the channel.
+        :param worker: index of this worker in the pool.
+        """
+        self.conn_socket = conn_socket
+        self.worker = worker
+        self.reader = self.writer = None        # Set once connected
+
+    async def connect(self) -> None:
+        """
+        Open the streams of the channel.
+        """
+        self.reader, self.writer = await asyncio.open_connection(
+            sock=self.conn_socket)
+
+    def write(self, *parts: bytes) -> None:
+        """
+        Send one message to the pool.
+        :param parts: pieces of the message, its kind first.
+        """
+        if self.writer is None or self.writer.is_closing():
+            return
+        self.writer.writelines([encode_header(sum(map(len, parts))),
+                                *parts])
+
+    async def drain(self) -> None:
+        """
+        Wait until the channel's write buffer is below its high-water mark.
+        """
+        self.writer is None or self.writer.is_closing() or \
+            await self.writer.drain()
+
+    def publish(self, name: str, frame: bytes) -> None:
+        """
+        Send a room message to the other workers.
+        :param name: name of the room.
+        :param frame: message framed with its header.
+        """
+        self.write(self.ROOM, name.encode(), b"\0", frame)
+
+    def request(self, kind: bytes, session_id: int,
+                board_params: tuple[int, int] = ()) -> None:
+        """
+        Ask the pool to pair a session or match it for a game, or to stop.
+        :param kind: PAIR, UNPAIR, PLAY or UNQUEUE.
+        :param session_id: id of the session in this worker.
+        :param board_params: (size, win_length) wanted, for PLAY.
+        """
+        self.write(kind, self.SESSION.pack(session_id), bytes(board_params))
+
+    def send(self, worker: int, to_id: int, from_id: int,
+             message: bytes) -> None:
+        """
+        Send a message to a session of another worker.
+        :param worker: index of the worker serving the session.
+        :param to_id: id of the session in that worker.
+        :param from_id: id of the sending session in this worker.
+        :param message: message for the worker, its kind first.
+        """
+        self.write(self.SEND, self.ROUTE.pack(worker, to_id, from_id),
+                   message)
+
+    async def run(self, chat_rooms,
+                  handle: Callable[[bytes, bytes], Awaitable] = None) \
+            -> None:
+        """
+        Deliver messages from the pool until it closes the channel.
+        :param chat_rooms: ChatRoomManager of this worker.
+        :param handle: coroutine function called with the kind and the rest
+            of every message that is not a room message, or None.
+        """
+        self.writer is None and await self.connect()
+        chat_rooms.relay = self
+        try:
+            while True:
+                frame = await read_frame_async(self.reader)
+                if frame is None:
+                    return
+                kind, body = frame[1][:1], frame[1][1:]
+                if kind == self.ROOM:
+                    name, _, room_frame = body.partition(b"\0")
+                    chat_rooms.deliver(name.decode(), room_frame)
+                elif handle is not None:
+                    await handle(kind, body)
+        finally:
+            chat_rooms.relay = None
+            self.writer.close()
+
+
+class WorkerPool:
+    """
+    Pre-forks worker processes that each run their own event loop and accept
+    on the same port through SO_REUSEPORT, so the kernel spreads connections
+    across them. The parent process relays chat room messages and messages
+    between sessions from one worker to the others over local socket pairs.
+    It also holds the one client waiting for a chat partner and the queue of
+    clients waiting for a game, so any two clients can be paired.
+    """
+    # CONSTANTS
+    BUFFER_LIMIT = 1 << 22                      # Bytes held for one worker
+
+    def __init__(self, workers: int,
+                 run_worker: Callable[[int, socket.socket], None]) -> None:
+        """
+        :param workers: number of worker processes.
+        :param run_worker: called in each worker with its index and its end
+            of the channel to the pool. Returns when the worker is done.
+        """
+        self.workers = workers
+        self.run_worker = run_worker
+        self.channels = []                      # Pool end of each channel
+        self.pids = []
+        self.writers = []                       # Stream of each channel
+        self.dropped = 0                        # Messages no worker took
+        self.waiting = None                     # (Worker, id) of unpaired
+        self.queue = MatchmakingQueue()         # Of (worker, id) for games
+
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        :return: True if the platform can fork and share a port.
+        """
+        return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+    def start(self) -> None:
+        """
+        Fork the workers. Returns in the parent only.
+        """
+        for index in range(self.workers):
+            pool_end, worker_end = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                # Worker: keep only its own end of its own channel
+                [channel.close() for channel in self.channels]
+                pool_end.close()
+                signal.signal(signal.SIGTERM, signal.default_int_handler)
+                try:
+                    self.run_worker(index, worker_end)
+                finally:
+                    os._exit(0)
+            worker_end.close()
+            self.channels.append(pool_end)
+            self.pids.append(pid)
+
+    async def relay(self) -> None:
+        """
+        Handle every message from the workers until they close.
+        """
+        streams = [await asyncio.open_connection(sock=channel)
+                   for channel in self.channels]
+        self.writers = [writer for _, writer in streams]
+
+        async def forward(source: int) -> None:
+            while True:
+                frame = await read_frame_async(streams[source][0])
+                if frame is None:
+                    return
+                self.dispatch(source, frame[1])
+
+        await asyncio.gather(*(forward(idx) for idx in range(len(streams))))
+
+    def write(self, worker: int, *parts: bytes) -> None:
+        """
+        Send one message to a worker. The pool relays for every worker on
+        one loop and cannot wait for any one of them, so a message to a
+        worker that has exited or stopped reading past BUFFER_LIMIT is
+        dropped and counted instead.
+        :param worker: index of the worker.
+        :param parts: pieces of the message, its kind first.
+        """
+        writer = self.writers[worker] \
+            if 0 <= worker < len(self.writers) else None
+        if writer is None or writer.is_closing() or \
+                writer.transport.get_write_buffer_size() > self.BUFFER_LIMIT:
+            self.dropped += 1
+            return
+        writer.writelines([encode_header(sum(map(len, parts))), *parts])
+
+    def dispatch(self, source: int, message: bytes) -> None:
+        """
+        Send a room message to all the other workers and a message between
+        sessions to the worker of its session, or answer a request to pair a
+        client or match it for a game.
+        :param source: index of the worker the message came from.
+        :param message: message received, its kind first.
+        """
+        kind, body = message[:1], message[1:]
+        if kind == WorkerRelay.ROOM:
+            [self.write(idx, message) for idx in range(len(self.writers))
+             if idx != source]
+            return
+        if kind == WorkerRelay.SEND:
+            worker, to_id, from_id = WorkerRelay.ROUTE.unpack_from(body)
+            self.write(worker, kind,
+                       WorkerRelay.ROUTE.pack(source, to_id, from_id),
+                       body[WorkerRelay.ROUTE.size:])
+            return
+
+        session_id = body[:WorkerRelay.SESSION.size]
+        client = source, WorkerRelay.SESSION.unpack(session_id)[0]
+        if kind == WorkerRelay.PAIR:
+            if self.waiting is None or self.waiting == client:
+                self.waiting = client
+                self.write(source, WorkerRelay.PENDING, session_id)
+                return
+            # The worker of the first arrival tells the other one
+            (worker, first_id), self.waiting = self.waiting, None
+            self.write(worker, WorkerRelay.PAIRED,
+                       WorkerRelay.PARTNER.pack(first_id, *client))
+        elif kind == WorkerRelay.UNPAIR:
+            if self.waiting == client:
+                self.waiting = None
+        elif kind == WorkerRelay.PLAY:
+            board_params = tuple(body[WorkerRelay.SESSION.size:])
+            match = self.queue.enqueue(client, board_params)
+            if match is None:
+                self.write(source, WorkerRelay.QUEUED, session_id)
+                return
+            # The worker of the player who waited longest hosts the game
+            (worker, first_id), _ = match
+            self.write(worker, WorkerRelay.MATCHED,
+                       WorkerRelay.PARTNER.pack(first_id, *client),
+                       bytes(board_params))
+        elif kind == WorkerRelay.UNQUEUE:
+            self.queue.remove(client)
+
+    def stop(self) -> None:
+        """
+        Stop every worker and wait for it to exit.
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)     # Already stopping
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass                            # Already exited
+        [os.waitpid(pid, 0) for pid in self.pids]
+        [channel.close() for channel in self.channels]
+
+    def run(self) -> None:
+        """
+        Start the workers and relay between them until interrupted.
+        """
+        self.start()
+        try:
+            asyncio.run(self.relay())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
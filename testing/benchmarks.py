@@ -0,0 +1,186 @@
+import os, sys, json, time, socket, argparse, platform, threading
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "src"))
+
+from chat_interface import ChatInterface
+from tic_tac_toe import TicTacToeGame
+
+MESSAGE_SIZES = [0, 16, 256, 1024, 16 * 1024, 256 * 1024, 1024 * 1024,
+                 4 * 1024 * 1024]
+LATENCY_SIZES = [16, 1024, 64 * 1024]
+BYTES_PER_SIZE = 64 * 1024 * 1024           # Data sent per throughput run
+MAX_MESSAGES = 20_000                       # Message cap per throughput run
+
+
+def socketpair_transport():
+    """
+    :return: pair of connected Unix-domain sockets.
+    """
+    return socket.socketpair()
+
+
+def loopback_transport():
+    """
+    :return: pair of connected TCP sockets over the loopback interface.
+    """
+    with socket.create_server(("localhost", 0)) as listener:
+        client = socket.create_connection(listener.getsockname()[:2])
+        server = listener.accept()[0]
+    return client, server
+
+
+TRANSPORTS = {"socketpair": socketpair_transport,
+              "loopback": loopback_transport}
+
+
+def percentile(sorted_samples: list, fraction: float) -> float:
+    """
+    :param sorted_samples: samples in ascending order.
+    :param fraction: percentile as a fraction, e.g. 0.99.
+    :return: nearest-rank percentile of the samples.
+    """
+    return sorted_samples[min(len(sorted_samples) - 1,
+                              int(fraction * len(sorted_samples)))]
+
+
+def bench_throughput(transport: str, size: int, scale: float) -> dict:
+    """
+    Time one-way ChatInterface send/receive of many messages of one size.
+    :param transport: key of TRANSPORTS.
+    :param size: message size in bytes.
+    :param scale: fraction of the full run to perform.
+    :return: result record.
+    """
+    count = max(10, int(min(MAX_MESSAGES,
+                            BYTES_PER_SIZE // max(size, 1)) * scale))
+    message = "x" * size
+    sender_socket, receiver_socket = TRANSPORTS[transport]()
+    with sender_socket, receiver_socket:
+        sender = ChatInterface(sender_socket)
+        receiver = ChatInterface(receiver_socket, True)
+
+        def send_all():
+            for _ in range(count):
+                sender.send_outgoing_data(message)
+
+        thread = threading.Thread(target=send_all)
+        start = time.perf_counter()
+        thread.start()
+        for _ in range(count):
+            receiver.read_incoming_data()
+        elapsed = time.perf_counter() - start
+        thread.join()
+
+    return {"transport": transport, "size": size, "messages": count,
+            "seconds": elapsed,
+            "messages_per_s": count / elapsed,
+            "mb_per_s": count * size / elapsed / 1e6}
+
+
+def bench_latency(transport: str, size: int, scale: float) -> dict:
+    """
+    Time round trips of a message echoed back by the peer.
+    :param transport: key of TRANSPORTS.
+    :param size: message size in bytes.
+    :param scale: fraction of the full run to perform.
+    :return: result record with percentiles in microseconds.
+    """
+    count = max(100, int(10_000 * scale))
+    message = "x" * size
+    client_socket, echo_socket = TRANSPORTS[transport]()
+    with client_socket, echo_socket:
+        client = ChatInterface(client_socket, nodelay=transport == "loopback")
+        echo = ChatInterface(echo_socket, True,
+                             nodelay=transport == "loopback")
+
+        def echo_all():
+            for _ in range(count):
+                echo.send_outgoing_data(echo.read_incoming_data())
+
+        thread = threading.Thread(target=echo_all)
+        thread.start()
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter_ns()
+            client.send_outgoing_data(message)
+            client.read_incoming_data()
+            samples.append((time.perf_counter_ns() - start) / 1000)
+        thread.join()
+
+    samples.sort()
+    return {"transport": transport, "size": size, "samples": count,
+            "p50_us": percentile(samples, 0.50),
+            "p99_us": percentile(samples, 0.99),
+            "p999_us": percentile(samples, 0.999)}
+
+
+def bench_engine(scale: float) -> dict:
+    """
+    Measure TicTacToeGame make_move and is_win rates.
+    :param scale: fraction of the full run to perform.
+    :return: result record in operations per second.
+    """
+    games = max(1000, int(100_000 * scale))
+    moves = [(0, 0), (1, 1), (0, 1), (0, 2), (2, 0), (1, 0), (1, 2), (2, 1),
+             (2, 2)]                            # Draw, so all 9 moves are made
+    start = time.perf_counter()
+    for _ in range(games):
+        game = TicTacToeGame()
+        for idx, (row, col) in enumerate(moves):
+            game.make_move("XO"[idx % 2], row, col)
+    make_move_elapsed = time.perf_counter() - start
+
+    gomoku = TicTacToeGame(15, 5)
+    [gomoku.make_move("XO"[idx % 2], row, col) for idx, (row, col) in
+     enumerate([(7, 7), (0, 0), (7, 8), (0, 2), (7, 9), (0, 4)])]
+    checks = games * 10
+    results = {"games": games}
+    for name, game, args in [("is_win_3x3", game, ()),
+                             ("is_win_15x15_last_move", gomoku, ("X", 7, 9)),
+                             ("is_win_15x15_full_scan", gomoku, ("X",))]:
+        start = time.perf_counter()
+        for _ in range(checks):
+            game.is_win(*args)
+        results[f"{name}_per_s"] = checks / (time.perf_counter() - start)
+
+    results["make_move_per_s"] = games * len(moves) / make_move_elapsed
+    return results
+
+
+def run(scale: float) -> dict:
+    """
+    Run every benchmark.
+    :param scale: fraction of the full run to perform.
+    :return: all results, ready to be dumped as JSON.
+    """
+    return {
+        "meta": {"python": platform.python_version(),
+                 "platform": platform.platform(),
+                 "timestamp": time.time(),
+                 "scale": scale},
+        "throughput": [bench_throughput(transport, size, scale)
+                       for transport in TRANSPORTS for size in MESSAGE_SIZES],
+        "latency": [bench_latency(transport, size, scale)
+                    for transport in TRANSPORTS for size in LATENCY_SIZES],
+        "engine": bench_engine(scale)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark framing and the game engine over loopback.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--scale", type=float, default=1.0,
+                        help="fraction of the full run to perform")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    results = run(args.scale)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
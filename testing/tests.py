@@ -1,22 +1,88 @@
-import unittest, socket
-from src.chat_server import read_incoming_data
+import io, os, sys, time, zlib, asyncio, unittest, socket, struct, tempfile, \
+    threading, contextlib
+from unittest import mock
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, "..", "src"))
+
+from chat_interface import ChatInterface
+from file_transfer import FileSender
+from tic_tac_toe import TicTacToeCli, TicTacToeGame
+from board_renderer import BoardRenderer
+from journal import JournalReader, JournalWriter, segment_paths
+from tic_tac_toe_bot import BotPlayer
+from outcome_table import OutcomeTable
+from game_rooms import GameRoomManager
+from chat_rooms import ChatRoomManager
+from worker_pool import WorkerPool, WorkerRelay
+from load_generator import LoadGenerator
+from timer_wheel import TimerWheel
+from async_chat_server import AsyncChatServer, PeerSession
+from framing import FrameReader, ReplayBuffer, encode_header, \
+    read_frame_async
+from metrics import LatencyHistogram
+try:
+    from batch_simulator import BatchSimulator
+except ImportError:
+    BatchSimulator = None                   # NumPy is not installed
+
+
+class FakeMember:
+    """
+    Stands in for a chat room member, keeping the frames sent to it.
+    """
+    def __init__(self, queued: int = 0):
+        self.addr = ("127.0.0.1", 1)
+        self.writer = self.transport = self
+        self.queued, self.frames, self.closed = queued, [], False
+
+    def get_write_buffer_size(self):
+        return self.queued
+
+    def write_frame(self, frame):
+        self.frames.append(frame)
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncServerTestMixin:
+    """
+    Runs an AsyncChatServer on a free port for the length of a test.
+    """
+    async def start_server(self, **options) -> AsyncChatServer:
+        server = AsyncChatServer("localhost", 0, **options)
+        listener = await asyncio.start_server(server.handle_client,
+                                              "localhost", 0)
+        self.addAsyncCleanup(listener.wait_closed)
+        self.addCleanup(listener.close)
+        self.port = listener.sockets[0].getsockname()[1]
+        return server
+
+    async def open_client(self, port: int = None):
+        reader, writer = await asyncio.open_connection("localhost",
+                                                       port or self.port)
+        self.addCleanup(writer.close)
+        return reader, writer
 
 
 class TestReadIncomingData(unittest.TestCase):
     """
-    Defines unit tests for the read_incoming_data function.
+    Defines unit tests for ChatInterface.read_incoming_data.
     """
     @classmethod
     def setUpClass(cls):
         # Set up server
         print("Setting up sockets.")
-        cls.listener_socket = socket.create_server(('localhost', 8080))
-        print("Server socket listening at localhost 8080")
+        cls.listener_socket = socket.create_server(('localhost', 0))
+        port = cls.listener_socket.getsockname()[1]
+        print(f"Server socket listening at localhost {port}")
 
         # Set up client connection
-        cls.client_socket = socket.create_connection(('localhost', 8080))
+        cls.client_socket = socket.create_connection(('localhost', port))
         cls.server_socket = cls.listener_socket.accept()[0]
-        print("Client connected at localhost 8080")
+        cls.chatter = ChatInterface(cls.server_socket, True)
+        print(f"Client connected at localhost {port}")
 
     @classmethod
     def tearDownClass(cls) -> None:
@@ -29,28 +95,1079 @@ class TestReadIncomingData(unittest.TestCase):
         print("Closed listener socket.")
 
     def test_empty_string(self):
-        input_string = b":0:"
+        input_string = b"\x000\x00"
         self.client_socket.sendall(input_string)
-        result = read_incoming_data(self.server_socket)
+        result = self.chatter.read_incoming_data()
         expected = ""
         self.assertEqual(expected, result)
 
     def test_short_string(self):
-        input_string = b":12:hello world!"
+        input_string = b"\x0012\x00hello world!"
         self.client_socket.sendall(input_string)
-        result = read_incoming_data(self.server_socket)
+        result = self.chatter.read_incoming_data()
         expected = "hello world!"
         self.assertEqual(expected, result)
 
     def test_long_string(self):
-        with open("long_text.txt", "r") as long_text:
+        with open(os.path.join(TEST_DIR, "long_text.txt"), "r") as long_text:
             input_text = long_text.readline()
-            expected = input_text
-            input_text = f":{len(input_text)}:{input_text}"
-            self.client_socket.sendall(input_text.encode())
-            result = read_incoming_data(self.server_socket)
+            expected = input_text.strip()
+            self.client_socket.sendall(ChatInterface.encode_frame(input_text))
+            result = self.chatter.read_incoming_data()
             self.assertEqual(expected, result)
 
+    def test_multibyte_split(self):
+        input_bytes = ChatInterface.encode_frame("héllo wörld ✓")
+        split = input_bytes.index("✓".encode()) + 1
+        self.client_socket.sendall(input_bytes[:split])
+        self.client_socket.sendall(input_bytes[split:])
+        result = self.chatter.read_incoming_data()
+        expected = "héllo wörld ✓"
+        self.assertEqual(expected, result)
+
+    def test_coalesced_sends(self):
+        sender = ChatInterface(self.client_socket, nodelay=True)
+        messages = ["one", "", "x" * 5000, "two"]
+        [sender.send_outgoing_data(msg, flush=False) for msg in messages]
+        self.assertGreater(sender.writer.queued_bytes, 5000)
+        sender.writer.flush()
+        self.assertEqual(0, sender.writer.queued_bytes)
+        result = [self.chatter.read_incoming_data() for _ in messages]
+        self.assertEqual(messages, result)
+
+    def test_compressed_long_string(self):
+        sender = ChatInterface(self.client_socket)
+        sender.writer.compress_threshold = 100
+        with open(os.path.join(TEST_DIR, "long_text.txt"), "r") as long_text:
+            input_text = long_text.readline().strip() * 20
+        sender.send_outgoing_data(input_text)
+        sender.send_outgoing_data("short")
+        self.assertEqual(input_text, self.chatter.read_incoming_data())
+        self.assertEqual("short", self.chatter.read_incoming_data())
+
+    def test_rejects_compression_bomb(self):
+        sender_socket, receiver_socket = socket.socketpair()
+        with sender_socket, receiver_socket:
+            reader = FrameReader(receiver_socket)
+            reader.MAX_INFLATED = 1000
+            for size in (1000, 5000):
+                payload = zlib.compress(bytes(size))
+                sender_socket.sendall(encode_header(
+                    len(payload), FrameReader.COMPRESSED) + payload)
+            self.assertEqual(bytes(1000), reader.read_frame())
+            self.assertRaises(ValueError, reader.read_frame)
+
+    def test_rejects_oversized_header(self):
+        sender_socket, receiver_socket = socket.socketpair()
+        with sender_socket, receiver_socket:
+            reader = FrameReader(receiver_socket)
+            sender_socket.sendall(encode_header(FrameReader.MAX_FRAME + 1))
+            self.assertRaises(ValueError, reader.read_frame)
+            reader.start = reader.end = 0
+            sender_socket.sendall(b"\x00" + b"1" * 64)
+            self.assertRaises(ValueError, reader.read_frame)
+
+    def test_negotiate_compression(self):
+        client = ChatInterface(self.client_socket, compress_threshold=512)
+        server = ChatInterface(self.server_socket, True, compress_threshold=64)
+        thread = threading.Thread(target=client.negotiate)
+        thread.start()
+        server.negotiate()
+        thread.join()
+        self.assertEqual(512, client.writer.compress_threshold)
+        self.assertEqual(64, server.writer.compress_threshold)
+
+    def test_file_transfer(self):
+        sender = ChatInterface(self.client_socket)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source = os.path.join(temp_dir, "source.bin")
+            with open(source, "wb") as source_file:
+                source_file.write(os.urandom(200_000))
+            self.chatter.DOWNLOAD_DIR = os.path.join(temp_dir, "downloads")
+
+            def send_file():
+                sender.send_outgoing_data(
+                    sender.parse_for_command(f"/send {source}", True))
+                while sender.outgoing_transfers:
+                    sender.pump_transfers()
+                sender.send_outgoing_data("done")
+
+            thread = threading.Thread(target=send_file)
+            thread.start()
+            self.chatter.parse_for_command(
+                self.chatter.read_incoming_data(), False)
+            self.assertEqual("done", self.chatter.read_incoming_data())
+            thread.join()
+            with open(source, "rb") as source_file, open(os.path.join(
+                    temp_dir, "downloads", "source.bin"), "rb") as saved:
+                self.assertEqual(source_file.read(), saved.read())
+
+    def test_file_transfer_size_mismatch(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.chatter.DOWNLOAD_DIR = temp_dir
+            for transfer_id, chunks in ((1, [b"abcdef"]), (2, [b"abc", b""]),
+                                        (3, [b"abc"])):
+                self.chatter.receive_file_offer([str(transfer_id), "5", "a"])
+                for chunk in chunks:
+                    self.chatter.receive_file_chunk(bytearray(
+                        transfer_id.to_bytes(FileSender.ID_BYTES, "big")
+                        + chunk))
+            self.chatter.receive_file_offer(["3", "5", "b"])
+            self.assertEqual(["a"], os.listdir(temp_dir))
+            self.chatter.abort_transfers()
+            self.assertEqual([], os.listdir(temp_dir))
+            self.assertEqual({}, self.chatter.incoming_transfers)
+
+    def test_pipelined_frames(self):
+        messages = ["first", "second", "x" * 3000, "last"]
+        self.client_socket.sendall(
+            b"".join(ChatInterface.encode_frame(msg) for msg in messages))
+        result = [self.chatter.read_incoming_data() for _ in messages]
+        self.assertEqual(messages, result)
+
+
+class TestConnectionMetrics(unittest.TestCase):
+    """
+    Defines unit tests for the counters kept by ChatInterface.
+    """
+    def setUp(self):
+        self.sender_socket, self.receiver_socket = socket.socketpair()
+
+    def tearDown(self):
+        self.sender_socket.close()
+        self.receiver_socket.close()
+
+    def test_counts_frames_and_partial_reads(self):
+        sender = ChatInterface(self.sender_socket)
+        receiver = ChatInterface(self.receiver_socket, True)
+        sender.send_outgoing_data("x" * 5000)
+        receiver.receive_and_handle_message()
+        self.assertEqual(1, receiver.metrics.frames_in)
+        self.assertEqual(sender.metrics.bytes_out, receiver.metrics.bytes_in)
+        self.assertEqual(receiver.metrics.recv_calls,
+                         1 + receiver.metrics.partial_reads)
+        self.assertGreater(receiver.metrics.partial_reads, 0)
+        self.assertEqual(1, receiver.metrics.framing.count)
+        self.assertEqual(1, receiver.metrics.dispatch.count)
+        self.assertIsNone(sender.parse_for_command("/stats", True))
+
+    def test_metrics_off(self):
+        sender = ChatInterface(self.sender_socket, metrics=False)
+        receiver = ChatInterface(self.receiver_socket, True, metrics=False)
+        sender.send_outgoing_data("hello")
+        receiver.receive_and_handle_message()
+        self.assertIsNone(receiver.reader.metrics)
+        self.assertIsNone(sender.writer.metrics)
+
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        [histogram.record(100) for _ in range(99)]
+        histogram.record(5000)
+        self.assertEqual(128, histogram.percentile(0.5))
+        self.assertEqual(8192, histogram.percentile(0.999))
+
+
+class TestDuplexChat(unittest.TestCase):
+    """
+    Defines unit tests for ChatInterface.chat_duplex and its stdin handling.
+    """
+    def setUp(self):
+        self.sockets = socket.socketpair()
+        for sock in self.sockets:
+            self.addCleanup(sock.close)
+
+    @contextlib.contextmanager
+    def stdin(self, data: bytes = b""):
+        """
+        Replace stdin with a pipe holding data, closed after it.
+        """
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, data)
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as pipe, mock.patch("sys.stdin", pipe):
+            yield
+
+    def test_sends_typed_lines(self):
+        sender = ChatInterface(self.sockets[0], headless=True,
+                               heartbeat_interval=0)
+        receiver = ChatInterface(self.sockets[1], True, headless=True)
+        with self.stdin(b"hello\r\nsecond\n/q\nnot sent\n"):
+            sender.chat_duplex()
+        self.assertEqual(ChatInterface.TERMINATE, sender.state)
+        self.assertEqual(["hello", "second", "/q"],
+                         [receiver.read_incoming_data() for _ in range(3)])
+
+    def test_lines_read_together_flushed_once(self):
+        sender = ChatInterface(self.sockets[0], headless=True,
+                               heartbeat_interval=0)
+        receiver = ChatInterface(self.sockets[1], True, headless=True)
+        with self.stdin(b"one\ntwo\nthree\n"), \
+                mock.patch.object(sender.writer, "flush",
+                                  wraps=sender.writer.flush) as flush:
+            sender.chat_duplex()
+        self.assertEqual(1, flush.call_count)
+        self.assertEqual(["one", "two", "three"],
+                         [receiver.read_incoming_data() for _ in range(3)])
+
+    def test_read_stdin_lines_keeps_partial_line(self):
+        chatter = ChatInterface(self.sockets[0], headless=True)
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, "rb") as pipe, mock.patch("sys.stdin", pipe):
+            os.write(write_fd, b"ab")
+            self.assertEqual([], chatter.read_stdin_lines())
+            os.write(write_fd, b"c\nd")
+            self.assertEqual(["abc"], chatter.read_stdin_lines())
+            os.close(write_fd)
+            self.assertIsNone(chatter.read_stdin_lines())
+        self.assertEqual(b"d", chatter.stdin_buffer)
+
+    def test_quit_on_opponents_turn(self):
+        player_x = ChatInterface(self.sockets[0], heartbeat_interval=0)
+        player_o = ChatInterface(self.sockets[1], True)
+        for chatter in (player_x, player_o):
+            chatter.cli.game_confirmed = True
+            chatter.cli.game.make_move("X", 0, 0)       # Now O's turn
+        player_o.cli.opponent, player_o.cli.player = \
+            player_o.cli.game.players
+
+        for chatter, run in ((player_x, player_x.chat_duplex),
+                             (player_o, player_o.receive_and_handle_message)):
+            output = io.StringIO()
+            with self.stdin(b"/q\n"), contextlib.redirect_stdout(output):
+                run()
+            self.assertIn("Game over: X QUIT", output.getvalue())
+            self.assertFalse(chatter.cli.game_confirmed)
+
+
+class TestTypedFrames(unittest.TestCase):
+    """
+    Defines unit tests for typed binary frames and their dispatch.
+    """
+    def setUp(self):
+        self.sender_socket, self.receiver_socket = socket.socketpair()
+        self.sender = ChatInterface(self.sender_socket)
+        self.receiver = ChatInterface(self.receiver_socket, True)
+        self.sender.use_typed = self.receiver.use_typed = True
+
+    def tearDown(self):
+        self.sender_socket.close()
+        self.receiver_socket.close()
+
+    def test_chat_reading_like_command(self):
+        self.sender.writer.enqueue_typed(ChatInterface.OP_CHAT, b"/q", True)
+        self.receiver.receive_and_handle_message()
+        self.assertNotEqual(ChatInterface.TERMINATE, self.receiver.state)
+        self.sender.handle_user_line("/q")
+        self.receiver.receive_and_handle_message()
+        self.assertEqual(ChatInterface.TERMINATE, self.receiver.state)
+        self.assertEqual(2, self.receiver.peer_sequence)
+
+    def test_game_moves(self):
+        self.sender.handle_user_line("/tic 17 5")
+        self.receiver.receive_and_handle_message()
+        self.receiver.handle_user_line("/tac")
+        self.sender.receive_and_handle_message()
+        self.sender.handle_user_line("q 16")
+        self.receiver.receive_and_handle_message()
+        self.assertEqual("X", self.receiver.cli.game.board[16][16])
+        self.assertEqual(b"\x01\x20",
+                         self.receiver.cli.game.encode_cell(16, 16))
+        self.assertEqual(b"\x08", TicTacToeGame().encode_cell(2, 2))
+
+    def test_mixed_with_text_frames(self):
+        self.sender.send_outgoing_data("/q")
+        self.sender.writer.enqueue_typed(ChatInterface.OP_CHAT, b"hi", True)
+        self.assertEqual("/q", self.receiver.read_incoming_data())
+        self.assertIsNone(self.receiver.reader.opcode)
+        self.assertTrue(self.receiver.reader.has_frame())
+        self.assertEqual(b"hi", self.receiver.reader.read_frame())
+        self.assertEqual(ChatInterface.OP_CHAT, self.receiver.reader.opcode)
+
+    def test_malformed_frame_ends_chat(self):
+        self.sender_socket.sendall(b"\x005z\x00hello")
+        with mock.patch.object(self.receiver.cli, "show") as show:
+            self.receiver.receive_and_handle_message()
+        self.assertEqual(ChatInterface.TERMINATE, self.receiver.state)
+        show.assert_called_with("Peer sent a malformed frame.")
+
+    def test_rejects_oversized_length(self):
+        self.sender_socket.sendall(FrameReader.TYPED_HEADER.pack(
+            FrameReader.TYPED_VERSION, ChatInterface.OP_CHAT, 0, 1,
+            FrameReader.MAX_FRAME + 1))
+        self.assertRaises(ValueError, self.receiver.reader.read_frame)
+
+
+class TestTicTacToeGame(unittest.TestCase):
+    """
+    Defines unit tests for the TicTacToeGame engine.
+    """
+    @staticmethod
+    def play(moves, *board_params):
+        game = TicTacToeGame(*board_params)
+        for idx, (row, col) in enumerate(moves):
+            game.make_move("XO"[idx % 2], row, col)
+        return game
+
+    def test_row_win(self):
+        game = self.play([(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)])
+        self.assertEqual(TicTacToeGame.S_X_WON, game.status)
+
+    def test_anti_diagonal_win(self):
+        game = self.play([(0, 0), (0, 2), (0, 1), (1, 1), (2, 2), (2, 0)])
+        self.assertEqual(TicTacToeGame.S_O_WON, game.status)
+
+    def test_draw(self):
+        game = self.play([(0, 0), (0, 1), (0, 2), (1, 1), (1, 0),
+                          (1, 2), (2, 1), (2, 0), (2, 2)])
+        self.assertEqual(TicTacToeGame.S_DRAW, game.status)
+
+    def test_gomoku_diagonal_win(self):
+        game = self.play([(7, 7), (0, 0), (8, 6), (0, 1), (9, 5),
+                          (0, 2), (10, 4), (0, 3), (6, 8)], 15, 5)
+        self.assertEqual(TicTacToeGame.S_X_WON, game.status)
+
+    def test_gomoku_four_is_not_win(self):
+        game = self.play([(3, 3), (0, 0), (3, 4), (0, 1), (3, 5),
+                          (0, 2), (3, 6)], 15, 5)
+        self.assertEqual(TicTacToeGame.S_O_TURN, game.status)
+
+    def test_validation_codes(self):
+        game = TicTacToeGame()
+        self.assertFalse(game.make_move("O", 0, 0))
+        self.assertEqual(TicTacToeGame.V_WRONG_TURN, game.validation)
+        self.assertTrue(game.make_move("X", 0, 0))
+        self.assertFalse(game.make_move("O", 0, 0))
+        self.assertEqual(TicTacToeGame.V_SPACE_OCC, game.validation)
+        self.assertFalse(game.make_move("O", 3, 0))
+        self.assertEqual(TicTacToeGame.V_OUT_RANGE, game.validation)
+        game.quit()
+        self.assertFalse(game.make_move("O", 1, 1))
+        self.assertEqual(TicTacToeGame.V_GAME_OVER, game.validation)
+
+
+class TestBoardRenderer(unittest.TestCase):
+    """
+    Defines unit tests for BoardRenderer and headless TicTacToeCli.
+    """
+    class Terminal(io.StringIO):
+        def isatty(self):
+            return True
+
+    def test_redraws_changed_squares_only(self):
+        terminal = self.Terminal()
+        renderer = BoardRenderer(terminal)
+        game = TicTacToeGame()
+        renderer.render(game.board)
+        self.assertIn("a\t_\t_\t_", terminal.getvalue())
+        game.make_move("X", 1, 2)
+        terminal.seek(0)
+        terminal.truncate()
+        renderer.render(game.board)
+        self.assertEqual("\x1b7\x1b[3;25HX\x1b8", terminal.getvalue())
+
+    def test_new_game_redraws_all(self):
+        terminal = self.Terminal()
+        renderer = BoardRenderer(terminal)
+        game = TicTacToeGame()
+        game.make_move("X", 0, 0)
+        renderer.render(game.board)
+        terminal.seek(0)
+        terminal.truncate()
+        renderer.render(TicTacToeGame().board)
+        self.assertIn("a\t_\t_\t_", terminal.getvalue())
+
+    def test_headless_prints_nothing(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cli = TicTacToeCli(headless=True)
+            cli.start_bot_game()
+            cli.play_bot_game("b 1")
+            cli.play_bot_game("z 9")
+        self.assertEqual("", output.getvalue())
+        self.assertEqual(2, bin(cli.game.marks[0] | cli.game.marks[1])
+                         .count("1"))
+
+
+class TestJournal(unittest.TestCase):
+    """
+    Defines unit tests for JournalWriter and JournalReader.
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_rebuilds_bot_game(self):
+        journal = JournalWriter(self.directory)
+        cli = TicTacToeCli(headless=True, journal=journal)
+        cli.start_bot_game()
+        cli.play_bot_game("b 1")
+        marks = list(cli.game.marks)
+        cli.play_bot_game("/q")
+        journal.close()
+        games = JournalReader(self.directory).games()
+        self.assertEqual(1, len(games))
+        self.assertEqual(marks, games[0].marks)
+        self.assertEqual(TicTacToeGame.S_X_QUIT, games[0].status)
+
+    def test_skips_server_move_not_on_board(self):
+        journal = JournalWriter(self.directory)
+        cli = TicTacToeCli(headless=True, journal=journal)
+        cli.start_server_game("X", 3, 3)
+        cli.apply_server_move("X", 0, 0)
+        cli.apply_server_move("O", 0, 0)
+        cli.apply_server_move("O", 1, 1)
+        cli.finish_server_game(TicTacToeGame.S_X_QUIT)
+        journal.close()
+        games = JournalReader(self.directory).games()
+        self.assertEqual(1, len(games))
+        self.assertEqual([1, 1 << 4], games[0].marks)
+
+    def test_frames_rotate_and_torn_tail(self):
+        journal = JournalWriter(self.directory, segment_size=64)
+        for idx in range(5):
+            journal.record_frame(JournalWriter.FRAME_IN, 0, b"x" * 50)
+            journal.write_pending()
+        journal.record_frame(JournalWriter.FRAME_OUT, ChatInterface.OP_QUIT,
+                             b"")
+        journal.close()
+        paths = segment_paths(self.directory)
+        self.assertEqual(6, len(paths))
+        with open(paths[-1], "ab") as segment:
+            segment.write(JournalWriter.RECORD.pack(0, 1, 100) + b"cut")
+        messages = list(JournalReader(self.directory).messages())
+        self.assertEqual(6, len(messages))
+        self.assertEqual((JournalWriter.FRAME_OUT, ChatInterface.OP_QUIT,
+                          b""), messages[-1][1:])
+
+    def test_close_writes_records_appended_during_write(self):
+        journal = JournalWriter(self.directory)
+        write_pending = journal.write_pending
+        writing = threading.Event()
+
+        def slow_write_pending():
+            write_pending()
+            writing.set()
+            time.sleep(0.1)
+        journal.write_pending = slow_write_pending
+        journal.record_frame(JournalWriter.FRAME_IN, 0, b"first")
+        journal.wakeup.set()
+        writing.wait(1)
+        journal.record_frame(JournalWriter.FRAME_OUT, 0, b"last")
+        journal.close()
+        messages = list(JournalReader(self.directory).messages())
+        self.assertEqual([b"first", b"last"],
+                         [message[-1] for message in messages])
+
+
+class TestBotPlayer(unittest.TestCase):
+    """
+    Defines unit tests for the alpha-beta BotPlayer.
+    """
+    def test_self_play_draws(self):
+        game = TicTacToeGame()
+        bots = BotPlayer("X", game), BotPlayer("O", game)
+        while game.status <= TicTacToeGame.S_O_TURN:
+            self.assertTrue(bots[game.status].take_turn())
+        self.assertEqual(TicTacToeGame.S_DRAW, game.status)
+
+    def test_blocks_row(self):
+        game = TicTacToeGame()
+        [game.make_move("XO"[idx % 2], *move)
+         for idx, move in enumerate([(0, 0), (1, 1), (0, 1)])]
+        self.assertEqual((0, 2), BotPlayer("O", game).choose_square())
+
+    def test_takes_win_on_large_board(self):
+        game = TicTacToeGame(15, 5)
+        [game.make_move("XO"[idx % 2], *move) for idx, move in
+         enumerate([(7, 3), (0, 0), (7, 4), (0, 5), (7, 5), (14, 0),
+                    (7, 6), (14, 14)])]
+        self.assertIn(BotPlayer("X", game, 0.2).choose_square(),
+                      [(7, 2), (7, 7)])
+
+    def test_table_capped(self):
+        game = TicTacToeGame(4, 4)
+        bot = BotPlayer("X", game, 0.2)
+        bot.search.table.clear()
+        with mock.patch.object(bot.search, "MAX_TABLE", 100):
+            self.assertIsNotNone(bot.choose_square())
+            self.assertLessEqual(len(bot.search.table), 100)
+
+
+class TestOutcomeTable(unittest.TestCase):
+    """
+    Defines unit tests for the precomputed OutcomeTable.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.temp_dir.name, "outcome_table.bin")
+        cls.count = OutcomeTable.build(path)
+        cls.table = OutcomeTable(path)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.table.entries.release()
+        cls.table.mapping.close()
+        cls.temp_dir.cleanup()
+
+    def test_reachable_positions(self):
+        self.assertEqual(5478, self.count)
+
+    def test_empty_board_is_draw(self):
+        self.assertEqual(OutcomeTable.DRAW, self.table.outcome(TicTacToeGame()))
+
+    def test_corner_opening_needs_centre(self):
+        game = TicTacToeGame()
+        game.make_move("X", 0, 0)
+        self.assertEqual([(1, 1)], self.table.best_moves(game))
+
+    def test_unreachable_position(self):
+        self.assertIsNone(self.table.lookup(0b111, 0))
+
+
+class TestGameRoomManager(unittest.TestCase):
+    """
+    Defines unit tests for server-side rooms and matchmaking.
+    """
+    def test_matches_same_board_only(self):
+        rooms = GameRoomManager()
+        self.assertIsNone(rooms.find_match("alice", (3, 3)))
+        self.assertIsNone(rooms.find_match("bob", (15, 5)))
+        room = rooms.find_match("carol", (3, 3))
+        self.assertEqual(("alice", "carol"), room.players)
+        self.assertEqual(1, len(rooms.queue))
+
+    def test_moves_validated_once(self):
+        rooms = GameRoomManager()
+        rooms.find_match("alice", (3, 3))
+        room = rooms.find_match("bob", (3, 3))
+        self.assertEqual(TicTacToeGame.V_WRONG_TURN,
+                         rooms.make_move("bob", 0, 0))
+        for player, row, col in [("alice", 0, 0), ("bob", 1, 0),
+                                 ("alice", 0, 1), ("bob", 1, 1),
+                                 ("alice", 0, 2)]:
+            self.assertEqual(TicTacToeGame.V_PASSED,
+                             rooms.make_move(player, row, col))
+        self.assertEqual(TicTacToeGame.S_X_WON, room.game.status)
+        self.assertEqual(0, len(rooms))
+
+    def test_quit_on_opponent_turn(self):
+        rooms = GameRoomManager()
+        rooms.find_match("alice", (3, 3))
+        rooms.find_match("bob", (3, 3))
+        room = rooms.quit("bob")
+        self.assertEqual(TicTacToeGame.S_O_QUIT, room.game.status)
+        self.assertIsNone(rooms.room_of("alice"))
+
+
+class TestAsyncChatServer(AsyncServerTestMixin,
+                          unittest.IsolatedAsyncioTestCase):
+    """
+    Defines unit tests for pairing clients on the async server.
+    """
+    async def asyncSetUp(self):
+        self.server = await self.start_server()
+
+    async def read_message(self, reader, message: str):
+        expected = ChatInterface.encode_frame(message)
+        self.assertEqual(expected, await reader.readexactly(len(expected)))
+
+    async def connect(self, role: str):
+        reader, writer = await self.open_client()
+        await self.read_message(reader, role)
+        return reader, writer
+
+    async def test_pairs_and_relays(self):
+        first_reader, first_writer = await self.connect("/pending")
+        reader, writer = await self.connect("/waiting")
+        await self.read_message(first_reader, "/chatting")
+        writer.write(ChatInterface.encode_frame("hello"))
+        await self.read_message(first_reader, "hello")
+        first_writer.write(ChatInterface.encode_frame("hi"))
+        await self.read_message(reader, "hi")
+
+        first_writer.close()
+        self.assertEqual(b"", await reader.read())     # Partner closed
+
+    async def test_early_frames_sent_once_paired(self):
+        _, first = await self.connect("/pending")
+        first.writelines([ChatInterface.encode_frame("early"),
+                          ChatInterface.encode_frame("frames")])
+        await first.drain()
+        await asyncio.sleep(0.05)
+        reader, _ = await self.connect("/waiting")
+        await self.read_message(reader, "early")
+        await self.read_message(reader, "frames")
+
+    async def test_drops_unpaired_client_past_early_limit(self):
+        reader, writer = await self.connect("/pending")
+        frame = ChatInterface.encode_frame("x" * 1024)
+        with contextlib.suppress(ConnectionError):
+            for _ in range(PeerSession.EARLY_LIMIT // 1024 + 1):
+                writer.write(frame)
+                await writer.drain()
+        self.assertEqual(b"", await reader.read())
+        await self.connect("/pending")              # Not paired with it
+
+    async def test_drops_client_with_oversized_frame(self):
+        for data in (encode_header(FrameReader.MAX_FRAME + 1),
+                     b"\x00" + b"1" * (1 << 17)):
+            reader, writer = await self.connect("/pending")
+            writer.write(data)
+            with contextlib.suppress(ConnectionError):
+                await writer.drain()
+                self.assertEqual(b"", await reader.read())
+            self.assertTrue(reader.at_eof() or reader.exception())
+
+
+class TestChatRooms(AsyncServerTestMixin, unittest.IsolatedAsyncioTestCase):
+    """
+    Defines unit tests for chat rooms on the async server.
+    """
+    async def asyncSetUp(self):
+        self.server = await self.start_server()
+
+    async def connect(self, room: str):
+        reader, writer = await self.open_client()
+        await read_frame_async(reader)              # Role from pairing
+        writer.write(ChatInterface.encode_frame(f"/join {room}"))
+        while (await read_frame_async(reader))[1][:7] != b"/joined":
+            pass
+        return reader, writer
+
+    async def test_fanout_once_to_room(self):
+        alice, bob, carol = [await self.connect("lobby") for _ in range(3)]
+        await self.connect("other")
+        alice[1].write(ChatInterface.encode_frame("hello"))
+        alice[1].write(ChatInterface.encode_frame("/leave"))
+        for reader, _ in (bob, carol):
+            payload = b"/"
+            while payload[:1] == b"/":              # Skip pairing roles
+                flags, payload = await read_frame_async(reader)
+            self.assertTrue(payload.startswith(b"[lobby] 127.0.0.1:"))
+            self.assertTrue(payload.endswith(b": hello"))
+        payload = b""
+        while payload != b"/left":
+            flags, payload = await read_frame_async(alice[0])
+        self.assertEqual(2, len(self.server.chat_rooms.rooms["lobby"].members))
+
+    def test_chat_text_drops_bad_compression(self):
+        compressed = FrameReader.COMPRESSED
+        self.assertEqual(b"hi", AsyncChatServer.chat_text(
+            compressed, zlib.compress(b"hi")))
+        self.assertIsNone(AsyncChatServer.chat_text(compressed, b"not zlib"))
+
+    def test_slow_consumer_policies(self):
+        for policy in ChatRoomManager.POLICIES:
+            rooms = ChatRoomManager(policy, queue_limit=100)
+            sender, fast, slow = FakeMember(), FakeMember(), FakeMember(101)
+            [rooms.join(member, "lobby") for member in (sender, fast, slow)]
+            self.assertEqual(1, rooms.publish(sender, b"hi"))
+            self.assertEqual([], slow.frames)
+            self.assertEqual(policy == ChatRoomManager.DISCONNECT,
+                             slow.closed)
+            self.assertEqual(policy == ChatRoomManager.DROP,
+                             rooms.room_of(slow) is not None)
+
+
+class TestWorkerPool(AsyncServerTestMixin, unittest.IsolatedAsyncioTestCase):
+    """
+    Defines unit tests for chat rooms, pairing and games spanning worker
+    processes.
+    """
+    async def test_room_spans_workers(self):
+        pool = WorkerPool(2, None)
+        workers = []
+        for _ in range(2):
+            pool_end, worker_end = socket.socketpair()
+            pool.channels.append(pool_end)
+            workers.append((ChatRoomManager(), WorkerRelay(worker_end)))
+        tasks = [asyncio.create_task(relay.run(rooms))
+                 for rooms, relay in workers]
+        tasks.append(asyncio.create_task(pool.relay()))
+        await asyncio.sleep(0.05)
+        sender, local, remote, elsewhere = [FakeMember() for _ in range(4)]
+        [workers[0][0].join(member, "lobby") for member in (sender, local)]
+        workers[1][0].join(remote, "lobby")
+        workers[1][0].join(elsewhere, "other")
+        self.assertEqual(1, workers[0][0].publish(sender, b"hi"))
+        for _ in range(100):
+            if remote.frames:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(local.frames, remote.frames)
+        self.assertEqual([], elsewhere.frames + sender.frames)
+        [task.cancel() for task in tasks]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        [channel.close() for channel in pool.channels]
+
+    def test_write_drops_for_stuck_workers(self):
+        pool = WorkerPool(3, None)
+        pool.writers = [mock.Mock(**{
+            "is_closing.return_value": closing,
+            "transport.get_write_buffer_size.return_value": queued})
+            for closing, queued in ((False, 0), (True, 0),
+                                    (False, WorkerPool.BUFFER_LIMIT + 1))]
+        for worker in range(4):
+            pool.write(worker, WorkerRelay.SEND, b"x")
+        pool.writers[0].writelines.assert_called_once()
+        pool.writers[1].writelines.assert_not_called()
+        pool.writers[2].writelines.assert_not_called()
+        self.assertEqual(3, pool.dropped)
+
+    async def start_workers(self) -> list[int]:
+        """
+        Run two servers as workers of one pool, each on its own port.
+        :return: port of each worker.
+        """
+        pool = WorkerPool(2, None)
+        ports, tasks = [], []
+        for worker in range(2):
+            pool_end, worker_end = socket.socketpair()
+            pool.channels.append(pool_end)
+            server = await self.start_server()
+            server.relay = WorkerRelay(worker_end, worker)
+            await server.relay.connect()
+            tasks.append(asyncio.create_task(server.relay.run(
+                server.chat_rooms, server.handle_pool_message)))
+            ports.append(self.port)
+        tasks.append(asyncio.create_task(pool.relay()))
+
+        async def stop():
+            [task.cancel() for task in tasks]
+            await asyncio.gather(*tasks, return_exceptions=True)
+            [channel.close() for channel in pool.channels]
+        self.addAsyncCleanup(stop)
+        return ports
+
+    async def connect(self, port: int, role: bytes):
+        reader, writer = await self.open_client(port)
+        self.assertEqual(role, (await read_frame_async(reader))[1])
+        return reader, writer
+
+    async def test_pairs_across_workers(self):
+        ports = await self.start_workers()
+        first_reader, first_writer = await self.connect(ports[0],
+                                                        b"/pending")
+        first_writer.write(ChatInterface.encode_frame("early"))
+        reader, writer = await self.connect(ports[1], b"/waiting")
+        self.assertEqual(b"/chatting",
+                         (await read_frame_async(first_reader))[1])
+        self.assertEqual(b"early", (await read_frame_async(reader))[1])
+        writer.write(ChatInterface.encode_frame("hello"))
+        self.assertEqual(b"hello", (await read_frame_async(first_reader))[1])
+
+        first_writer.close()
+        self.assertIsNone(await read_frame_async(reader))   # Partner closed
+
+    async def test_game_across_workers(self):
+        ports = await self.start_workers()
+        host_reader, host = await self.connect(ports[0], b"/pending")
+        reader, writer = await self.connect(ports[1], b"/waiting")
+        self.assertEqual(b"/chatting",
+                         (await read_frame_async(host_reader))[1])
+        host.write(ChatInterface.encode_frame("/play"))
+        self.assertEqual(b"/queued", (await read_frame_async(host_reader))[1])
+        writer.write(ChatInterface.encode_frame("/play"))
+        for player, symbol in ((host_reader, b"X"), (reader, b"O")):
+            self.assertEqual(b"/matched " + symbol + b" 3 3",
+                             (await read_frame_async(player))[1])
+
+        # O plays from the other worker, through the pool
+        for sender, message, result in (
+                (host, "/move 0 0", b"/moved X 0 0"),
+                (writer, "/move 1 1", b"/moved O 1 1"),
+                (writer, "/q", f"/ended {TicTacToeGame.S_O_QUIT}".encode())):
+            sender.write(ChatInterface.encode_frame(message))
+            for player in (host_reader, reader):
+                self.assertEqual(result, (await read_frame_async(player))[1])
+
+        # No longer in the game, so free to queue again
+        writer.write(ChatInterface.encode_frame("/play"))
+        self.assertEqual(b"/queued", (await read_frame_async(reader))[1])
+
+
+class TestLoadGenerator(AsyncServerTestMixin,
+                        unittest.IsolatedAsyncioTestCase):
+    """
+    Defines unit tests for virtual users driven against the async server.
+    """
+    async def test_scripted_users(self):
+        await self.start_server()
+        generator = LoadGenerator("localhost", self.port, 7, duration=0.5,
+                                  mix=LoadGenerator.parse_mix("game=3,chat"),
+                                  sizes=[1, 100], seed=372)
+        report = await generator.run()
+        self.assertEqual(7, report.users)
+        self.assertEqual(0, sum(report.errors.values()))
+        self.assertGreater(report.games, 0)
+        self.assertEqual({"chat", "game", "confirm", "move"},
+                         set(report.latency))
+        replies = sum(histogram.count for histogram
+                      in report.latency.values())
+        self.assertLessEqual(report.sent - 6, replies)  # Cut off at the end
+        self.assertLessEqual(replies, report.sent)
+
+    def test_parse_mix(self):
+        self.assertEqual({"chat": 2.0, "game": 1.0},
+                         LoadGenerator.parse_mix("chat=2,game"))
+        self.assertRaises(ValueError, LoadGenerator.parse_mix, "chess=1")
+        self.assertRaises(ValueError, LoadGenerator.parse_mix, "chat=0")
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Defines unit tests for TimerWheel.
+    """
+    def test_fires_on_time_across_wheels(self):
+        wheel = TimerWheel(tick=1, now=0)
+        fired = []
+        delays = [1, 63, 64, 65, 4095, 4096, 300_000]
+        timers = [wheel.schedule(delay, fired.append, delay)
+                  for delay in delays]
+        wheel.cancel(timers[2])
+        wheel.cancel(timers[2])
+        self.assertEqual(len(delays) - 1, len(wheel))
+        for delay in delays:
+            wheel.advance(delay - 1)
+            self.assertNotIn(delay, fired)
+            wheel.advance(delay)
+            self.assertEqual(delay != 64, delay in fired)
+        self.assertEqual(0, len(wheel))
+        self.assertFalse(any(timer.is_active() for timer in timers))
+
+    def test_rounds_delay_up_to_ticks(self):
+        wheel = TimerWheel(tick=0.1, now=0)
+        fired = []
+        wheel.schedule(0.25, fired.append, "late")
+        wheel.schedule(0, fired.append, "next")
+        self.assertEqual(1, wheel.advance(0.2))
+        self.assertEqual(["next"], fired)
+        self.assertEqual(1, wheel.advance(0.35))
+
+
+class TestHeartbeats(AsyncServerTestMixin, unittest.IsolatedAsyncioTestCase):
+    """
+    Defines unit tests for heartbeats and timeouts.
+    """
+    def test_client_gives_up_on_silent_peer(self):
+        client_socket, peer_socket = socket.socketpair()
+        with client_socket, peer_socket:
+            chatter = ChatInterface(client_socket, True,
+                                    heartbeat_interval=0.02,
+                                    idle_timeout=0.1)
+            peer = ChatInterface(peer_socket)
+            peer.send_heartbeat()
+            peer.send_outgoing_data("hello")
+            self.assertEqual("hello", chatter.read_incoming_data())
+            self.assertEqual(b"/pong", peer.reader.read_frame())
+            chatter.receive_and_handle_message()
+            self.assertEqual(ChatInterface.TERMINATE, chatter.state)
+            self.assertEqual(b"/ping", peer.reader.read_frame())
+
+    def test_silent_peer_loses_game(self):
+        client_socket, peer_socket = socket.socketpair()
+        with client_socket, peer_socket:
+            chatter = ChatInterface(client_socket, True,
+                                    heartbeat_interval=0.02,
+                                    idle_timeout=0.1)
+            peer = ChatInterface(peer_socket)
+            peer.handle_user_line("/tic")
+            chatter.receive_and_handle_message()
+            chatter.handle_user_line("/tac")
+            self.assertTrue(chatter.cli.game_confirmed)
+            opponent = chatter.cli.opponent.SYMBOL
+            with mock.patch.object(chatter.cli, "end_game") as end_game:
+                chatter.receive_and_handle_message()
+            self.assertEqual(ChatInterface.TERMINATE, chatter.state)
+            end_game.assert_called_once_with(opponent)
+
+    def test_heartbeats_while_user_types(self):
+        client_socket, peer_socket = socket.socketpair()
+        with client_socket, peer_socket:
+            chatter = ChatInterface(client_socket, heartbeat_interval=0.02)
+            peer = ChatInterface(peer_socket, True)
+
+            def slow_input(prompt=""):
+                time.sleep(0.1)                     # Not a terminal here
+                return "hi"
+            with mock.patch("builtins.input", slow_input):
+                self.assertEqual("hi", chatter.read_user_line())
+            self.assertEqual(b"/ping", peer.reader.read_frame())
+
+    async def start_server(self, **timeouts) -> AsyncChatServer:
+        server = await super().start_server(**timeouts)
+        server.timers = TimerWheel(tick=0.01)
+        ticker = asyncio.create_task(server.run_timers())
+        self.addCleanup(ticker.cancel)
+        return server
+
+    async def test_server_reaps_idle_clients(self):
+        server = await self.start_server(heartbeat_interval=0.05,
+                                         idle_timeout=0.2)
+        reader, _ = await self.open_client()
+        frames = []
+        while (frame := await read_frame_async(reader)) is not None:
+            frames.append(frame[1])
+        self.assertEqual(b"/pending", frames[0])
+        self.assertIn(b"/ping", frames)
+        self.assertEqual(1, server.reaped)
+        self.assertEqual(0, len(server.timers))
+
+    async def test_move_timeout_ends_game(self):
+        server = await self.start_server(move_timeout=0.05)
+        players = [await self.open_client() for _ in range(2)]
+        for _, writer in players:
+            writer.write(ChatInterface.encode_frame("/play"))
+        for reader, _ in players:
+            payload = b""
+            while not payload.startswith(b"/ended"):
+                payload = (await read_frame_async(reader))[1]
+            self.assertEqual(f"/ended {TicTacToeGame.S_X_QUIT}".encode(),
+                             payload)
+            reader.feed_eof()
+        [writer.close() for _, writer in players]
+        self.assertEqual(1, server.timed_out)
+        self.assertEqual(0, len(server.rooms))
+
+
+class TestSessionResume(AsyncServerTestMixin,
+                        unittest.IsolatedAsyncioTestCase):
+    """
+    Defines unit tests for resumable sessions.
+    """
+    def test_replay_buffer(self):
+        replay = ReplayBuffer(max_frames=3, max_bytes=10)
+        [replay.append(bytes([idx])) for idx in range(1, 6)]
+        self.assertEqual([], replay.since(5))
+        self.assertEqual([b"\4", b"\5"], replay.since(3))
+        self.assertIsNone(replay.since(1))
+        self.assertIsNone(replay.since(6))
+        replay.append(bytes(10))
+        self.assertEqual(1, len(replay))
+
+    def test_game_snapshot(self):
+        game = TicTacToeGame(5, 4)
+        [game.make_move(symbol, row, col) for symbol, row, col
+         in (("X", 0, 0), ("O", 4, 4), ("X", 2, 3))]
+        snapshot = game.snapshot()
+        self.assertEqual(3 + 2 * 4, len(snapshot))
+        restored = TicTacToeGame.from_snapshot(snapshot)
+        self.assertEqual(game.board, restored.board)
+        self.assertEqual(TicTacToeGame.S_O_TURN, restored.status)
+
+    async def test_resume_replays_missed_frames(self):
+        server = await self.start_server(resume_window=5)
+        port = self.port
+
+        chatter = ChatInterface(
+            socket.create_connection(("localhost", port)), metrics=False,
+            headless=True, heartbeat_interval=0,
+            reconnect=lambda: socket.create_connection(("localhost", port)))
+        chatter.RECONNECT_DELAY = 0.01
+        self.addCleanup(lambda: chatter.conn_socket.close())
+        role = asyncio.create_task(asyncio.to_thread(chatter.await_role))
+        await asyncio.sleep(0.05)
+        reader, writer = await self.open_client()
+        await read_frame_async(reader)
+        writer.write(ChatInterface.encode_frame("/nosession"))
+        await role
+        self.assertEqual(ChatInterface.CHATTING, chatter.state)
+
+        async def receive(command: str) -> str:
+            message = await asyncio.to_thread(chatter.read_incoming_data)
+            self.assertTrue(message.startswith(command), message)
+            chatter.parse_for_command(message, False)
+            return message
+
+        chatter.send_outgoing_data("/play")
+        await asyncio.sleep(0.05)
+        await receive("/queued")
+        writer.write(ChatInterface.encode_frame("/play"))
+        await receive("/matched X")
+        chatter.send_outgoing_data("/move 0 0")
+        await receive("/moved X")
+
+        # Reset the connection, then move and chat while it is down
+        kept = server.resumable[chatter.session_token]
+        chatter.conn_socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                       struct.pack("ii", 1, 0))
+        chatter.conn_socket.close()
+        while kept.expiry is None:
+            await asyncio.sleep(0.01)
+        writer.write(ChatInterface.encode_frame("/move 1 1"))
+        writer.write(ChatInterface.encode_frame("hello"))
+        while kept.replay.sequence < 7:
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(await asyncio.to_thread(chatter.try_resume))
+        await receive("/moved O 1 1")
+        self.assertEqual("hello", await receive("hello"))
+        await receive("/snapshot X")
+        self.assertEqual(server.rooms.room_of(kept).game.marks,
+                         chatter.cli.game.marks)
+        self.assertEqual(8, chatter.frames_received)
+        self.assertEqual(2, kept.received)
+        self.assertEqual(1, server.resumed)
+        chatter.conn_socket.close()
+        writer.close()
+        while server.sessions:
+            await asyncio.sleep(0.01)
+
+    async def test_first_frame_across_offer_timeout(self):
+        server = await self.start_server(resume_window=5)
+        server.OFFER_TIMEOUT = 0.05
+        reader, writer = await self.open_client()
+        await read_frame_async(reader)
+        frame = ChatInterface.encode_frame("/play")
+        writer.write(frame[:1])
+        await asyncio.sleep(0.1)
+        writer.write(frame[1:])
+        self.assertEqual(b"/pending", (await read_frame_async(reader))[1])
+        self.assertEqual(b"/queued", (await read_frame_async(reader))[1])
+        writer.close()
+        while server.sessions:
+            await asyncio.sleep(0.01)
+
+    async def test_unknown_token_expires(self):
+        server = await self.start_server(resume_window=5)
+        reader, writer = await self.open_client()
+        await read_frame_async(reader)
+        writer.write(ChatInterface.encode_frame("/resume unknown 0"))
+        self.assertEqual(b"/expired", (await read_frame_async(reader))[1])
+        self.assertIsNone(await read_frame_async(reader))
+        writer.close()
+        self.assertIsNone(server.waiting)
+
+
+@unittest.skipIf(BatchSimulator is None, "requires numpy")
+class TestBatchSimulator(unittest.TestCase):
+    """
+    Defines unit tests checking BatchSimulator against TicTacToeGame.
+    """
+    def test_matches_scalar_engine(self):
+        simulator = BatchSimulator(500, seed=372)
+        games = [TicTacToeGame() for _ in range(500)]
+        while simulator.active().any():
+            cells = simulator.random_moves()
+            simulator.make_moves(cells)
+            for game, cell in zip(games, cells):
+                game.status <= TicTacToeGame.S_O_TURN and game.make_move(
+                    game.SYMBOLS[game.status], *divmod(int(cell), 3))
+        self.assertEqual([game.status for game in games],
+                         simulator.status.tolist())
+
+    def test_validation_codes(self):
+        simulator = BatchSimulator(3)
+        simulator.make_moves([4, 4, 4])
+        result = simulator.make_moves([4, 9, 0]).tolist()
+        expected = [TicTacToeGame.V_SPACE_OCC, TicTacToeGame.V_OUT_RANGE,
+                    TicTacToeGame.V_PASSED]
+        self.assertEqual(expected, result)
+
 
 if __name__ == '__main__':
     unittest.main()